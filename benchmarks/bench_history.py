@@ -0,0 +1,289 @@
+"""Benchmark the history manager, the history sensors and startup on synthetic installs.
+
+Each run builds an install of N medications with 1–3 dose times and ``--days``
+of events (mostly taken, some skipped or snoozed) through
+``HistoryManager.record_many``, then measures:
+
+- ``record_us``: latency of a single ``HistoryManager.record`` call
+- ``counts_between_qps``: 7-day ``async_counts_between`` queries per second
+- ``stats_build_ms``: a statistics coordinator refresh covering every medication,
+  plus building the state and attributes of their adherence and stats sensors
+- ``report_ms``: a ``get_adherence_report`` over every medication and all generated days
+  (at most ``REPORT_MAX_DAYS``), with weekly trend windows
+- ``load_s`` / ``file_bytes``: ``async_load`` time of a fresh manager and the size
+  of the stored history
+- ``first_query_s``: one adherence query per medication right after the load, which
+  includes decoding each medication's data on first use
+
+Results are printed as JSON (or written with ``--output``) together with the
+commit they were taken at; ``--compare`` prints the change against an earlier
+result file. A real ``HomeAssistant`` core is used in a temporary config
+directory, nothing is mocked.
+
+Run from the repository root with Home Assistant installed:
+
+    python benchmarks/bench_history.py --meds 10,100 --output before.json
+    python benchmarks/bench_history.py --meds 10,100 --compare before.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from homeassistant.const import __version__ as HA_VERSION  # noqa: E402
+from homeassistant.core import HomeAssistant  # noqa: E402
+from homeassistant.helpers import entity_registry as er  # noqa: E402
+from homeassistant.helpers.storage import STORAGE_DIR  # noqa: E402
+from homeassistant.util import dt as dt_util  # noqa: E402
+
+from custom_components.medication_reminder.const import (  # noqa: E402
+    BACKEND_JSON,
+    BACKEND_SQLITE,
+    HISTORY_BACKENDS,
+    HISTORY_DB_FILE,
+    HISTORY_STORE_KEY,
+    REPORT_MAX_DAYS,
+    STATE_SKIPPED,
+    STATE_SNOOZED,
+    STATE_TAKEN,
+)
+from custom_components.medication_reminder.coordinator import MedicationCoordinator  # noqa: E402
+from custom_components.medication_reminder.history import HistoryManager  # noqa: E402
+from custom_components.medication_reminder.report import async_adherence_report  # noqa: E402
+from custom_components.medication_reminder.sensor import (  # noqa: E402
+    MedicationAdherenceSensor,
+    MedicationStatsSensor,
+)
+
+STATUSES = [STATE_TAKEN] * 8 + [STATE_SKIPPED, STATE_SNOOZED]
+RECORD_CALLS = 500
+COUNT_QUERIES = 5000
+LOAD_RUNS = 3
+
+
+def _install(count: int, seed: int) -> Dict[str, List[str]]:
+    """Medication entity_id -> dose times, 1–3 per day."""
+    rnd = random.Random(seed)
+    meds = {}
+    for i in range(count):
+        hours = sorted(rnd.sample(range(6, 23), rnd.randint(1, 3)))
+        meds[f"sensor.medication_{i}"] = [f"{h:02d}:00" for h in hours]
+    return meds
+
+
+async def _populate(manager: HistoryManager, meds: Dict[str, List[str]], days: int, seed: int) -> int:
+    rnd = random.Random(seed)
+    for eid, times in meds.items():
+        # Keep everything generated; the default retention would prune it
+        manager.set_retention(eid, days + 1, days * len(times) + 1)
+        manager.set_schedule(eid, len(times))
+    start = dt_util.start_of_local_day() - timedelta(days=days)
+    total = 0
+    for day in range(days):
+        base = start + timedelta(days=day)
+        records = []
+        for eid, times in meds.items():
+            for t in times:
+                ts = base + timedelta(hours=int(t[:2]), seconds=rnd.randint(0, 1800))
+                records.append((eid, rnd.choice(STATUSES), dt_util.as_utc(ts).isoformat()))
+        await manager.record_many(records)
+        total += len(records)
+    return total
+
+
+def _file_bytes(config_dir: str, backend: str) -> int:
+    storage = os.path.join(config_dir, STORAGE_DIR)
+    names = [HISTORY_DB_FILE, f"{HISTORY_DB_FILE}-wal"] if backend == BACKEND_SQLITE else [HISTORY_STORE_KEY]
+    return sum(os.path.getsize(os.path.join(storage, n)) for n in names if os.path.exists(os.path.join(storage, n)))
+
+
+async def _bench_record(manager: HistoryManager, meds: Dict[str, List[str]]) -> Dict[str, float]:
+    eids = list(meds)
+    samples = []
+    for i in range(RECORD_CALLS):
+        ts = dt_util.utcnow().isoformat()
+        start = time.perf_counter()
+        await manager.record(eids[i % len(eids)], STATE_TAKEN, ts)
+        samples.append((time.perf_counter() - start) * 1e6)
+    pct = statistics.quantiles(samples, n=20)
+    return {"mean": round(statistics.fmean(samples), 1), "p50": round(pct[9], 1), "p95": round(pct[18], 1)}
+
+
+async def _bench_counts(manager: HistoryManager, meds: Dict[str, List[str]], days: int, seed: int) -> float:
+    rnd = random.Random(seed)
+    eids = list(meds)
+    now = dt_util.utcnow()
+    windows = []
+    for _ in range(COUNT_QUERIES):
+        end = now - timedelta(days=rnd.uniform(0, max(0, days - 7)))
+        windows.append((rnd.choice(eids), end - timedelta(days=7), end))
+    start = time.perf_counter()
+    for eid, first, last in windows:
+        await manager.async_counts_between(eid, first, last)
+    return round(COUNT_QUERIES / (time.perf_counter() - start))
+
+
+async def _bench_stats(hass: HomeAssistant, manager: HistoryManager, meds: Dict[str, List[str]]) -> float:
+    coordinator = MedicationCoordinator(hass, manager)
+    sensors = []
+    for eid, times in meds.items():
+        slug = eid.split(".", 1)[1]
+        coordinator.async_set_medication(eid, times)
+        sensors.append(MedicationAdherenceSensor(hass, slug, coordinator, eid, slug))
+        sensors.append(MedicationStatsSensor(hass, slug, coordinator, eid, slug))
+    start = time.perf_counter()
+    await coordinator.async_refresh()
+    for sensor in sensors:
+        sensor.native_value
+        sensor.extra_state_attributes
+    elapsed = time.perf_counter() - start
+    await coordinator.async_shutdown()
+    return round(elapsed * 1000, 2)
+
+
+async def _bench_report(manager: HistoryManager, meds: Dict[str, List[str]], days: int) -> float:
+    start = time.perf_counter()
+    await async_adherence_report(manager, list(meds), min(days, REPORT_MAX_DAYS), 7)
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+async def _bench_load(hass: HomeAssistant, backend: str, meds: Dict[str, List[str]]) -> Dict[str, Any]:
+    samples, first = [], []
+    since = dt_util.utcnow() - timedelta(days=7)
+    for _ in range(LOAD_RUNS):
+        manager = HistoryManager(hass, backend=backend)
+        start = time.perf_counter()
+        await manager.async_load()
+        samples.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        for eid in meds:
+            await manager.async_counts_since(eid, since)
+        first.append(time.perf_counter() - start)
+        await manager.async_unload()
+    return {
+        "load_s": {"min": round(min(samples), 3), "mean": round(statistics.fmean(samples), 3)},
+        "first_query_s": round(min(first), 3),
+    }
+
+
+async def run_one(count: int, days: int, backend: str, seed: int) -> Dict[str, Any]:
+    config_dir = tempfile.mkdtemp()
+    hass = HomeAssistant(config_dir)
+    # Sensors look up their entity_id in the registry
+    await er.async_load(hass)
+    meds = _install(count, seed)
+    manager = HistoryManager(hass, backend=backend)
+    await manager.async_load()
+
+    start = time.perf_counter()
+    events = await _populate(manager, meds, days, seed)
+    populate_s = time.perf_counter() - start
+    await manager.async_flush()
+
+    result: Dict[str, Any] = {
+        "meds": count,
+        "days": days,
+        "backend": backend,
+        "events": events,
+        "populate_s": round(populate_s, 2),
+        "record_us": await _bench_record(manager, meds),
+        "counts_between_qps": await _bench_counts(manager, meds, days, seed),
+        "stats_build_ms": await _bench_stats(hass, manager, meds),
+        "report_ms": await _bench_report(manager, meds, days),
+    }
+    await manager.async_unload()
+    result["file_bytes"] = _file_bytes(config_dir, backend)
+    result.update(await _bench_load(hass, backend, meds))
+    await hass.async_stop(force=True)
+    return result
+
+
+def _commit() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def _key(result: Dict[str, Any]) -> tuple:
+    return result["meds"], result["days"], result["backend"]
+
+
+def _compare(old: Dict[str, Any], new: Dict[str, Any]) -> None:
+    """Print new/old ratios for the runs both files contain."""
+    previous = {_key(r): r for r in old.get("results", [])}
+    metrics = (
+        ("record_us", lambda r: r["record_us"]["p50"]),
+        ("counts_between_qps", lambda r: r["counts_between_qps"]),
+        ("stats_build_ms", lambda r: r["stats_build_ms"]),
+        ("report_ms", lambda r: r.get("report_ms")),
+        ("load_s", lambda r: r["load_s"]["min"]),
+        ("file_bytes", lambda r: r["file_bytes"]),
+    )
+    print(f"{old.get('commit')} -> {new.get('commit')}", file=sys.stderr)
+    for result in new["results"]:
+        before = previous.get(_key(result))
+        if before is None:
+            continue
+        parts = []
+        for name, get in metrics:
+            a, b = get(before), get(result)
+            parts.append(f"{name} {a} -> {b} ({b / a:.2f}x)" if a else f"{name} {a} -> {b}")
+        print(f"{result['meds']:>5} meds {result['backend']}: " + ", ".join(parts), file=sys.stderr)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--meds", default="10,100,1000", help="comma-separated medication counts")
+    parser.add_argument("--days", type=int, default=730, help="days of generated history")
+    parser.add_argument("--backend", default=BACKEND_JSON, help=f"one of {', '.join(HISTORY_BACKENDS)}, or 'all'")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the results to this file instead of stdout")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    args = parser.parse_args()
+
+    backends = HISTORY_BACKENDS if args.backend == "all" else [args.backend]
+    results = []
+    for backend in backends:
+        for count in (int(c) for c in args.meds.split(",")):
+            print(f"{count} medications, {args.days} days, {backend} ...", file=sys.stderr)
+            results.append(await run_one(count, args.days, backend, args.seed))
+
+    report = {
+        "commit": _commit(),
+        "created": dt_util.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "homeassistant": HA_VERSION,
+        "results": results,
+    }
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            _compare(json.load(fh), report)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,80 @@
+"""Compare a statistics refresh notifying every coordinator listener with the per-medication listeners.
+
+Every medication owns three sensors listening to the statistics coordinator.
+A plain ``DataUpdateCoordinator`` calls all 3×N listeners on each refresh,
+which then filter on ``coordinator.updated``; ``MedicationCoordinator`` calls
+only the listeners registered under the medications the refresh changed.
+
+Run from the repository root with Home Assistant installed:
+
+    python benchmarks/bench_signals.py
+"""
+from __future__ import annotations
+
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from homeassistant.core import HomeAssistant, callback  # noqa: E402
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator  # noqa: E402
+
+from custom_components.medication_reminder.coordinator import MedicationCoordinator  # noqa: E402
+from custom_components.medication_reminder.history import HistoryManager  # noqa: E402
+
+SENSORS_PER_MED = 3
+MED_COUNTS = (10, 100, 1000)
+UPDATES = 2000
+
+
+def _connect(coordinator: MedicationCoordinator, entity_ids: list[str], woken: list[int], keyed: bool) -> None:
+    for eid in entity_ids:
+        for _ in range(SENSORS_PER_MED):
+            @callback
+            def _updated(eid: str = eid) -> None:
+                woken[0] += 1
+                # The filter every sensor ran when all listeners were called
+                if not keyed and eid not in coordinator.updated:
+                    return
+
+            coordinator.async_add_listener(_updated, eid if keyed else None)
+
+
+def _run(hass: HomeAssistant, entity_ids: list[str], keyed: bool) -> tuple[float, int]:
+    coordinator = MedicationCoordinator(hass, HistoryManager(hass))
+    if keyed:
+        notify = coordinator.async_update_listeners
+    else:
+        def notify() -> None:
+            # The base class calls every listener, whatever its context
+            DataUpdateCoordinator.async_update_listeners(coordinator)
+
+    woken = [0]
+    _connect(coordinator, entity_ids, woken, keyed)
+    start = time.perf_counter()
+    for i in range(UPDATES):
+        coordinator.updated = {entity_ids[i % len(entity_ids)]}
+        notify()
+    elapsed = time.perf_counter() - start
+    return elapsed / UPDATES * 1e6, woken[0] // UPDATES
+
+
+async def main() -> None:
+    print(f"{'meds':>6} {'all µs':>10} {'woken':>6} {'keyed µs':>10} {'woken':>6}")
+    for count in MED_COUNTS:
+        entity_ids = [f"sensor.medication_{i}" for i in range(count)]
+        results = []
+        for keyed in (False, True):
+            hass = HomeAssistant(tempfile.mkdtemp())
+            results.append(_run(hass, entity_ids, keyed))
+            await hass.async_stop(force=True)
+        (a_us, a_woken), (k_us, k_woken) = results
+        print(f"{count:>6} {a_us:>10.2f} {a_woken:>6} {k_us:>10.2f} {k_woken:>6}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
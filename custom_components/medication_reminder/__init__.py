@@ -2,88 +2,191 @@
 from __future__ import annotations
 
 import logging
+import time
+from functools import partial
+
+import voluptuous as vol
 
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant, ServiceCall
+from homeassistant.core import HomeAssistant, ServiceCall, ServiceResponse, SupportsResponse
 from homeassistant.exceptions import HomeAssistantError
 from homeassistant.helpers.service import async_extract_entity_ids
+from homeassistant.helpers.typing import ConfigType
 from homeassistant.config_entries import ConfigEntryState
 
 from .const import (
     DOMAIN,
     STATE_TAKEN,
     STATE_SKIPPED,
+    STATE_SNOOZED,
     DEFAULT_SNOOZE_MINUTES,
+    MIN_SNOOZE_MINUTES,
+    MAX_SNOOZE_MINUTES,
+    CONF_HISTORY,
+    CONF_SAVE_DELAY,
+    CONF_BACKEND,
+    BACKEND_JSON,
+    HISTORY_BACKENDS,
+    DEFAULT_SAVE_DELAY,
+    MAX_SAVE_DELAY,
+    STATS_PERIODS,
+    DEFAULT_RECENT_EVENTS,
+    MAX_RECENT_EVENTS,
+    CONF_LIST_NAME,
+    CONF_MEDICATIONS,
+    DEFAULT_LIST_NAME,
+    IMPORT_FORMATS,
+    REPORT_DEFAULT_DAYS,
+    REPORT_DEFAULT_TREND_DAYS,
+    REPORT_MAX_DAYS,
 )
+from .coordinator import MedicationCoordinator
 from .history import HistoryManager
+from .history_io import async_export_history, async_import_history, parse_time, resolve_path, transfer_format
+from .importer import async_import_medications, load_medications, validate_medications
+from .report import async_adherence_report
+from .scheduler import DoseScheduler
+from .sensor import async_send_group_reminder
+from . import websocket_api
 from homeassistant.util import dt as dt_util
 
 _LOGGER = logging.getLogger(__name__)
 
+HISTORY_SCHEMA = vol.Schema(
+    {
+        vol.Optional(CONF_SAVE_DELAY, default=DEFAULT_SAVE_DELAY): vol.All(
+            vol.Coerce(int), vol.Range(min=0, max=MAX_SAVE_DELAY)
+        ),
+        vol.Optional(CONF_BACKEND, default=BACKEND_JSON): vol.In(HISTORY_BACKENDS),
+    }
+)
+
+CONFIG_SCHEMA = vol.Schema(
+    {DOMAIN: vol.Schema({vol.Optional(CONF_HISTORY, default={}): HISTORY_SCHEMA})},
+    extra=vol.ALLOW_EXTRA,
+)
+
+
+async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
+    """Store installation-wide options from the optional YAML block."""
+    store = hass.data.setdefault(DOMAIN, {})
+    store["config"] = HISTORY_SCHEMA(config.get(DOMAIN, {}).get(CONF_HISTORY, {}))
+    websocket_api.async_setup(hass)
+
+    # Bulk import creates list entries, so it stays registered without any entry loaded
+    async def import_medications(call: ServiceCall) -> ServiceResponse:
+        fmt = call.data.get("format", "yaml")
+        if fmt not in IMPORT_FORMATS:
+            raise HomeAssistantError(f"format must be one of {', '.join(IMPORT_FORMATS)}")
+        try:
+            if call.data.get(CONF_MEDICATIONS) is not None:
+                medications = call.data[CONF_MEDICATIONS]
+                if not isinstance(medications, list):
+                    raise vol.Invalid("medications must be a list")
+                medications = validate_medications(medications)
+            elif call.data.get("data"):
+                medications = await hass.async_add_executor_job(load_medications, str(call.data["data"]), fmt)
+            else:
+                raise HomeAssistantError("Provide medications or data")
+        except vol.Invalid as err:
+            raise HomeAssistantError(str(err)) from err
+        list_name = str(call.data.get(CONF_LIST_NAME) or DEFAULT_LIST_NAME).strip() or DEFAULT_LIST_NAME
+        result = await async_import_medications(hass, medications, list_name, bool(call.data.get("replace", False)))
+        _LOGGER.debug(
+            "%s: imported into %s: %d added, %d updated, %d removed, %d skipped", DOMAIN, list_name,
+            len(result["added"]), len(result["updated"]), len(result["removed"]), len(result["skipped"]),
+        )
+        return result
+
+    hass.services.async_register(
+        DOMAIN, "import_medications", import_medications, supports_response=SupportsResponse.OPTIONAL
+    )
+    return True
+
+
+def _snooze_minutes(raw, entity) -> int:
+    """Resolve requested snooze minutes (or the entity default) within bounds."""
+    try:
+        minutes = int(raw) if raw is not None else int(entity.snooze_minutes)
+    except (TypeError, ValueError):
+        minutes = DEFAULT_SNOOZE_MINUTES
+    return min(MAX_SNOOZE_MINUTES, max(MIN_SNOOZE_MINUTES, minutes))
+
+
+async def _async_mark_entities(hass: HomeAssistant, entity_ids, status: str, minutes=None) -> None:
+    """Apply Taken/Skipped/Snoozed to several medications and record them as one batch.
+
+    All targets are resolved first so an unknown entity fails the call before
+    anything changes. The history is persisted and announced once, before the
+    entities are marked, so a refill alert raised by a Taken dose sees that
+    dose in the consumption rate.
+    """
+    registry = hass.data[DOMAIN]["entities"]
+    entities = []
+    for eid in entity_ids:
+        entity = registry.get(eid)
+        if not entity:
+            raise HomeAssistantError(f"Medication entity not found: {eid}")
+        entities.append(entity)
+    timestamp = dt_util.now().isoformat()
+    history: HistoryManager = hass.data[DOMAIN]["history"]
+    await history.record_many((entity.entity_id, status, timestamp) for entity in entities)
+    for entity in entities:
+        if status == STATE_SNOOZED:
+            await entity.async_snooze(_snooze_minutes(minutes, entity))
+        else:
+            await entity.async_mark(status)
+
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up Medication Reminder from a config entry."""
+    start = time.monotonic()
     # Ensure domain data is initialized
     store = hass.data.setdefault(DOMAIN, {})
     store.setdefault("entities", {})
     if "history" not in store:
-        history = HistoryManager(hass)
-        await history.async_load()
+        options = store.get("config") or HISTORY_SCHEMA({})
+        history = HistoryManager(hass, save_delay=options[CONF_SAVE_DELAY], backend=options[CONF_BACKEND])
+        # Loaded in the background: entities are set up meanwhile and their
+        # history queries wait for it
+        history.async_start_load()
         store["history"] = history
+    if "scheduler" not in store:
+        store["scheduler"] = DoseScheduler(hass, group_action=partial(async_send_group_reminder, hass))
+    if "coordinator" not in store:
+        store["coordinator"] = MedicationCoordinator(hass, store["history"])
 
     await hass.config_entries.async_forward_entry_setups(entry, ["sensor"])
-    _LOGGER.debug("%s: sensor platform forwarded for entry %s", DOMAIN, entry.entry_id)
+    _LOGGER.debug(
+        "%s: sensor platform forwarded for entry %s in %.3f s", DOMAIN, entry.entry_id, time.monotonic() - start
+    )
 
     # Register domain services once
     if not store.get("services_registered"):
         async def mark_taken(call: ServiceCall):
-            entity_ids = async_extract_entity_ids(hass, call)
+            entity_ids = await async_extract_entity_ids(hass, call)
             if not entity_ids:
                 raise HomeAssistantError("No entity_id or target provided")
-            for eid in entity_ids:
-                entity = hass.data[DOMAIN]["entities"].get(eid)
-                if not entity:
-                    raise HomeAssistantError(f"Medication entity not found: {eid}")
-                await entity.async_mark(STATE_TAKEN)
-                await hass.data[DOMAIN]["history"].record(eid, STATE_TAKEN, dt_util.now().isoformat())
+            await _async_mark_entities(hass, entity_ids, STATE_TAKEN)
 
         async def mark_skipped(call: ServiceCall):
-            entity_ids = async_extract_entity_ids(hass, call)
+            entity_ids = await async_extract_entity_ids(hass, call)
             if not entity_ids:
                 raise HomeAssistantError("No entity_id or target provided")
-            for eid in entity_ids:
-                entity = hass.data[DOMAIN]["entities"].get(eid)
-                if not entity:
-                    raise HomeAssistantError(f"Medication entity not found: {eid}")
-                await entity.async_mark(STATE_SKIPPED)
-                await hass.data[DOMAIN]["history"].record(eid, STATE_SKIPPED, dt_util.now().isoformat())
+            await _async_mark_entities(hass, entity_ids, STATE_SKIPPED)
 
         async def mark_snoozed(call: ServiceCall):
-            entity_ids = async_extract_entity_ids(hass, call)
+            entity_ids = await async_extract_entity_ids(hass, call)
             if not entity_ids:
                 raise HomeAssistantError("No entity_id or target provided")
-            raw_minutes = call.data.get("minutes")
-            for eid in entity_ids:
-                entity = hass.data[DOMAIN]["entities"].get(eid)
-                if not entity:
-                    raise HomeAssistantError(f"Medication entity not found: {eid}")
-                try:
-                    minutes = int(raw_minutes) if raw_minutes is not None else int(entity.snooze_minutes)
-                except (TypeError, ValueError):
-                    minutes = DEFAULT_SNOOZE_MINUTES
-                if minutes < 1:
-                    minutes = 1
-                if minutes > 1440:
-                    minutes = 1440
-                await entity.async_snooze(minutes)
-                await hass.data[DOMAIN]["history"].record(eid, "Snoozed", dt_util.now().isoformat())
+            await _async_mark_entities(hass, entity_ids, STATE_SNOOZED, call.data.get("minutes"))
 
         hass.services.async_register(DOMAIN, "mark_taken", mark_taken)
         hass.services.async_register(DOMAIN, "mark_skipped", mark_skipped)
         hass.services.async_register(DOMAIN, "mark_snoozed", mark_snoozed)
         # Optional reset service
         async def mark_pending(call: ServiceCall):
-            entity_ids = async_extract_entity_ids(hass, call)
+            entity_ids = await async_extract_entity_ids(hass, call)
             if not entity_ids:
                 raise HomeAssistantError("No entity_id or target provided")
             for eid in entity_ids:
@@ -95,7 +198,7 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
 
         # Refill helpers
         async def refill_set(call: ServiceCall):
-            entity_ids = async_extract_entity_ids(hass, call)
+            entity_ids = await async_extract_entity_ids(hass, call)
             if not entity_ids:
                 raise HomeAssistantError("No entity_id or target provided")
             remaining = call.data.get("remaining")
@@ -105,7 +208,12 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
                 raise HomeAssistantError("Provide at least one of remaining, threshold, units_per_intake")
             hist: HistoryManager = hass.data[DOMAIN]["history"]
             for eid in entity_ids:
-                cur = hist.get_refill(eid) or {"remaining": 0, "threshold": 0, "units_per_intake": 1, "alerted": False}
+                cur = await hist.async_get_refill(eid) or {
+                    "remaining": 0,
+                    "threshold": 0,
+                    "units_per_intake": 1,
+                    "alerted": False,
+                }
                 await hist.set_refill(
                     eid,
                     remaining=int(remaining if remaining is not None else cur["remaining"]),
@@ -115,7 +223,7 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
                 )
 
         async def refill_add(call: ServiceCall):
-            entity_ids = async_extract_entity_ids(hass, call)
+            entity_ids = await async_extract_entity_ids(hass, call)
             if not entity_ids:
                 raise HomeAssistantError("No entity_id or target provided")
             amount = call.data.get("amount")
@@ -127,14 +235,14 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
                 raise HomeAssistantError("amount must be integer") from err
             hist: HistoryManager = hass.data[DOMAIN]["history"]
             for eid in entity_ids:
-                cur = hist.get_refill(eid)
+                cur = await hist.async_get_refill(eid)
                 if not cur:
                     continue
                 new_remaining = max(0, int(cur.get("remaining", 0)) + amount)
                 await hist.adjust_refill(eid, remaining=new_remaining, alerted=False)
 
         async def refill_acknowledge(call: ServiceCall):
-            entity_ids = async_extract_entity_ids(hass, call)
+            entity_ids = await async_extract_entity_ids(hass, call)
             if not entity_ids:
                 raise HomeAssistantError("No entity_id or target provided")
             hist: HistoryManager = hass.data[DOMAIN]["history"]
@@ -144,6 +252,93 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         hass.services.async_register(DOMAIN, "refill_set", refill_set)
         hass.services.async_register(DOMAIN, "refill_add", refill_add)
         hass.services.async_register(DOMAIN, "refill_acknowledge", refill_acknowledge)
+
+        # On-demand history query; keeps large payloads out of entity state
+        async def get_history(call: ServiceCall) -> ServiceResponse:
+            entity_ids = await async_extract_entity_ids(hass, call)
+            if not entity_ids:
+                raise HomeAssistantError("No entity_id or target provided")
+            try:
+                limit = int(call.data.get("limit", DEFAULT_RECENT_EVENTS))
+            except (TypeError, ValueError) as err:
+                raise HomeAssistantError("limit must be integer") from err
+            limit = min(MAX_RECENT_EVENTS, max(0, limit))
+            registry = hass.data[DOMAIN]["entities"]
+            hist: HistoryManager = hass.data[DOMAIN]["history"]
+            result = {}
+            for eid in sorted(entity_ids):
+                if eid not in registry:
+                    raise HomeAssistantError(f"Medication entity not found: {eid}")
+                result[eid] = {
+                    "recent_events": await hist.async_recent(eid, limit) if limit else [],
+                    "periods": {key: await hist.async_period_summary(eid, days) for key, days in STATS_PERIODS.items()},
+                }
+            return result
+
+        hass.services.async_register(
+            DOMAIN, "get_history", get_history, supports_response=SupportsResponse.ONLY
+        )
+
+        # Weekday x hour heatmaps, dose delays and trends; all medications without a target
+        async def get_adherence_report(call: ServiceCall) -> ServiceResponse:
+            registry = hass.data[DOMAIN]["entities"]
+            entity_ids = sorted(await async_extract_entity_ids(hass, call)) or sorted(registry)
+            for eid in entity_ids:
+                if eid not in registry:
+                    raise HomeAssistantError(f"Medication entity not found: {eid}")
+            try:
+                days = int(call.data.get("days", REPORT_DEFAULT_DAYS))
+                trend_days = int(call.data.get("trend_days", REPORT_DEFAULT_TREND_DAYS))
+            except (TypeError, ValueError) as err:
+                raise HomeAssistantError("days and trend_days must be integers") from err
+            if not 1 <= days <= REPORT_MAX_DAYS:
+                raise HomeAssistantError(f"days must be between 1 and {REPORT_MAX_DAYS}")
+            if not 1 <= trend_days <= days:
+                raise HomeAssistantError("trend_days must be between 1 and days")
+            return await async_adherence_report(hass.data[DOMAIN]["history"], entity_ids, days, trend_days)
+
+        hass.services.async_register(
+            DOMAIN, "get_adherence_report", get_adherence_report, supports_response=SupportsResponse.ONLY
+        )
+
+        # Backup and migration of the raw events; files are streamed in chunks
+        async def export_history(call: ServiceCall) -> ServiceResponse:
+            hist: HistoryManager = hass.data[DOMAIN]["history"]
+            entity_ids = sorted(await async_extract_entity_ids(hass, call)) or sorted(await hist.async_entity_ids())
+            fmt = call.data.get("format")
+            default = f"{DOMAIN}_history_{dt_util.now().strftime('%Y%m%d_%H%M%S')}.{fmt or 'csv'}"
+            path = resolve_path(hass, call.data.get("path") or default)
+            return await async_export_history(
+                hass,
+                hist,
+                entity_ids,
+                path,
+                transfer_format(path, fmt),
+                parse_time(call.data.get("start_time"), "start_time"),
+                parse_time(call.data.get("end_time"), "end_time"),
+            )
+
+        async def import_history(call: ServiceCall) -> ServiceResponse:
+            if not call.data.get("path"):
+                raise HomeAssistantError("path is required")
+            path = resolve_path(hass, call.data["path"])
+            entity_ids = await async_extract_entity_ids(hass, call)
+            return await async_import_history(
+                hass,
+                hass.data[DOMAIN]["history"],
+                path,
+                transfer_format(path, call.data.get("format")),
+                entity_ids or None,
+                parse_time(call.data.get("start_time"), "start_time"),
+                parse_time(call.data.get("end_time"), "end_time"),
+            )
+
+        hass.services.async_register(
+            DOMAIN, "export_history", export_history, supports_response=SupportsResponse.OPTIONAL
+        )
+        hass.services.async_register(
+            DOMAIN, "import_history", import_history, supports_response=SupportsResponse.OPTIONAL
+        )
         store["services_registered"] = True
         _LOGGER.debug("%s: services registered", DOMAIN)
 
@@ -153,6 +348,17 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
             data = event.data or {}
             action = str(data.get("action", "")).upper()
             ad = data.get("action_data", {}) or {}
+            if action in ("MED_TAKEN_ALL", "MED_SNOOZE_ALL"):
+                # Grouped reminder: act on every listed medication still configured
+                registry = hass.data[DOMAIN]["entities"]
+                entity_ids = [eid for eid in (ad.get("entity_ids") or []) if eid in registry]
+                if not entity_ids:
+                    return
+                if action == "MED_TAKEN_ALL":
+                    await _async_mark_entities(hass, entity_ids, STATE_TAKEN)
+                else:
+                    await _async_mark_entities(hass, entity_ids, STATE_SNOOZED, ad.get("minutes"))
+                return
             entity_id = ad.get("entity_id") or data.get("tag")
             if not entity_id:
                 return
@@ -160,23 +366,11 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
             if not entity:
                 return
             if action in ("MED_TAKEN", "TAKEN"):
-                await entity.async_mark(STATE_TAKEN)
-                await hass.data[DOMAIN]["history"].record(entity_id, STATE_TAKEN, dt_util.now().isoformat())
+                await _async_mark_entities(hass, [entity_id], STATE_TAKEN)
             elif action in ("MED_SKIP", "SKIP", "SKIPPED", "MED_DISMISS", "DISMISS"):
-                await entity.async_mark(STATE_SKIPPED)
-                await hass.data[DOMAIN]["history"].record(entity_id, STATE_SKIPPED, dt_util.now().isoformat())
+                await _async_mark_entities(hass, [entity_id], STATE_SKIPPED)
             elif action in ("MED_SNOOZE", "SNOOZE", "SNOOZED"):
-                minutes = ad.get("minutes")
-                try:
-                    minutes = int(minutes) if minutes is not None else int(entity.snooze_minutes)
-                except (TypeError, ValueError):
-                    minutes = DEFAULT_SNOOZE_MINUTES
-                if minutes < 1:
-                    minutes = 1
-                if minutes > 1440:
-                    minutes = 1440
-                await entity.async_snooze(minutes)
-                await hass.data[DOMAIN]["history"].record(entity_id, "Snoozed", dt_util.now().isoformat())
+                await _async_mark_entities(hass, [entity_id], STATE_SNOOZED, ad.get("minutes"))
 
         store["mobile_unsub"] = hass.bus.async_listen("mobile_app_notification_action", _handle_mobile_action)
         _LOGGER.debug("%s: listening for mobile_app_notification_action", DOMAIN)
@@ -194,9 +388,27 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     entries = hass.config_entries.async_entries(DOMAIN)
     any_loaded = any(e.state == ConfigEntryState.LOADED and e.entry_id != entry.entry_id for e in entries)
     store = hass.data.get(DOMAIN, {})
+    if store.get("debug_entry") == entry.entry_id:
+        store.pop("debug_entry")
+    history: HistoryManager | None = store.get("history")
+    if history is not None:
+        # Never leave coalesced writes pending across an unload
+        await history.async_flush()
     if not any_loaded:
         # Unregister services
-        for svc in ("mark_taken", "mark_skipped", "mark_snoozed", "mark_pending", "refill_set", "refill_add", "refill_acknowledge"):
+        for svc in (
+            "mark_taken",
+            "mark_skipped",
+            "mark_snoozed",
+            "mark_pending",
+            "refill_set",
+            "refill_add",
+            "refill_acknowledge",
+            "get_history",
+            "get_adherence_report",
+            "export_history",
+            "import_history",
+        ):
             if hass.services.has_service(DOMAIN, svc):
                 hass.services.async_remove(DOMAIN, svc)
         # Remove mobile listener
@@ -209,6 +421,14 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
             store["mobile_unsub"] = None
         # Clear entities map and history manager
         store.get("entities", {}).clear()
+        coordinator: MedicationCoordinator | None = store.pop("coordinator", None)
+        if coordinator is not None:
+            await coordinator.async_shutdown()
+        if history is not None:
+            await history.async_unload()
         store.pop("history", None)
+        scheduler: DoseScheduler | None = store.pop("scheduler", None)
+        if scheduler is not None:
+            scheduler.async_stop()
         store["services_registered"] = False
     return True
@@ -3,8 +3,31 @@ from __future__ import annotations
 
 import voluptuous as vol
 from homeassistant import config_entries
+from homeassistant.core import callback
+from homeassistant.helpers.selector import (
+    SelectSelector,
+    SelectSelectorConfig,
+    SelectSelectorMode,
+    TextSelector,
+    TextSelectorConfig,
+)
 
-from .const import DOMAIN, ATTR_NAME, ATTR_DOSE, ATTR_TIMES
+from .const import (
+    DOMAIN,
+    ATTR_NAME,
+    ATTR_DOSE,
+    ATTR_TIMES,
+    CONF_ENTRY_TYPE,
+    CONF_LIST_NAME,
+    CONF_MEDICATIONS,
+    DEFAULT_LIST_NAME,
+    ENTRY_TYPE_LIST,
+    IMPORT_FORMATS,
+    DEFAULT_HISTORY_DAYS,
+    DEFAULT_HISTORY_MAX_EVENTS,
+    MAX_REFILL_LEAD_DAYS,
+)
+from .importer import configured_slugs, dump_medications, is_list_entry, load_medications
 
 
 def _slugify(name: str) -> str:
@@ -40,7 +63,15 @@ def _normalize_times(value: str) -> list[str]:
 class MedicationReminderConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     VERSION = 1
 
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry: config_entries.ConfigEntry):
+        return MedicationReminderOptionsFlow(config_entry)
+
     async def async_step_user(self, user_input=None):
+        return self.async_show_menu(step_id="user", menu_options=["medication", "medication_list"])
+
+    async def async_step_medication(self, user_input=None):
         errors = {}
         if user_input is not None:
             try:
@@ -57,6 +88,8 @@ class MedicationReminderConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                     slug = _slugify(name)
                     await self.async_set_unique_id(f"med_{slug}")
                     self._abort_if_unique_id_configured()
+                    if slug in configured_slugs(self.hass):
+                        return self.async_abort(reason="already_configured")
                     title = name
                     data = {ATTR_NAME: name, ATTR_DOSE: dose, ATTR_TIMES: times}
                     return self.async_create_entry(title=title, data=data)
@@ -75,7 +108,54 @@ class MedicationReminderConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                 ): str,
             }
         )
-        return self.async_show_form(step_id="user", data_schema=schema, errors=errors)
+        return self.async_show_form(step_id="medication", data_schema=schema, errors=errors)
+
+    async def async_step_medication_list(self, user_input=None):
+        """One entry holding many medications, pasted as YAML, JSON or CSV."""
+        errors = {}
+        placeholders = {"error": ""}
+        if user_input is not None:
+            list_name = (user_input.get(CONF_LIST_NAME) or "").strip()
+            if not list_name:
+                errors[CONF_LIST_NAME] = "required"
+            else:
+                await self.async_set_unique_id(f"list_{_slugify(list_name)}")
+                self._abort_if_unique_id_configured()
+                try:
+                    medications = await self.hass.async_add_executor_job(
+                        load_medications, user_input.get(CONF_MEDICATIONS) or "[]", user_input.get("format", "yaml")
+                    )
+                except vol.Invalid as err:
+                    errors["base"] = "invalid_import"
+                    placeholders["error"] = str(err)
+                else:
+                    taken = configured_slugs(self.hass) & {_slugify(med[ATTR_NAME]) for med in medications}
+                    if taken:
+                        errors["base"] = "already_configured_medication"
+                        placeholders["error"] = ", ".join(sorted(taken))
+                    else:
+                        return await self.async_step_import(
+                            {CONF_ENTRY_TYPE: ENTRY_TYPE_LIST, CONF_LIST_NAME: list_name, CONF_MEDICATIONS: medications}
+                        )
+
+        schema = vol.Schema(
+            {
+                vol.Required(CONF_LIST_NAME, default=DEFAULT_LIST_NAME): str,
+                vol.Optional("format", default="yaml"): SelectSelector(
+                    SelectSelectorConfig(options=IMPORT_FORMATS, mode=SelectSelectorMode.DROPDOWN)
+                ),
+                vol.Optional(CONF_MEDICATIONS): TextSelector(TextSelectorConfig(multiline=True)),
+            }
+        )
+        return self.async_show_form(
+            step_id="medication_list", data_schema=schema, errors=errors, description_placeholders=placeholders
+        )
+
+    async def async_step_import(self, import_data):
+        """Create a medication list entry from already validated data."""
+        await self.async_set_unique_id(f"list_{_slugify(import_data[CONF_LIST_NAME])}")
+        self._abort_if_unique_id_configured()
+        return self.async_create_entry(title=import_data[CONF_LIST_NAME], data=import_data)
 
 
 class MedicationReminderOptionsFlow(config_entries.OptionsFlow):
@@ -83,6 +163,8 @@ class MedicationReminderOptionsFlow(config_entries.OptionsFlow):
         self.config_entry = config_entry
 
     async def async_step_init(self, user_input=None):
+        if is_list_entry(self.config_entry):
+            return await self.async_step_list()
         errors = {}
         if user_input is not None:
             try:
@@ -111,9 +193,25 @@ class MedicationReminderOptionsFlow(config_entries.OptionsFlow):
                 refill_threshold = int(user_input.get("refill_threshold", 0))
                 if refill_threshold < 0:
                     refill_threshold = 0
+                refill_lead_days = int(user_input.get("refill_lead_days", 0))
+                if refill_lead_days < 0:
+                    refill_lead_days = 0
+                if refill_lead_days > MAX_REFILL_LEAD_DAYS:
+                    refill_lead_days = MAX_REFILL_LEAD_DAYS
                 dose_units_per_intake = int(user_input.get("dose_units_per_intake", 1))
                 if dose_units_per_intake < 1:
                     dose_units_per_intake = 1
+                history_days = int(user_input.get("history_days", DEFAULT_HISTORY_DAYS))
+                if history_days < 1:
+                    history_days = 1
+                if history_days > 3650:
+                    history_days = 3650
+                history_max_events = int(user_input.get("history_max_events", DEFAULT_HISTORY_MAX_EVENTS))
+                if history_max_events < 10:
+                    history_max_events = 10
+                if history_max_events > 20000:
+                    history_max_events = 20000
+                group_notifications = bool(user_input.get("group_notifications", False))
                 return self.async_create_entry(
                     title="",
                     data={
@@ -125,7 +223,11 @@ class MedicationReminderOptionsFlow(config_entries.OptionsFlow):
                         "nag_max": nag_max,
                         "refill_total": refill_total,
                         "refill_threshold": refill_threshold,
+                        "refill_lead_days": refill_lead_days,
                         "dose_units_per_intake": dose_units_per_intake,
+                        "history_days": history_days,
+                        "history_max_events": history_max_events,
+                        "group_notifications": group_notifications,
                     },
                 )
             except vol.Invalid:
@@ -133,14 +235,20 @@ class MedicationReminderOptionsFlow(config_entries.OptionsFlow):
 
         current = {
             ATTR_DOSE: self.config_entry.options.get(ATTR_DOSE, self.config_entry.data.get(ATTR_DOSE, "")),
-            ATTR_TIMES: ", ".join(self.config_entry.options.get(ATTR_TIMES, self.config_entry.data.get(ATTR_TIMES, [])) or []),
+            ATTR_TIMES: ", ".join(
+                self.config_entry.options.get(ATTR_TIMES, self.config_entry.data.get(ATTR_TIMES, [])) or []
+            ),
             "snooze_minutes": self.config_entry.options.get("snooze_minutes", 5),
             "notify_services": self.config_entry.options.get("notify_services", ""),
             "nag_interval_minutes": self.config_entry.options.get("nag_interval_minutes", 5),
             "nag_max": self.config_entry.options.get("nag_max", 3),
             "refill_total": self.config_entry.options.get("refill_total", 0),
             "refill_threshold": self.config_entry.options.get("refill_threshold", 0),
+            "refill_lead_days": self.config_entry.options.get("refill_lead_days", 0),
             "dose_units_per_intake": self.config_entry.options.get("dose_units_per_intake", 1),
+            "history_days": self.config_entry.options.get("history_days", DEFAULT_HISTORY_DAYS),
+            "history_max_events": self.config_entry.options.get("history_max_events", DEFAULT_HISTORY_MAX_EVENTS),
+            "group_notifications": self.config_entry.options.get("group_notifications", False),
         }
 
         schema = vol.Schema(
@@ -159,11 +267,44 @@ class MedicationReminderOptionsFlow(config_entries.OptionsFlow):
                 vol.Optional("nag_max", default=current["nag_max"]): int,
                 vol.Optional("refill_total", default=current["refill_total"]): int,
                 vol.Optional("refill_threshold", default=current["refill_threshold"]): int,
+                vol.Optional("refill_lead_days", default=current["refill_lead_days"]): int,
                 vol.Optional("dose_units_per_intake", default=current["dose_units_per_intake"]): int,
+                vol.Optional("history_days", default=current["history_days"]): int,
+                vol.Optional("history_max_events", default=current["history_max_events"]): int,
+                vol.Optional("group_notifications", default=current["group_notifications"]): bool,
             }
         )
         return self.async_show_form(step_id="init", data_schema=schema, errors=errors)
 
+    async def async_step_list(self, user_input=None):
+        """Edit every medication of a list entry as one YAML document."""
+        errors = {}
+        placeholders = {"error": ""}
+        if user_input is not None:
+            try:
+                medications = await self.hass.async_add_executor_job(
+                    load_medications, user_input.get(CONF_MEDICATIONS) or "[]", "yaml"
+                )
+            except vol.Invalid as err:
+                errors["base"] = "invalid_import"
+                placeholders["error"] = str(err)
+            else:
+                taken = configured_slugs(self.hass, exclude=self.config_entry.entry_id)
+                taken &= {_slugify(med[ATTR_NAME]) for med in medications}
+                if taken:
+                    errors["base"] = "already_configured_medication"
+                    placeholders["error"] = ", ".join(sorted(taken))
+                else:
+                    # The list lives in the entry data; its update listener applies the changes
+                    self.hass.config_entries.async_update_entry(
+                        self.config_entry, data={**self.config_entry.data, CONF_MEDICATIONS: medications}
+                    )
+                    return self.async_create_entry(title="", data={})
 
-async def async_get_options_flow(config_entry: config_entries.ConfigEntry):
-    return MedicationReminderOptionsFlow(config_entry)
+        current = dump_medications(self.config_entry.data.get(CONF_MEDICATIONS, []))
+        schema = vol.Schema(
+            {vol.Optional(CONF_MEDICATIONS, default=current): TextSelector(TextSelectorConfig(multiline=True))}
+        )
+        return self.async_show_form(
+            step_id="list", data_schema=schema, errors=errors, description_placeholders=placeholders
+        )
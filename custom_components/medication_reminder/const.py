@@ -1,4 +1,5 @@
 """Constants for Medication Reminder."""
+from datetime import timedelta
 
 # Integration domain must match the folder name under custom_components
 DOMAIN = "medication_reminder"
@@ -7,6 +8,18 @@ DOMAIN = "medication_reminder"
 STORAGE_KEY = "medication_reminder"
 STORAGE_VERSION = 1
 
+# Installation-wide options (optional `medication_reminder:` YAML block)
+CONF_HISTORY = "history"
+CONF_SAVE_DELAY = "save_delay"
+CONF_BACKEND = "backend"
+
+# History storage backends
+BACKEND_JSON = "json"  # single JSON document, rewritten (coalesced) on change
+BACKEND_JOURNAL = "journal"  # JSON snapshot plus append-only JSON-lines journal
+BACKEND_SQLITE = "sqlite"  # local SQLite database queried on demand; nothing kept in memory
+HISTORY_BACKENDS = [BACKEND_JSON, BACKEND_JOURNAL, BACKEND_SQLITE]
+HISTORY_DB_FILE = f"{DOMAIN}_history.db"
+
 # Defaults
 DEFAULT_SNOOZE_MINUTES = 5
 MIN_SNOOZE_MINUTES = 1
@@ -18,6 +31,15 @@ ATTR_DOSE = "dose"
 ATTR_TIMES = "times"
 ATTR_LAST_ACTION = "last_action"
 
+# Medication list entries: one config entry holding many medications
+CONF_ENTRY_TYPE = "entry_type"
+ENTRY_TYPE_LIST = "list"
+CONF_LIST_NAME = "list_name"
+CONF_MEDICATIONS = "medications"
+DEFAULT_LIST_NAME = "Medications"
+# Payload formats accepted by the import_medications service and the list config step
+IMPORT_FORMATS = ["yaml", "json", "csv"]
+
 # States
 STATE_PENDING = "Pending"
 STATE_TAKEN = "Taken"
@@ -26,5 +48,76 @@ STATE_SNOOZED = "Snoozed"
 
 # History persistence
 HISTORY_STORE_KEY = f"{DOMAIN}_history"
-HISTORY_STORE_VERSION = 1
+HISTORY_STORE_VERSION = 2
+# Default raw-event retention per medication (configurable per entry in options)
+DEFAULT_HISTORY_DAYS = 60
+DEFAULT_HISTORY_MAX_EVENTS = 500
+# Background job enforcing retention across all medications
+HISTORY_MAINTENANCE_INTERVAL = timedelta(hours=1)
+# Days of per-day rollups kept for period statistics (raw events are pruned sooner)
+HISTORY_ROLLUP_DAYS = 5 * 365
+# Seconds to coalesce history writes before flushing to disk (0 = write immediately)
+DEFAULT_SAVE_DELAY = 10
+MAX_SAVE_DELAY = 600
+# Events per chunk read, written or merged by the history export/import services
+HISTORY_TRANSFER_CHUNK = 5000
+HISTORY_TRANSFER_FORMATS = ["csv", "jsonl"]
+# Journal operations appended before the snapshot is rewritten and the journal truncated
+JOURNAL_COMPACT_LINES = 1000
+# History changed (payload: set of entity_ids); the statistics coordinator refreshes those medications
 SIGNAL_HISTORY_UPDATED = f"{DOMAIN}_history_updated"
+# New events as a list of (entity_id, event dict); feeds the websocket subscription
+SIGNAL_HISTORY_EVENTS = f"{DOMAIN}_history_events"
+# Refill info changed; payload is the entity_id
+SIGNAL_REFILL_UPDATED = f"{DOMAIN}_refill_updated"
+# A medication sensor was added or removed; payload is the entity_id
+SIGNAL_MEDICATIONS_UPDATED = f"{DOMAIN}_medications_updated"
+
+# Statistics periods: name -> number of calendar days, today included
+STATS_PERIODS = {"daily": 1, "weekly": 7, "monthly": 30, "yearly": 365}
+# Rolling window of the adherence sensor
+ADHERENCE_DAYS = 7
+# Seconds the statistics coordinator waits after a refresh before running the next one
+COORDINATOR_COOLDOWN = 2
+# Recent events returned by the adherence sensor and the get_history service
+DEFAULT_RECENT_EVENTS = 100
+MAX_RECENT_EVENTS = 1000
+
+# Dose-slot ledger: scheduled dose instants and what became of each
+DOSE_LEDGER_STORE_KEY = f"{DOMAIN}_dose_ledger"
+DOSE_LEDGER_STORE_VERSION = 1
+# Taken/skipped events match the nearest open slot at most this far either side
+DOSE_SLOT_TOLERANCE = timedelta(hours=2)
+# Taken within this long after the slot (or early) is on time; later is late
+DOSE_ON_TIME = timedelta(minutes=30)
+# Slots kept; covers the longest statistics period
+DOSE_LEDGER_DAYS = 400
+SLOT_PENDING = 0
+SLOT_ON_TIME = 1
+SLOT_LATE = 2
+SLOT_SKIPPED = 3
+SLOT_MISSED = 4
+
+# Refill forecasting: intake rate weighted with this time constant, from taken doses
+FORECAST_STORE_KEY = f"{DOMAIN}_refill_forecast"
+FORECAST_STORE_VERSION = 1
+FORECAST_TIME_CONSTANT = timedelta(days=14)
+# Until this much intake history exists the dose schedule gives the rate
+FORECAST_MIN_HISTORY = timedelta(days=3)
+MAX_REFILL_LEAD_DAYS = 365
+
+# get_adherence_report: days covered and the length of each trend window
+REPORT_DEFAULT_DAYS = 90
+REPORT_MAX_DAYS = 730
+REPORT_DEFAULT_TREND_DAYS = 7
+
+# Compact status codes used by the in-memory history index
+CODE_OTHER = 0
+CODE_TAKEN = 1
+CODE_SKIPPED = 2
+CODE_SNOOZED = 3
+
+# Reminder delivery: notify calls in flight at once across all medications
+NOTIFY_CONCURRENCY = 8
+# Seconds to wait for a single notify service before giving up on it
+NOTIFY_TIMEOUT = 30
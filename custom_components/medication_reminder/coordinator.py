@@ -1,4 +1,282 @@
-"""Optional DataUpdateCoordinator for future live updates."""
-from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
+"""Statistics coordinator: adherence, period stats, streaks and next doses for every medication."""
+from __future__ import annotations
 
-# Placeholder for possible polling refresh (e.g., external APIs or dashboards)
+import logging
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Set
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.debounce import Debouncer
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+from homeassistant.helpers.event import async_track_point_in_utc_time, async_track_time_change
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
+from homeassistant.util import dt as dt_util
+
+from .const import (
+    ADHERENCE_DAYS,
+    COORDINATOR_COOLDOWN,
+    DOMAIN,
+    SIGNAL_HISTORY_UPDATED,
+    STATS_PERIODS,
+)
+from .history import EXPECTED_UNKNOWN, HistoryManager, SummaryRows
+from .ledger import DoseSlots, day_start
+from .metrics import get_metrics
+from .scheduler import next_dose_time
+
+_LOGGER = logging.getLogger(__name__)
+
+# Rollup days needed for the longest period
+WINDOW_DAYS = max(STATS_PERIODS.values())
+
+
+def _streak(rows: SummaryRows, today: int, hi: int) -> int:
+    """Days in a row, back from today, whose expected doses were all taken.
+
+    Counts at most the rollups passed in, i.e. the longest statistics period.
+    """
+    dpd = rows.doses_per_day
+    streak = 0
+    newer = today + 1
+    for i in range(hi - 1, -1, -1):
+        day = rows.days[i]
+        # Days without a rollup between this one and the newer one expected the schedule and had nothing taken
+        missing_days = newer - day - 1
+        if newer == today + 1:
+            # Today is still in progress; it breaks nothing before it has a rollup
+            missing_days -= 1
+        if dpd and missing_days > 0:
+            break
+        newer = day
+        taken, _, _, expected = rows.buckets[i]
+        if expected == EXPECTED_UNKNOWN:
+            expected = dpd
+        if expected <= 0 or (day == today and taken < expected):
+            continue
+        if taken < expected:
+            break
+        streak += 1
+    return streak
+
+
+def next_dose(times: List[str], now: datetime) -> datetime | None:
+    return min((next_dose_time(t, now) for t in times), default=None)
+
+
+def summarize(
+    rows: SummaryRows, times: List[str], today: int, now: datetime, slots: DoseSlots | None = None
+) -> Dict[str, Any]:
+    """Every statistic of one medication from one pass over its rollups and dose slots.
+
+    Period totals come from ``SummaryRows.totals``; days before tracking started are
+    never expected. Missed doses and on-time/late counts come from the dose
+    ledger for the days it covers; earlier days estimate missed doses as
+    expected minus taken and skipped. A streak counts the days back from today
+    whose expected doses were all taken; days that expect nothing neither
+    extend nor break it, and an incomplete today is ignored.
+    """
+    totals = rows.totals
+    now_ts = now.timestamp()
+    covered_from = slots.covered_from if slots is not None else today + 1
+    periods: Dict[str, Dict[str, int]] = {}
+    for key, days in STATS_PERIODS.items():
+        if rows.tracking_start is None and covered_from > today:
+            periods[key] = dict.fromkeys(("taken", "skipped", "snoozed", "missed", "expected", "on_time", "late"), 0)
+            continue
+        # Days before tracking started are never expected
+        first = max(today - days + 1, rows.tracking_start if rows.tracking_start is not None else covered_from)
+        split = min(max(first, covered_from), today + 1)
+        taken, skipped, snoozed, expected = estimated = totals(first, split - 1)
+        missed = max(0, expected - taken - skipped)
+        if split <= today:
+            covered = totals(split, today)
+            taken, skipped, snoozed, expected = (a + b for a, b in zip(estimated, covered))
+        on_time = late = 0
+        if slots is not None:
+            # Open-ended: a dose taken early fills a slot that is still ahead
+            counts = slots.counts(day_start(first), None)
+            on_time, late = counts["on_time"], counts["late"]
+            if split <= today:
+                missed += slots.counts(day_start(split), None)["missed"]
+        periods[key] = {
+            "taken": taken,
+            "skipped": skipped,
+            "snoozed": snoozed,
+            "missed": missed,
+            "expected": expected,
+            "on_time": on_time,
+            "late": late,
+        }
+    adherence: Dict[str, int] = {**rows.recent, "expected": ADHERENCE_DAYS * len(times)}
+    if slots is not None:
+        since = now_ts - ADHERENCE_DAYS * 86400
+        counts = slots.counts(since, None)
+        adherence.update(on_time=counts["on_time"], late=counts["late"], missed=counts["missed"])
+        if slots.since <= since:
+            # The ledger covers the whole window: adherence is over the doses already due
+            adherence["due"] = counts["on_time"] + counts["late"] + counts["skipped"] + counts["missed"]
+    return {
+        "adherence": adherence,
+        "periods": periods,
+        "streak_days": _streak(rows, today, bisect_right(rows.days, today)),
+        "next_dose": next_dose(times, now),
+    }
+
+
+class MedicationCoordinator(DataUpdateCoordinator[Dict[str, Dict[str, Any]]]):
+    """Computes the statistics of all medications in batches and caches them for the sensors.
+
+    History changes mark their medications dirty; a debounced refresh then
+    recomputes all dirty medications with one history query. Everything is
+    recomputed at local midnight, and a medication is refreshed when its next
+    dose time passes. ``updated`` holds the medications the last refresh
+    changed. Sensors register with their medication's entity_id as listener
+    context and only the listeners of ``updated`` are called, so a refresh
+    wakes the few sensors that depend on it rather than every sensor.
+
+    Each summary carries the ``key`` it was computed for: the medication's
+    history version, its dose times and the day. A dirty medication whose key
+    is unchanged (e.g. only its next dose passed) keeps its statistics.
+    """
+
+    def __init__(self, hass: HomeAssistant, history: HistoryManager) -> None:
+        super().__init__(
+            hass,
+            _LOGGER,
+            name=f"{DOMAIN} statistics",
+            request_refresh_debouncer=Debouncer(hass, _LOGGER, cooldown=COORDINATOR_COOLDOWN, immediate=True),
+        )
+        self._history = history
+        self._metrics = get_metrics(hass)
+        self._times: Dict[str, List[str]] = {}
+        self._dirty: Set[str] = set()
+        self.data = {}
+        self.updated: Set[str] = set()
+        self._unsub_next_dose: CALLBACK_TYPE | None = None
+        # Listener callbacks by context (a medication entity_id, or None for all refreshes)
+        self._listeners_by_context: Dict[Any, List[CALLBACK_TYPE]] = {}
+        self._notified_success = True
+        self._unsubs: List[CALLBACK_TYPE] = [
+            async_dispatcher_connect(hass, SIGNAL_HISTORY_UPDATED, self._handle_history_updated),
+            async_track_time_change(hass, self._handle_midnight, hour=0, minute=0, second=0),
+        ]
+
+    @callback
+    def async_set_medication(self, entity_id: str, times: List[str]) -> None:
+        """Track a medication, or update its dose times."""
+        self._times[entity_id] = list(times)
+        self.async_mark_dirty([entity_id])
+
+    @callback
+    def async_remove_medication(self, entity_id: str) -> None:
+        self._times.pop(entity_id, None)
+        self._dirty.discard(entity_id)
+        self.data.pop(entity_id, None)
+
+    @callback
+    def async_mark_dirty(self, entity_ids: Any) -> None:
+        """Recompute these medications with the next (debounced) refresh."""
+        self._dirty.update(eid for eid in entity_ids if eid in self._times)
+        if self._dirty:
+            self._debounced_refresh.async_schedule_call()
+
+    @callback
+    def _handle_history_updated(self, entity_ids: Set[str]) -> None:
+        self.async_mark_dirty(entity_ids)
+
+    @callback
+    def _handle_midnight(self, _now: datetime) -> None:
+        # Period windows and streaks move with the calendar day
+        self.async_mark_dirty(list(self._times))
+
+    @callback
+    def _handle_next_dose(self, _now: datetime) -> None:
+        self._unsub_next_dose = None
+        now = dt_util.utcnow()
+        self.async_mark_dirty(
+            [eid for eid, summary in self.data.items() if summary["next_dose"] and summary["next_dose"] <= now]
+        )
+
+    @callback
+    def _arm_next_dose(self) -> None:
+        if self._unsub_next_dose is not None:
+            self._unsub_next_dose()
+            self._unsub_next_dose = None
+        upcoming = [summary["next_dose"] for summary in self.data.values() if summary["next_dose"]]
+        if upcoming:
+            self._unsub_next_dose = async_track_point_in_utc_time(self.hass, self._handle_next_dose, min(upcoming))
+
+    async def _async_update_data(self) -> Dict[str, Dict[str, Any]]:
+        data = dict(self.data)
+        updated: Set[str] = set()
+        # Medications marked dirty while a batch is being computed join the next batch
+        while self._dirty:
+            batch = [eid for eid in self._dirty if eid in self._times]
+            self._dirty.clear()
+            now = dt_util.now()
+            today = now.date().toordinal()
+            # Keys are taken before the history is read; a change during the read dirties the entity again
+            keys = {eid: (self._history.version(eid), tuple(self._times[eid]), today) for eid in batch}
+            stale = [eid for eid in batch if eid not in data or data[eid]["key"] != keys[eid]]
+            self._metrics.increment("statistics_cache_hits", len(batch) - len(stale))
+            self._metrics.increment("statistics_cache_misses", len(stale))
+            for eid in batch:
+                if eid in data and data[eid]["key"] == keys[eid]:
+                    upcoming = next_dose(self._times[eid], now)
+                    if upcoming != data[eid]["next_dose"]:
+                        data[eid] = {**data[eid], "next_dose": upcoming}
+                        updated.add(eid)
+            if not stale:
+                continue
+            try:
+                rows = await self._history.async_summary_rows(
+                    stale, WINDOW_DAYS, now - timedelta(days=ADHERENCE_DAYS)
+                )
+            except Exception as err:
+                self._dirty.update(stale)
+                raise UpdateFailed(f"Could not read the medication history: {err}") from err
+            for eid in stale:
+                if eid in self._times:
+                    summary = summarize(rows[eid], self._times[eid], today, now, self._history.ledger.get(eid))
+                    data[eid] = {**summary, "key": keys[eid]}
+                    updated.add(eid)
+        self.updated = updated
+        # Medications removed while the history was being read
+        return {eid: summary for eid, summary in data.items() if eid in self._times}
+
+    @callback
+    def async_add_listener(self, update_callback: CALLBACK_TYPE, context: Any = None) -> Callable[[], None]:
+        remove = super().async_add_listener(update_callback, context)
+        callbacks = self._listeners_by_context.setdefault(context, [])
+        callbacks.append(update_callback)
+
+        @callback
+        def remove_listener() -> None:
+            remove()
+            callbacks.remove(update_callback)
+            if not callbacks and self._listeners_by_context.get(context) is callbacks:
+                del self._listeners_by_context[context]
+
+        return remove_listener
+
+    @callback
+    def async_update_listeners(self) -> None:
+        self._arm_next_dose()
+        if self.last_update_success != self._notified_success:
+            # Availability changed: every sensor writes its state
+            self._notified_success = self.last_update_success
+            super().async_update_listeners()
+            return
+        for context in (None, *self.updated):
+            for update_callback in list(self._listeners_by_context.get(context, ())):
+                update_callback()
+
+    async def async_shutdown(self) -> None:
+        await super().async_shutdown()
+        for unsub in self._unsubs:
+            unsub()
+        self._unsubs.clear()
+        if self._unsub_next_dose is not None:
+            self._unsub_next_dose()
+            self._unsub_next_dose = None
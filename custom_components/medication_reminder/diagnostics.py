@@ -0,0 +1,28 @@
+"""Diagnostics download for Medication Reminder config entries."""
+from __future__ import annotations
+
+from typing import Any, Dict
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import entity_registry as er
+
+from .metrics import async_build_report
+
+# Notify targets name people's devices
+TO_REDACT = {"notify_services"}
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> Dict[str, Any]:
+    """Entry settings plus the installation-wide metrics, timers and history sizes."""
+    entities = er.async_entries_for_config_entry(er.async_get(hass), entry.entry_id)
+    return {
+        "entry": {
+            "title": entry.title,
+            "data": async_redact_data(dict(entry.data), TO_REDACT),
+            "options": async_redact_data(dict(entry.options), TO_REDACT),
+        },
+        "entities": sorted(entity.entity_id for entity in entities),
+        **await async_build_report(hass),
+    }
@@ -0,0 +1,126 @@
+"""Refill forecasting: each medication's intake rate and when its supply runs out.
+
+The rate is an exponentially weighted count of taken doses: every taken dose
+adds one to a weight that decays with ``FORECAST_TIME_CONSTANT``, and the
+weight divided by the equally weighted time since tracking started is the
+intake rate. A taken dose updates it in O(1), in or out of order, without
+reading the history back. Until ``FORECAST_MIN_HISTORY`` has passed the
+schedule gives the rate instead.
+"""
+from __future__ import annotations
+
+import logging
+import math
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+
+from .const import (
+    CODE_TAKEN,
+    DEFAULT_SAVE_DELAY,
+    FORECAST_MIN_HISTORY,
+    FORECAST_STORE_KEY,
+    FORECAST_STORE_VERSION,
+    FORECAST_TIME_CONSTANT,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+TAU = FORECAST_TIME_CONSTANT.total_seconds()
+MIN_HISTORY = FORECAST_MIN_HISTORY.total_seconds()
+
+
+class RefillForecast:
+    """Decayed taken-dose weights per medication, persisted with a delayed save.
+
+    Each state is ``[weight, at, start]``: the weight as of the epoch ``at``
+    and the first taken dose seen.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self.hass = hass
+        self._store: Store = Store(hass, FORECAST_STORE_VERSION, FORECAST_STORE_KEY)
+        self._state: Dict[str, List[float]] = {}
+        self._loaded = False
+
+    async def async_load(self) -> None:
+        data = await self._store.async_load() or {}
+        for eid, raw in (data.get("entities") or {}).items():
+            try:
+                weight, at, start = (float(x) for x in raw)
+            except (TypeError, ValueError):
+                _LOGGER.warning("Dropping malformed refill forecast of %s", eid)
+                continue
+            self._state[eid] = [weight, at, start]
+        self._loaded = True
+
+    async def async_flush(self) -> None:
+        if self._loaded:
+            await self._store.async_save(self._data_to_save())
+
+    def _data_to_save(self) -> Dict[str, Any]:
+        return {"entities": self._state}
+
+    @callback
+    def observe(self, records: List[Tuple[str, int, int]]) -> None:
+        """Count the taken doses among ``(entity_id, epoch, code)`` events."""
+        if not self._loaded:
+            return
+        touched = False
+        for eid, ts, code in records:
+            if code != CODE_TAKEN:
+                continue
+            state = self._state.get(eid)
+            if state is None:
+                # The first dose only starts the clock: n doses span n - 1 intervals
+                self._state[eid] = [0.0, float(ts), float(ts)]
+            elif ts >= state[1]:
+                state[0] = state[0] * math.exp((state[1] - ts) / TAU) + 1
+                state[1] = float(ts)
+            elif ts < state[2]:
+                # An earlier dose starts the clock instead, and the former first one counts
+                state[0] += math.exp((state[2] - state[1]) / TAU)
+                state[2] = float(ts)
+            else:
+                # A backdated dose weighs what it would have by now
+                state[0] += math.exp((ts - state[1]) / TAU)
+            touched = True
+        if touched:
+            self._store.async_delay_save(self._data_to_save, DEFAULT_SAVE_DELAY)
+
+    def rate(self, entity_id: str, now: float) -> float | None:
+        """Taken doses per day; None until enough history exists."""
+        state = self._state.get(entity_id)
+        if state is None:
+            return None
+        weight, at, start = state
+        elapsed = now - start
+        if elapsed < MIN_HISTORY:
+            return None
+        span = TAU * -math.expm1(-elapsed / TAU)
+        return weight * math.exp(min(0.0, at - now) / TAU) / span * 86400
+
+    def stats(self) -> Dict[str, Any]:
+        return {"medications": len(self._state)}
+
+
+def project(
+    remaining: int, units_per_intake: int, rate: float | None, doses_per_day: int, now: datetime
+) -> Dict[str, Any]:
+    """Units used per day, days of supply and run-out time for ``remaining`` units.
+
+    ``rate`` is the observed intake rate; without one the schedule's
+    ``doses_per_day`` is used. Without any use there is no run-out.
+    """
+    source = "history" if rate is not None else "schedule"
+    per_day = (rate if rate is not None else doses_per_day) * max(1, units_per_intake)
+    days = max(0, remaining) / per_day if per_day > 0 else None
+    return {
+        "units_per_day": round(per_day, 2),
+        "days_of_supply": round(days, 1) if days is not None else None,
+        "run_out": now + timedelta(days=days) if days is not None else None,
+        "rate_source": source,
+    }
+
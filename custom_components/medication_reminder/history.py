@@ -1,143 +1,1140 @@
-"""Adherence history manager and helpers."""
+"""Adherence history manager, storage backends and helpers."""
 from __future__ import annotations
 
-from collections import defaultdict
-from datetime import timedelta
-from typing import Any, Dict, List
+import asyncio
+import logging
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from contextlib import suppress
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from heapq import merge
+from typing import Any, AsyncIterator, Dict, Iterable, List, Set, Tuple
 
-from homeassistant.core import HomeAssistant
-from homeassistant.helpers.storage import Store
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
+from homeassistant.core import CALLBACK_TYPE, Event, HomeAssistant, callback
+from homeassistant.helpers.storage import STORAGE_DIR, Store
 from homeassistant.util import dt as dt_util
 from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.helpers.event import async_track_time_interval
 
 from .const import (
+    BACKEND_JOURNAL,
+    BACKEND_JSON,
+    BACKEND_SQLITE,
+    CODE_OTHER,
+    CODE_SKIPPED,
+    CODE_SNOOZED,
+    CODE_TAKEN,
+    DEFAULT_HISTORY_DAYS,
+    DEFAULT_HISTORY_MAX_EVENTS,
+    DEFAULT_SAVE_DELAY,
+    HISTORY_MAINTENANCE_INTERVAL,
+    HISTORY_ROLLUP_DAYS,
+    HISTORY_TRANSFER_CHUNK,
     HISTORY_STORE_KEY,
     HISTORY_STORE_VERSION,
+    JOURNAL_COMPACT_LINES,
     SIGNAL_HISTORY_UPDATED,
+    SIGNAL_HISTORY_EVENTS,
+    SIGNAL_REFILL_UPDATED,
+    STATE_SKIPPED,
+    STATE_SNOOZED,
+    STATE_TAKEN,
 )
+from .forecast import RefillForecast, project
+from .journal import HistoryJournal
+from .ledger import DoseLedger
+from .metrics import get_metrics
+from .storage_migration import HistoryStore
 
+_LOGGER = logging.getLogger(__name__)
+
+
+def status_code(status: Any) -> int:
+    """Map a free-form status string to its compact code."""
+    st = str(status).lower()
+    if st.startswith("take"):
+        return CODE_TAKEN
+    if st.startswith("skip"):
+        return CODE_SKIPPED
+    if st.startswith("snooz"):
+        return CODE_SNOOZED
+    return CODE_OTHER
+
+
+def parse_epoch(value: Any) -> float | None:
+    """Return epoch seconds for an ISO string or datetime, or None if unparsable."""
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if not isinstance(value, str):
+        return None
+    ts = dt_util.parse_datetime(value)
+    if ts is None:
+        return None
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=dt_util.DEFAULT_TIME_ZONE)
+    return ts.timestamp()
+
+
+def record_epoch(timestamp_iso: Any) -> int:
+    """Whole epoch seconds an event is stored under; unparsable timestamps mean now."""
+    ts = parse_epoch(timestamp_iso)
+    return int(time.time() if ts is None else ts)
+
+
+# Status names reported for the stored codes
+STATUS_NAMES = {CODE_TAKEN: STATE_TAKEN, CODE_SKIPPED: STATE_SKIPPED, CODE_SNOOZED: STATE_SNOOZED}
+STATUS_OTHER = "Other"
+
+
+def event_dict(ts: float, code: int) -> Dict[str, Any]:
+    """Build the ``{"status", "timestamp"}`` event for a stored epoch and code."""
+    return {
+        "status": STATUS_NAMES.get(code, STATUS_OTHER),
+        "timestamp": dt_util.utc_from_timestamp(int(ts)).isoformat(),
+    }
+
+
+class _EventIndex:
+    """Events for one entity as parallel columns sorted by time.
+
+    ``ts`` holds epoch seconds in an ``array('q')`` and ``codes`` the status
+    codes in a ``bytearray``, so an event costs nine bytes. Range queries bisect
+    on ``ts``; event dicts are only built for the rows a query returns.
+    """
+
+    __slots__ = ("ts", "codes")
+
+    def __init__(self, ts: Iterable[int] = (), codes: bytes = b"") -> None:
+        self.ts = array("q", ts)
+        self.codes = bytearray(codes)
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def add(self, ts: int, code: int) -> None:
+        """Insert an event in time order."""
+        if not self.ts or ts >= self.ts[-1]:
+            self.ts.append(ts)
+            self.codes.append(code)
+            return
+        # Out-of-order timestamp (e.g. clock change); keep the index sorted
+        pos = bisect_right(self.ts, ts)
+        self.ts.insert(pos, ts)
+        self.codes.insert(pos, code)
+
+    def merge(self, rows: List[Tuple[int, int]]) -> None:
+        """Insert time-sorted ``(ts, code)`` rows with one rebuild instead of per-row inserts."""
+        if not rows:
+            return
+        if not self.ts or rows[0][0] >= self.ts[-1]:
+            self.ts.extend(ts for ts, _ in rows)
+            self.codes.extend(code for _, code in rows)
+            return
+        merged = list(merge(zip(self.ts, self.codes), rows))
+        self.ts = array("q", (ts for ts, _ in merged))
+        self.codes = bytearray(code for _, code in merged)
+
+    def contains(self, ts: int, code: int) -> bool:
+        lo = bisect_left(self.ts, ts)
+        return code in self.codes[lo:bisect_right(self.ts, ts, lo)]
+
+    def event(self, i: int) -> Dict[str, Any]:
+        return event_dict(self.ts[i], self.codes[i])
+
+    def drop_before(self, cutoff: float, keep_last: int) -> bool:
+        """Drop events older than ``cutoff`` and all but the newest ``keep_last``."""
+        cut = max(bisect_left(self.ts, cutoff), len(self.ts) - keep_last)
+        if cut <= 0:
+            return False
+        del self.ts[:cut]
+        del self.codes[:cut]
+        return True
+
+    def trim_head(self, cutoff: float, max_events: int) -> None:
+        """Cheap retention check for the append path.
+
+        Only trims when the oldest entry has expired or the list has grown past
+        its cap by a slack margin, so each event is removed once and the cost of
+        a record stays O(1) amortized. Exact enforcement is left to the periodic
+        maintenance job.
+        """
+        if not self.ts:
+            return
+        if self.ts[0] < cutoff or len(self.ts) > max_events + max(16, max_events // 8):
+            self.drop_before(cutoff, max_events)
+
+    def counts(self, start: float | None, end: float | None) -> Dict[str, int]:
+        lo = 0 if start is None else bisect_left(self.ts, start)
+        hi = len(self.ts) if end is None else bisect_right(self.ts, end)
+        codes = self.codes[lo:hi]
+        return {
+            "taken": codes.count(CODE_TAKEN),
+            "skipped": codes.count(CODE_SKIPPED),
+            "snoozed": codes.count(CODE_SNOOZED),
+        }
+
+    def as_dict(self) -> Dict[str, Any]:
+        return event_columns(self.ts.tolist(), self.codes)
+
+
+def event_columns(ts: List[int], codes: bytes) -> Dict[str, Any]:
+    """Stored form of an entity's events."""
+    # Codes are single digits, stored as one string instead of a JSON list
+    return {"ts": ts, "codes": "".join(map(str, codes))}
+
+
+# Rollup bucket layout: [taken, skipped, snoozed, expected]
+_R_TAKEN, _R_SKIPPED, _R_SNOOZED, _R_EXPECTED = range(4)
+# Expected doses not known for that day yet; the current schedule is used instead
+EXPECTED_UNKNOWN = -1
+
+
+def sum_rollups(
+    days: List[int], buckets: List[List[int]], first: int, last: int, doses_per_day: int
+) -> Tuple[int, int, int, int]:
+    """Taken, skipped, snoozed and expected doses of the rollups for days ``first``..``last`` (inclusive).
+
+    Days whose expected doses were never stamped, and days without a bucket
+    (no events, e.g. HA was off), expect the current schedule.
+    """
+    taken = skipped = snoozed = expected = 0
+    lo = bisect_left(days, first)
+    hi = bisect_right(days, last, lo)
+    for bucket in buckets[lo:hi]:
+        taken += bucket[_R_TAKEN]
+        skipped += bucket[_R_SKIPPED]
+        snoozed += bucket[_R_SNOOZED]
+        exp = bucket[_R_EXPECTED]
+        expected += doses_per_day if exp == EXPECTED_UNKNOWN else exp
+    if last >= first:
+        expected += (last - first + 1 - (hi - lo)) * doses_per_day
+    return taken, skipped, snoozed, expected
+
+
+def local_day(ts: float) -> int:
+    """Return the local calendar day (date ordinal) for an epoch timestamp."""
+    return dt_util.as_local(dt_util.utc_from_timestamp(ts)).date().toordinal()
+
+
+class _DayRollup:
+    """Compact per-day counters for one entity, kept far beyond the raw event window.
+
+    ``days`` holds sorted local date ordinals; ``buckets`` the matching
+    ``[taken, skipped, snoozed, expected]`` counters. The first bucket marks the
+    day tracking started, so period statistics never expect doses before it.
+    """
+
+    __slots__ = ("days", "buckets")
+
+    def __init__(self, days: List[int] | None = None, buckets: List[List[int]] | None = None) -> None:
+        self.days: List[int] = days if days is not None else []
+        self.buckets: List[List[int]] = buckets if buckets is not None else []
+
+    def bucket(self, day: int, expected: int = EXPECTED_UNKNOWN) -> List[int]:
+        if self.days and self.days[-1] == day:
+            return self.buckets[-1]
+        pos = bisect_left(self.days, day)
+        if pos < len(self.days) and self.days[pos] == day:
+            return self.buckets[pos]
+        bucket = [0, 0, 0, expected]
+        self.days.insert(pos, day)
+        self.buckets.insert(pos, bucket)
+        return bucket
+
+    def count(self, day: int, code: int, expected: int = EXPECTED_UNKNOWN) -> None:
+        bucket = self.bucket(day, expected)
+        if bucket[_R_EXPECTED] == EXPECTED_UNKNOWN:
+            bucket[_R_EXPECTED] = expected
+        if code == CODE_TAKEN:
+            bucket[_R_TAKEN] += 1
+        elif code == CODE_SKIPPED:
+            bucket[_R_SKIPPED] += 1
+        elif code == CODE_SNOOZED:
+            bucket[_R_SNOOZED] += 1
+
+    def drop_before(self, day: int) -> bool:
+        cut = bisect_left(self.days, day)
+        if cut <= 0:
+            return False
+        del self.days[:cut]
+        del self.buckets[:cut]
+        return True
+
+    def totals(self, first: int, last: int, doses_per_day: int) -> Dict[str, int]:
+        """Sum counters for days ``first``..``last`` (inclusive)."""
+        if not self.days:
+            return {"taken": 0, "skipped": 0, "snoozed": 0, "expected": 0}
+        # Days before tracking started are never expected
+        taken, skipped, snoozed, expected = sum_rollups(
+            self.days, self.buckets, max(first, self.days[0]), last, doses_per_day
+        )
+        return {"taken": taken, "skipped": skipped, "snoozed": snoozed, "expected": expected}
+
+    def as_dict(self) -> Dict[str, List[int]]:
+        return {date.fromordinal(day).isoformat(): bucket for day, bucket in zip(self.days, self.buckets)}
+
+
+@dataclass
+class SummaryRows:
+    """What one medication's statistics are computed from.
+
+    ``days``/``buckets`` are the rollups from the requested first day on, as in
+    ``_DayRollup``; ``tracking_start`` is the first day with a rollup at all and
+    ``recent`` the raw event counts since the requested instant. Buckets may be
+    the backend's own lists, so read them before yielding to the event loop.
+    """
+
+    tracking_start: int | None
+    days: List[int]
+    buckets: List[List[int]]
+    recent: Dict[str, int]
+    doses_per_day: int
+
+    def totals(self, first: int, last: int) -> Tuple[int, int, int, int]:
+        """Taken, skipped, snoozed and expected for days ``first``..``last``, as ``sum_rollups`` counts them.
+
+        Callers clamp ``first`` to ``tracking_start``; the rollups only cover
+        the days from the requested first day on.
+        """
+        return sum_rollups(self.days, self.buckets, first, last, self.doses_per_day)
+
+
+def decode_document(data: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any], int]:
+    """Validate a stored history document; safe to run in the executor.
+
+    Returns per-entity event columns as ``(ts list, codes bytes)`` and rollups
+    as ``(day ordinals, buckets)``, both sorted, plus the refill records and
+    the journal sequence. Malformed entities and days are dropped.
+    """
+    events: Dict[str, Tuple[List[int], bytes]] = {}
+    for eid, columns in (data.get("events") or {}).items():
+        try:
+            ts = [int(v) for v in columns["ts"]]
+            codes = bytes(map(int, columns["codes"]))
+        except (KeyError, TypeError, ValueError, OverflowError):
+            continue
+        if len(ts) != len(codes):
+            continue
+        if any(a > b for a, b in zip(ts, ts[1:])):
+            order = sorted(range(len(ts)), key=ts.__getitem__)
+            ts = [ts[i] for i in order]
+            codes = bytes(codes[i] for i in order)
+        events[eid] = (ts, codes)
+    rollups: Dict[str, Tuple[List[int], List[List[int]]]] = {}
+    for eid, days in (data.get("rollups") or {}).items():
+        if not isinstance(days, dict):
+            continue
+        parsed: Dict[int, List[int]] = {}
+        for day_iso, counters in days.items():
+            try:
+                bucket = [int(v) for v in counters]
+                if len(bucket) == 4:
+                    parsed[date.fromisoformat(day_iso).toordinal()] = bucket
+            except (TypeError, ValueError):
+                continue
+        ordered = sorted(parsed)
+        rollups[eid] = (ordered, [parsed[day] for day in ordered])
+    try:
+        journal_seq = int(data.get("journal_seq", 0) or 0)
+    except (TypeError, ValueError):
+        journal_seq = 0
+    return events, rollups, validate_refill(data.get("refill", {})), journal_seq
+
+
+def validate_refill(refill: Any) -> Dict[str, Dict[str, Any]]:
+    """Return well-formed refill records from stored data."""
+    out: Dict[str, Dict[str, Any]] = {}
+    if not isinstance(refill, dict):
+        return out
+    for eid, info in refill.items():
+        if not isinstance(info, dict):
+            continue
+        remaining = info.get("remaining")
+        threshold = info.get("threshold")
+        units = info.get("units_per_intake")
+        alerted = info.get("alerted", False)
+        try:
+            if remaining is None or threshold is None or units is None:
+                continue
+            out[eid] = {
+                "remaining": int(remaining),
+                "threshold": int(threshold),
+                "units_per_intake": int(units),
+                "alerted": bool(alerted),
+            }
+        except (TypeError, ValueError):
+            continue
+    return out
+
+
+class HistoryBackend:
+    """Storage and query interface behind :class:`HistoryManager`.
+
+    Backends own the events, per-day rollups and refill records. Queries are
+    coroutines so that backends doing I/O can run them in an executor.
+    """
 
-class HistoryManager:
     def __init__(self, hass: HomeAssistant) -> None:
         self.hass = hass
-        self._store: Store = Store(hass, HISTORY_STORE_VERSION, HISTORY_STORE_KEY)
-        self._events: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
-        self._refill: Dict[str, Dict[str, Any]] = {}
+        # Refill records are small and read synchronously by the sensors
+        self.refill: Dict[str, Dict[str, Any]] = {}
+        self.doses_per_day: Dict[str, int] = {}
+        # Raw-event retention per entity as (days, max_events)
+        self.retention: Dict[str, tuple[int, int]] = {}
+        # Days whose rollups already counted events when the running import first
+        # saw the entity; events past raw retention are only counted on other days
+        self.import_counted_days: Dict[str, Set[int]] = {}
+
+    def retention_for(self, entity_id: str) -> tuple[int, int]:
+        return self.retention.get(entity_id, (DEFAULT_HISTORY_DAYS, DEFAULT_HISTORY_MAX_EVENTS))
+
+    async def async_load(self) -> None:
+        raise NotImplementedError
+
+    async def async_flush(self) -> None:
+        """Persist anything still pending."""
+
+    async def async_close(self) -> None:
+        await self.async_flush()
+
+    async def async_record(self, entity_id: str, status: str, timestamp_iso: str) -> None:
+        await self.async_record_many([(entity_id, status, timestamp_iso)])
+
+    async def async_record_many(self, records: List[Tuple[str, str, str]]) -> None:
+        """Store several ``(entity_id, status, timestamp_iso)`` events with one write."""
+        raise NotImplementedError
+
+    async def async_set_refill(self, entity_id: str, info: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    async def async_set_expected(self, entity_id: str, day: int, doses_per_day: int) -> None:
+        """Stamp the expected dose count on a day's rollup."""
+        raise NotImplementedError
+
+    async def async_maintenance(self) -> None:
+        """Enforce retention for all entities."""
+
+    async def async_recent(self, entity_id: str, limit: int) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def async_events(
+        self, entity_id: str, start: float | None, end: float | None, limit: int
+    ) -> List[Tuple[float, Dict[str, Any]]]:
+        """Up to ``limit`` ``(epoch, event)`` pairs within ``[start, end]``, newest first."""
+        raise NotImplementedError
+
+    async def async_counts_between(self, entity_id: str, start: float | None, end: float | None) -> Dict[str, int]:
+        raise NotImplementedError
+
+    async def async_period_counts(self, entity_id: str, first_day: int, last_day: int) -> Dict[str, int]:
+        raise NotImplementedError
+
+    async def async_summary_rows(self, entity_ids: List[str], first_day: int, since: float) -> Dict[str, SummaryRows]:
+        raise NotImplementedError
+
+    async def async_stats(self) -> Dict[str, Any]:
+        """Size of the stored history, for diagnostics."""
+        return {}
+
+    async def async_entity_ids(self) -> List[str]:
+        """Entities with stored events."""
+        raise NotImplementedError
+
+    async def async_event_chunk(
+        self, entity_id: str, start: float | None, end: float | None, skip: int, limit: int
+    ) -> Tuple[List[float], bytes]:
+        """Up to ``limit`` events within ``[start, end]``, oldest first, past the first ``skip``.
+
+        Returned as columns of epoch seconds and status codes.
+        """
+        raise NotImplementedError
+
+    async def async_import_events(self, records: List[Tuple[str, int, int]]) -> List[Tuple[str, int, int]]:
+        """Merge ``(entity_id, epoch, code)`` events, skipping ones already stored.
+
+        Events past the entity's raw-event retention are only counted in the
+        day rollups, on days that had no counted events when the import began;
+        events past the rollup window are skipped. Returns the events added;
+        persisting may wait for the next flush.
+        """
+        raise NotImplementedError
+
+    def end_import(self) -> None:
+        """Forget the days counted before the import that just finished."""
+        self.import_counted_days.clear()
+
+
+class MemoryHistoryBackend(HistoryBackend):
+    """Keeps the history indexed in memory, persisted as JSON (optionally journaled)."""
+
+    def __init__(self, hass: HomeAssistant, save_delay: int = DEFAULT_SAVE_DELAY, journal: bool = False) -> None:
+        super().__init__(hass)
+        self._store: Store = HistoryStore(hass, HISTORY_STORE_VERSION, HISTORY_STORE_KEY)
+        self._events: Dict[str, _EventIndex] = {}
+        # Per-day rollups survive the raw-event prune and answer period statistics
+        self._rollups: Dict[str, _DayRollup] = {}
+        # Validated entities from the loaded document, moved into the two maps
+        # above the first time they are used
+        self._stored_events: Dict[str, Tuple[List[int], bytes]] = {}
+        self._stored_rollups: Dict[str, Tuple[List[int], List[List[int]]]] = {}
+        # The journal is always replayed on load (so switching backends never loses
+        # a tail), but only appended to when the journal backend is selected.
+        self._journal = HistoryJournal(hass, hass.config.path(STORAGE_DIR, f"{HISTORY_STORE_KEY}.journal"))
+        self._use_journal = journal
+        self._compact_lock = asyncio.Lock()
+        # Writes are coalesced: mutations mark the backend dirty and schedule a
+        # delayed save, so a burst of actions results in a single file rewrite.
+        self._save_delay = max(0, int(save_delay))
+        self._dirty = False
+        self._metrics = get_metrics(hass)
 
     async def async_load(self) -> None:
         data = await self._store.async_load() or {}
-        events = data.get("events", {})
-        refill = data.get("refill", {})
-        # Basic validation
-        for eid, lst in events.items():
-            if isinstance(lst, list):
-                self._events[eid] = [e for e in lst if isinstance(e, dict) and "status" in e and "timestamp" in e]
-        if isinstance(refill, dict):
-            out: Dict[str, Dict[str, Any]] = {}
-            for eid, info in refill.items():
-                if not isinstance(info, dict):
-                    continue
-                remaining = info.get("remaining")
-                threshold = info.get("threshold")
-                units = info.get("units_per_intake")
-                alerted = info.get("alerted", False)
-                try:
-                    if remaining is None or threshold is None or units is None:
-                        continue
-                    remaining = int(remaining)
-                    threshold = int(threshold)
-                    units = int(units)
-                    out[eid] = {
-                        "remaining": remaining,
-                        "threshold": threshold,
-                        "units_per_intake": units,
-                        "alerted": bool(alerted),
-                    }
-                except (TypeError, ValueError):
-                    continue
-            self._refill = out
-
-    async def _async_save(self) -> None:
-        await self._store.async_save({"events": self._events, "refill": self._refill})
+        start = time.monotonic()
+        # Validation walks every event, so it stays off the event loop
+        events, rollups, self.refill, journal_seq = await self.hass.async_add_executor_job(decode_document, data)
+        self._stored_events, self._stored_rollups = events, rollups
+        _LOGGER.debug(
+            "Validated history of %d entities (%d events) in %.3f s",
+            len(events), sum(len(codes) for _, codes in events.values()), time.monotonic() - start,
+        )
+        # Replay journal operations newer than the snapshot
+        ops = await self._journal.async_replay(journal_seq)
+        for op in ops:
+            self._apply_op(op)
+        if ops and not self._use_journal:
+            # Fold a leftover journal into the JSON document and drop it
+            self._dirty = True
+            await self._async_compact()
 
-    async def record(self, entity_id: str, status: str, timestamp_iso: str) -> None:
-        lst = self._events[entity_id]
-        lst.append({"status": status, "timestamp": timestamp_iso})
-        # prune to last 60 days or last 500 events
-        cutoff = dt_util.now() - timedelta(days=60)
-        pruned: List[Dict[str, Any]] = []
-        for e in lst[-500:]:
-            ts = dt_util.parse_datetime(e.get("timestamp"))
-            if ts is None:
-                continue
-            if ts >= cutoff:
-                pruned.append(e)
-        self._events[entity_id] = pruned
-        await self._async_save()
-        async_dispatcher_send(self.hass, SIGNAL_HISTORY_UPDATED, entity_id)
-
-    def recent(self, entity_id: str, limit: int = 20) -> List[Dict[str, Any]]:
-        return list(self._events.get(entity_id, []))[-limit:]
-
-    def counts_since(self, entity_id: str, since) -> Dict[str, int]:
-        taken = skipped = snoozed = 0
-        for e in self._events.get(entity_id, []):
-            ts = dt_util.parse_datetime(e.get("timestamp"))
-            if ts is None or ts < since:
-                continue
-            status = str(e.get("status"))
-            if status.lower().startswith("take"):
-                taken += 1
-            elif status.lower().startswith("skip"):
-                skipped += 1
-            elif status.lower().startswith("snooz"):
-                snoozed += 1
-        return {"taken": taken, "skipped": skipped, "snoozed": snoozed}
-
-    def counts_between(self, entity_id: str, start, end) -> Dict[str, int]:
-        taken = skipped = snoozed = 0
-        for e in self._events.get(entity_id, []):
-            ts = dt_util.parse_datetime(e.get("timestamp"))
-            if ts is None or ts < start or ts > end:
+    def _index(self, entity_id: str, create: bool = False) -> _EventIndex | None:
+        """The entity's events, materialized from the loaded document on first use."""
+        index = self._events.get(entity_id)
+        if index is None:
+            stored = self._stored_events.pop(entity_id, None)
+            if stored is not None or create:
+                index = self._events[entity_id] = _EventIndex(*(stored or ()))
+        return index
+
+    def _rollup(self, entity_id: str, create: bool = False) -> _DayRollup | None:
+        """The entity's day rollups, materialized from the loaded document on first use."""
+        rollup = self._rollups.get(entity_id)
+        if rollup is None:
+            stored = self._stored_rollups.pop(entity_id, None)
+            if stored is not None or create:
+                rollup = self._rollups[entity_id] = _DayRollup(*(stored or ()))
+        return rollup
+
+    def _data_to_save(self) -> Dict[str, Any]:
+        # Called by the store when the (possibly delayed) write happens
+        self._dirty = False
+        events = {eid: index.as_dict() for eid, index in self._events.items()}
+        events.update((eid, event_columns(ts, codes)) for eid, (ts, codes) in self._stored_events.items())
+        rollups = {eid: rollup.as_dict() for eid, rollup in self._rollups.items()}
+        rollups.update((eid, _DayRollup(*stored).as_dict()) for eid, stored in self._stored_rollups.items())
+        return {
+            "events": events,
+            "refill": self.refill,
+            "rollups": rollups,
+            # Journal operations up to this sequence are contained in the snapshot
+            "journal_seq": self._journal.seq,
+        }
+
+    async def _async_save(self, *ops: Dict[str, Any]) -> None:
+        start = time.perf_counter()
+        self._dirty = True
+        if self._use_journal:
+            # One appended line per change; the snapshot is rewritten on compaction
+            for op in ops:
+                self._journal.append(op)
+            if self._journal.lines >= JOURNAL_COMPACT_LINES and not self._compact_lock.locked():
+                await self._async_compact()
+        elif self._save_delay <= 0:
+            await self.async_flush()
+        else:
+            self._store.async_delay_save(self._data_to_save, self._save_delay)
+        self._metrics.observe("history_save", start)
+
+    async def _async_compact(self) -> None:
+        """Write a fresh snapshot and drop the journal lines it contains."""
+        async with self._compact_lock:
+            data = self._data_to_save()
+            await self._store.async_save(data)
+            await self._journal.async_truncate(data["journal_seq"])
+
+    async def async_flush(self) -> None:
+        """Write pending changes now, cancelling any scheduled delayed save."""
+        if not self._dirty:
+            return
+        start = time.perf_counter()
+        if self._use_journal:
+            await self._async_compact()
+        else:
+            await self._store.async_save(self._data_to_save())
+        self._metrics.observe("history_flush", start)
+
+    def _apply_event(self, entity_id: str, ts: int, code: int) -> None:
+        index = self._index(entity_id, create=True)
+        index.add(ts, code)
+        expected = self.doses_per_day.get(entity_id, EXPECTED_UNKNOWN)
+        self._rollup(entity_id, create=True).count(local_day(ts), code, expected)
+        days, max_events = self.retention_for(entity_id)
+        index.trim_head(time.time() - days * 86400, max_events)
+
+    def _apply_op(self, op: Dict[str, Any]) -> None:
+        """Apply one replayed journal operation to the in-memory state."""
+        kind = op.get("op")
+        eid = op.get("id")
+        if not isinstance(eid, str):
+            return
+        try:
+            if kind == "event":
+                self._apply_event(eid, int(op["t"]), int(op["c"]))
+            elif kind == "refill":
+                self.refill.update(validate_refill({eid: op["info"]}))
+            elif kind == "expected":
+                self._rollup(eid, create=True).bucket(int(op["day"]))[_R_EXPECTED] = int(op["count"])
+        except (KeyError, TypeError, ValueError):
+            return
+
+    async def async_record_many(self, records: List[Tuple[str, str, str]]) -> None:
+        ops = []
+        for entity_id, status, timestamp_iso in records:
+            ts, code = record_epoch(timestamp_iso), status_code(status)
+            self._apply_event(entity_id, ts, code)
+            ops.append({"op": "event", "id": entity_id, "t": ts, "c": code})
+        await self._async_save(*ops)
+
+    async def async_set_refill(self, entity_id: str, info: Dict[str, Any]) -> None:
+        self.refill[entity_id] = info
+        await self._async_save({"op": "refill", "id": entity_id, "info": info})
+
+    async def async_set_expected(self, entity_id: str, day: int, doses_per_day: int) -> None:
+        bucket = self._rollup(entity_id, create=True).bucket(day)
+        if bucket[_R_EXPECTED] != doses_per_day:
+            bucket[_R_EXPECTED] = doses_per_day
+            await self._async_save({"op": "expected", "id": entity_id, "day": day, "count": doses_per_day})
+
+    async def async_maintenance(self) -> None:
+        now = dt_util.now()
+        changed = False
+        for eid, index in self._events.items():
+            days, max_events = self.retention_for(eid)
+            changed |= index.drop_before((now - timedelta(days=days)).timestamp(), max_events)
+        # Entities not used since the load are pruned in their stored form, so the
+        # hourly job does not materialize them
+        for eid, (ts, codes) in self._stored_events.items():
+            days, max_events = self.retention_for(eid)
+            cut = max(bisect_left(ts, (now - timedelta(days=days)).timestamp()), len(ts) - max_events)
+            if cut > 0:
+                self._stored_events[eid] = (ts[cut:], codes[cut:])
+                changed = True
+        oldest_day = now.date().toordinal() - HISTORY_ROLLUP_DAYS
+        for rollup in self._rollups.values():
+            changed |= rollup.drop_before(oldest_day)
+        for stored in self._stored_rollups.values():
+            # Wraps the stored lists and trims them in place
+            changed |= _DayRollup(*stored).drop_before(oldest_day)
+        if changed:
+            await self._async_save()
+
+    async def async_recent(self, entity_id: str, limit: int) -> List[Dict[str, Any]]:
+        index = self._index(entity_id)
+        if index is None:
+            return []
+        return [index.event(i) for i in range(max(0, len(index) - limit), len(index))]
+
+    async def async_events(
+        self, entity_id: str, start: float | None, end: float | None, limit: int
+    ) -> List[Tuple[float, Dict[str, Any]]]:
+        index = self._index(entity_id)
+        if index is None:
+            return []
+        lo = 0 if start is None else bisect_left(index.ts, start)
+        hi = len(index.ts) if end is None else bisect_right(index.ts, end)
+        first = max(lo, hi - limit)
+        return [(index.ts[i], index.event(i)) for i in range(hi - 1, first - 1, -1)]
+
+    async def async_counts_between(self, entity_id: str, start: float | None, end: float | None) -> Dict[str, int]:
+        index = self._index(entity_id)
+        if index is None:
+            return {"taken": 0, "skipped": 0, "snoozed": 0}
+        return index.counts(start, end)
+
+    async def async_period_counts(self, entity_id: str, first_day: int, last_day: int) -> Dict[str, int]:
+        rollup = self._rollup(entity_id)
+        if rollup is None:
+            return {"taken": 0, "skipped": 0, "snoozed": 0, "expected": 0}
+        return rollup.totals(first_day, last_day, self.doses_per_day.get(entity_id, 0))
+
+    async def async_summary_rows(self, entity_ids: List[str], first_day: int, since: float) -> Dict[str, SummaryRows]:
+        out: Dict[str, SummaryRows] = {}
+        for eid in entity_ids:
+            index = self._index(eid)
+            rollup = self._rollup(eid)
+            recent = index.counts(since, None) if index is not None else {"taken": 0, "skipped": 0, "snoozed": 0}
+            if rollup is None or not rollup.days:
+                out[eid] = SummaryRows(None, [], [], recent, self.doses_per_day.get(eid, 0))
                 continue
-            status = str(e.get("status"))
-            if status.lower().startswith("take"):
-                taken += 1
-            elif status.lower().startswith("skip"):
-                skipped += 1
-            elif status.lower().startswith("snooz"):
-                snoozed += 1
-        return {"taken": taken, "skipped": skipped, "snoozed": snoozed}
+            lo = bisect_left(rollup.days, first_day)
+            out[eid] = SummaryRows(
+                rollup.days[0], rollup.days[lo:], rollup.buckets[lo:], recent, self.doses_per_day.get(eid, 0)
+            )
+        return out
 
-    def get_refill(self, entity_id: str) -> Dict[str, Any] | None:
-        return self._refill.get(entity_id)
-
-    async def set_refill(self, entity_id: str, remaining: int, threshold: int, units_per_intake: int, alerted: bool = False) -> None:
-        self._refill[entity_id] = {
-            "remaining": int(remaining),
-            "threshold": int(threshold),
-            "units_per_intake": int(units_per_intake),
-            "alerted": bool(alerted),
+    async def async_stats(self) -> Dict[str, Any]:
+        return {
+            "entities": len(self._events.keys() | self._stored_events.keys()),
+            "materialized_entities": len(self._events),
+            "events_in_memory": sum(len(index) for index in self._events.values()),
+            "events_not_materialized": sum(len(codes) for _, codes in self._stored_events.values()),
+            "rollup_days": sum(len(r.days) for r in self._rollups.values())
+            + sum(len(days) for days, _ in self._stored_rollups.values()),
+            "journal_lines": self._journal.lines,
+            "unsaved_changes": self._dirty,
         }
-        await self._async_save()
 
-    async def adjust_refill(self, entity_id: str, *, remaining: int | None = None, threshold: int | None = None, units_per_intake: int | None = None, alerted: bool | None = None) -> None:
-        current = self._refill.get(entity_id) or {}
+    async def async_entity_ids(self) -> List[str]:
+        return [eid for eid, index in self._events.items() if len(index)] + [
+            eid for eid, (ts, _) in self._stored_events.items() if ts
+        ]
+
+    async def async_event_chunk(
+        self, entity_id: str, start: float | None, end: float | None, skip: int, limit: int
+    ) -> Tuple[List[float], bytes]:
+        index = self._index(entity_id)
+        if index is None:
+            return [], b""
+        lo = (0 if start is None else bisect_left(index.ts, start)) + skip
+        hi = min(len(index.ts) if end is None else bisect_right(index.ts, end), lo + limit)
+        return index.ts[lo:hi].tolist(), bytes(index.codes[lo:hi])
+
+    async def async_import_events(self, records: List[Tuple[str, int, int]]) -> List[Tuple[str, int, int]]:
+        by_entity: Dict[str, List[Tuple[int, int]]] = {}
+        for entity_id, ts, code in records:
+            by_entity.setdefault(entity_id, []).append((ts, code))
+        oldest_day = dt_util.now().date().toordinal() - HISTORY_ROLLUP_DAYS
+        added: List[Tuple[str, int, int]] = []
+        for entity_id, rows in by_entity.items():
+            index = self._index(entity_id, create=True)
+            rollup = self._rollup(entity_id, create=True)
+            counted = self.import_counted_days.get(entity_id)
+            if counted is None:
+                counted = self.import_counted_days[entity_id] = {
+                    day for day, bucket in zip(rollup.days, rollup.buckets) if any(bucket[:_R_EXPECTED])
+                }
+            days, max_events = self.retention_for(entity_id)
+            cutoff = time.time() - days * 86400
+            rows = sorted(set(rows))
+            older = [row for row in rows if row[0] < cutoff]
+            fresh = [row for row in rows if row[0] >= cutoff and not index.contains(*row)]
+            if fresh:
+                # One merge per entity and batch; per-event inserts would shift the columns each time
+                index.merge(fresh)
+                index.drop_before(cutoff, max_events)
+                floor = index.ts[0] if len(index) else float("inf")
+                older += [row for row in fresh if row[0] < floor]
+                fresh = [row for row in fresh if row[0] >= floor]
+            # A pruned event could not be recognized as a duplicate by a later import,
+            # so events past raw retention only count on days not counted before
+            older = [row for row in older if (day := local_day(row[0])) >= oldest_day and day not in counted]
+            for ts, code in merge(fresh, older):
+                rollup.count(local_day(ts), code)
+                added.append((entity_id, ts, code))
+        if added:
+            # Imports are written by the flush that ends them rather than journaled per event
+            self._dirty = True
+        return added
+
+
+class HistoryManager:
+    """Records adherence events and answers history queries through a backend."""
+
+    def __init__(self, hass: HomeAssistant, save_delay: int = DEFAULT_SAVE_DELAY, backend: str = BACKEND_JSON) -> None:
+        self.hass = hass
+        if backend == BACKEND_SQLITE:
+            from .history_sqlite import SqliteHistoryBackend
+
+            self._backend: HistoryBackend = SqliteHistoryBackend(hass)
+        else:
+            self._backend = MemoryHistoryBackend(hass, save_delay, journal=backend == BACKEND_JOURNAL)
+        self._unsub_stop: CALLBACK_TYPE | None = None
+        self._unsub_maintenance: CALLBACK_TYPE | None = None
+        self._load_task: asyncio.Task[None] | None = None
+        self._metrics = get_metrics(hass)
+        self._versions: Dict[str, int] = {}
+        # Slots that close unmatched change the statistics like new events do
+        self.ledger = DoseLedger(hass, self._announce_updated)
+        self.forecast = RefillForecast(hass)
+
+    def version(self, entity_id: str) -> int:
+        """Counter bumped on every change to the entity's history; keys cached statistics."""
+        return self._versions.get(entity_id, 0)
+
+    @callback
+    def async_start_load(self) -> None:
+        """Start loading the history in the background.
+
+        Queries and writes wait for the load to finish, so entities can be set
+        up meanwhile instead of waiting for a large history file.
+        """
+        if self._load_task is None:
+            self._load_task = self.hass.async_create_task(self._async_load(), "medication_reminder history load")
+
+    async def async_load(self) -> None:
+        """Load the history and wait until it is ready."""
+        self.async_start_load()
+        await self._async_ready()
+
+    async def _async_ready(self) -> None:
+        """Wait for the background load; raises if it failed."""
+        if self._load_task is None:
+            self.async_start_load()
+        assert self._load_task is not None
+        # Shielded so a cancelled caller does not cancel the shared load
+        await asyncio.shield(self._load_task)
+
+    async def _async_load(self) -> None:
+        start = time.monotonic()
+        await self._backend.async_load()
+        await self.ledger.async_load()
+        await self.forecast.async_load()
+        _LOGGER.debug("History loaded by %s in %.3f s", type(self._backend).__name__, time.monotonic() - start)
+        if self._unsub_stop is None:
+            self._unsub_stop = self.hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, self._async_handle_stop)
+        if self._unsub_maintenance is None:
+            self._unsub_maintenance = async_track_time_interval(
+                self.hass, self._async_maintenance, HISTORY_MAINTENANCE_INTERVAL
+            )
+
+    async def async_unload(self) -> None:
+        """Flush pending writes, close the backend and stop background jobs."""
+        if self._load_task is not None and not self._load_task.done():
+            # Close the backend only once it is no longer being loaded
+            with suppress(Exception):
+                await asyncio.shield(self._load_task)
+        if self._unsub_stop is not None:
+            self._unsub_stop()
+            self._unsub_stop = None
+        if self._unsub_maintenance is not None:
+            self._unsub_maintenance()
+            self._unsub_maintenance = None
+        await self.ledger.async_unload()
+        await self.forecast.async_flush()
+        await self._backend.async_close()
+
+    async def _async_handle_stop(self, _event: Event) -> None:
+        self._unsub_stop = None
+        await self.ledger.async_unload()
+        await self.forecast.async_flush()
+        await self._backend.async_close()
+
+    async def async_flush(self) -> None:
+        """Write pending changes now."""
+        await self.ledger.async_flush()
+        await self.forecast.async_flush()
+        await self._backend.async_flush()
+
+    async def _async_maintenance(self, _now: datetime | None = None) -> None:
+        """Enforce retention for all entities; runs periodically in the background."""
+        await self._backend.async_maintenance()
+
+    async def record(self, entity_id: str, status: str, timestamp_iso: str) -> None:
+        await self._async_ready()
+        start = time.perf_counter()
+        await self._backend.async_record(entity_id, status, timestamp_iso)
+        self._announce([(entity_id, status, timestamp_iso)])
+        self._metrics.observe("history_record", start)
+        self._metrics.increment("events_recorded")
+
+    async def record_many(self, records: Iterable[Tuple[str, str, str]]) -> None:
+        """Record a batch of ``(entity_id, status, timestamp_iso)`` events.
+
+        The batch is persisted with a single write and announced once per
+        affected entity_id.
+        """
+        records = list(records)
+        if not records:
+            return
+        await self._async_ready()
+        start = time.perf_counter()
+        await self._backend.async_record_many(records)
+        self._announce(records)
+        self._metrics.observe("history_record", start)
+        self._metrics.increment("events_recorded", len(records))
+
+    @callback
+    def _announce(self, records: List[Tuple[str, str, str]]) -> None:
+        events = [(eid, record_epoch(iso), status_code(status)) for eid, status, iso in records]
+        self.ledger.match(events)
+        self.forecast.observe(events)
+        self._announce_updated({eid for eid, _, _ in records})
+        async_dispatcher_send(
+            self.hass,
+            SIGNAL_HISTORY_EVENTS,
+            # Same form the backends return, so clients can dedupe against queries
+            [(eid, event_dict(ts, code)) for eid, ts, code in events],
+        )
+
+    async def async_stats(self) -> Dict[str, Any]:
+        """Backend name and stored-history sizes; does not wait for a load in progress."""
+        stats: Dict[str, Any] = {"backend": type(self._backend).__name__}
+        loaded = self._load_task is not None and self._load_task.done() and not self._load_task.exception()
+        stats["loaded"] = loaded
+        if loaded:
+            stats.update(await self._backend.async_stats())
+            stats["dose_ledger"] = self.ledger.stats()
+            stats["refill_forecast"] = self.forecast.stats()
+        return stats
+
+    @callback
+    def _announce_updated(self, entity_ids: Set[str]) -> None:
+        # The coordinator batches the refresh and calls only these medications' sensors
+        for eid in entity_ids:
+            self._versions[eid] = self._versions.get(eid, 0) + 1
+        async_dispatcher_send(self.hass, SIGNAL_HISTORY_UPDATED, entity_ids)
+
+    async def async_entity_ids(self) -> List[str]:
+        """Entities with stored events, configured or not."""
+        await self._async_ready()
+        return await self._backend.async_entity_ids()
+
+    async def async_iter_events(
+        self, entity_id: str, start: datetime | None, end: datetime | None, chunk: int = HISTORY_TRANSFER_CHUNK
+    ) -> AsyncIterator[Tuple[List[float], bytes]]:
+        """Events within ``[start, end]``, oldest first, as ``(epochs, codes)`` chunks.
+
+        Only one chunk is held at a time, so a full export never builds the
+        whole history of an entity.
+        """
+        await self._async_ready()
+        after = start.timestamp() if start else None
+        end_ts = end.timestamp() if end else None
+        skip = 0
+        while True:
+            ts, codes = await self._backend.async_event_chunk(entity_id, after, end_ts, skip, chunk)
+            if ts:
+                yield ts, codes
+            if len(ts) < chunk:
+                return
+            # Resume at the last instant, past the events of it already returned
+            tied = len(ts) - bisect_left(ts, ts[-1])
+            skip = skip + tied if ts[-1] == after else tied
+            after = ts[-1]
+
+    async def async_import_events(self, records: List[Tuple[str, int, int]]) -> int:
+        """Merge a batch of ``(entity_id, epoch, code)`` events; returns how many were added.
+
+        Events already stored are skipped, so importing a file twice is
+        harmless; events past the medication's raw-event retention only count
+        in the day rollups. Nothing is announced or flushed; call
+        :meth:`async_import_done` after the last batch.
+        """
+        if not records:
+            return 0
+        await self._async_ready()
+        added = await self._backend.async_import_events(records)
+        # Matching skipped duplicates would count them as extra taps
+        self.ledger.match(added)
+        return len(added)
+
+    async def async_import_done(self, entity_ids: Set[str]) -> None:
+        """Persist an import and let the affected sensors refresh."""
+        self._backend.end_import()
+        await self._backend.async_flush()
+        self._announce_updated(entity_ids)
+
+    @callback
+    def set_retention(self, entity_id: str, days: int, max_events: int) -> None:
+        """Set how long raw events are kept for an entity; enforced by maintenance."""
+        self._backend.retention[entity_id] = (max(1, int(days)), max(1, int(max_events)))
+
+    @callback
+    def set_schedule(self, entity_id: str, doses_per_day: int) -> None:
+        """Register how many doses are expected per day.
+
+        Queries use it right away; today's rollup is stamped once the history
+        has loaded.
+        """
+        doses_per_day = max(0, int(doses_per_day))
+        self._backend.doses_per_day[entity_id] = doses_per_day
+        self.hass.async_create_task(self._async_stamp_expected(entity_id, doses_per_day))
+
+    @callback
+    def set_dose_times(self, entity_id: str, times: List[str]) -> None:
+        """Register the dose times the ledger generates slots for; no times for a removed medication."""
+        self.ledger.set_times(entity_id, times)
+
+    async def _async_stamp_expected(self, entity_id: str, doses_per_day: int) -> None:
+        await self._async_ready()
+        await self._backend.async_set_expected(entity_id, dt_util.now().date().toordinal(), doses_per_day)
+        # Today's expected doses changed, so do the statistics
+        self._announce_updated({entity_id})
+
+    async def async_recent(self, entity_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+        await self._async_ready()
+        return await self._backend.async_recent(entity_id, limit)
+
+    async def async_events_page(
+        self, entity_id: str, start: datetime | None, end: datetime | None, limit: int, cursor: str | None = None
+    ) -> Tuple[List[Dict[str, Any]], str | None]:
+        """One page of events within ``[start, end]``, newest first.
+
+        Returns the events and a cursor for the next (older) page, or None when
+        there is nothing left. Raises ValueError for a malformed cursor.
+        """
+        await self._async_ready()
+        start_ts = start.timestamp() if start else None
+        end_ts = end.timestamp() if end else None
+        cursor_ts, skip = None, 0
+        if cursor:
+            raw_ts, _, raw_skip = cursor.partition(":")
+            cursor_ts, skip = float(raw_ts), int(raw_skip or 0)
+            end_ts = cursor_ts if end_ts is None else min(end_ts, cursor_ts)
+        rows = await self._backend.async_events(entity_id, start_ts, end_ts, skip + limit + 1)
+        # Events sharing the cursor's instant may already have been returned
+        n = 0
+        while n < skip and n < len(rows) and rows[n][0] == cursor_ts:
+            n += 1
+        rows = rows[n:]
+        page = rows[:limit]
+        if len(rows) <= limit or not page:
+            return [event for _, event in page], None
+        last_ts = page[-1][0]
+        same = sum(1 for ts, _ in page if ts == last_ts) + (n if last_ts == cursor_ts else 0)
+        return [event for _, event in page], f"{last_ts!r}:{same}"
+
+    async def async_counts_since(self, entity_id: str, since: datetime) -> Dict[str, int]:
+        return await self._async_counts(entity_id, since.timestamp(), None)
+
+    async def async_counts_between(self, entity_id: str, start: datetime, end: datetime) -> Dict[str, int]:
+        return await self._async_counts(entity_id, start.timestamp(), end.timestamp())
+
+    async def _async_counts(self, entity_id: str, start: float, end: float | None) -> Dict[str, int]:
+        await self._async_ready()
+        began = time.perf_counter()
+        counts = await self._backend.async_counts_between(entity_id, start, end)
+        self._metrics.observe("history_counts_between", began)
+        return counts
+
+    async def async_period_counts(self, entity_id: str, days: int) -> Dict[str, int]:
+        """Taken/skipped/snoozed/expected for the last ``days`` calendar days, today included."""
+        await self._async_ready()
+        last = dt_util.now().date().toordinal()
+        return await self._backend.async_period_counts(entity_id, last - days + 1, last)
+
+    async def async_summary_rows(self, entity_ids: List[str], days: int, since: datetime) -> Dict[str, SummaryRows]:
+        """Rollups of the last ``days`` calendar days and event counts since ``since``, for many entities at once."""
+        await self._async_ready()
+        first_day = dt_util.now().date().toordinal() - days + 1
+        return await self._backend.async_summary_rows(list(entity_ids), first_day, since.timestamp())
+
+    async def async_period_summary(self, entity_id: str, days: int) -> Dict[str, int]:
+        """Taken/skipped/snoozed/missed/expected for the last ``days`` calendar days."""
+        today = dt_util.now().date()
+        return await self.async_range_summary(entity_id, today - timedelta(days=days - 1), today)
+
+    async def async_range_summary(self, entity_id: str, first: date, last: date) -> Dict[str, int]:
+        """Taken/skipped/snoozed/missed/expected and on-time/late doses for the local days ``first``..``last``.
+
+        Missed doses are the dose-ledger slots that closed unmatched; days
+        before the ledger covers estimate them as expected minus taken and
+        skipped. On-time and late doses are only known for covered days.
+        """
+        await self._async_ready()
+        first_day, last_day = first.toordinal(), last.toordinal()
+        counts = await self._backend.async_period_counts(entity_id, first_day, last_day)
+        expected = counts.get("expected", 0)
+        taken = counts.get("taken", 0)
+        skipped = counts.get("skipped", 0)
+        covered_from = self.ledger.covered_from(entity_id)
+        slots = self.ledger.day_counts(entity_id, first_day, last_day) or {}
+        if covered_from is None or covered_from > last_day:
+            missed = max(0, expected - taken - skipped)
+        else:
+            missed = self.ledger.day_counts(entity_id, max(first_day, covered_from), last_day)["missed"]
+            if covered_from > first_day:
+                before = await self._backend.async_period_counts(entity_id, first_day, covered_from - 1)
+                missed += max(0, before.get("expected", 0) - before.get("taken", 0) - before.get("skipped", 0))
+        return {
+            "taken": taken,
+            "skipped": skipped,
+            "snoozed": counts.get("snoozed", 0),
+            "missed": missed,
+            "expected": expected,
+            "on_time": slots.get("on_time", 0),
+            "late": slots.get("late", 0),
+        }
+
+    def get_refill(self, entity_id: str) -> Dict[str, Any] | None:
+        """Refill record as currently known; None until the history has loaded."""
+        return self._backend.refill.get(entity_id)
+
+    async def async_get_refill(self, entity_id: str) -> Dict[str, Any] | None:
+        """Refill record, waiting for the history to load."""
+        await self._async_ready()
+        return self._backend.refill.get(entity_id)
+
+    def refill_forecast(self, entity_id: str) -> Dict[str, Any] | None:
+        """Units used per day, days of supply and run-out time; None without refill tracking."""
+        info = self.get_refill(entity_id)
+        if not info:
+            return None
+        now = dt_util.now()
+        return project(
+            int(info.get("remaining", 0)),
+            int(info.get("units_per_intake", 1)),
+            self.forecast.rate(entity_id, now.timestamp()),
+            self._backend.doses_per_day.get(entity_id, 0),
+            now,
+        )
+
+    async def _async_store_refill(self, entity_id: str, info: Dict[str, Any]) -> None:
+        await self._async_ready()
+        await self._backend.async_set_refill(entity_id, info)
+        async_dispatcher_send(self.hass, SIGNAL_REFILL_UPDATED, entity_id)
+
+    async def set_refill(
+        self, entity_id: str, remaining: int, threshold: int, units_per_intake: int, alerted: bool = False
+    ) -> None:
+        await self._async_store_refill(
+            entity_id,
+            {
+                "remaining": int(remaining),
+                "threshold": int(threshold),
+                "units_per_intake": int(units_per_intake),
+                "alerted": bool(alerted),
+            },
+        )
+
+    async def adjust_refill(
+        self,
+        entity_id: str,
+        *,
+        remaining: int | None = None,
+        threshold: int | None = None,
+        units_per_intake: int | None = None,
+        alerted: bool | None = None,
+    ) -> None:
+        current = await self.async_get_refill(entity_id) or {}
         new = {
             "remaining": int(remaining if remaining is not None else current.get("remaining", 0)),
             "threshold": int(threshold if threshold is not None else current.get("threshold", 0)),
-            "units_per_intake": int(units_per_intake if units_per_intake is not None else current.get("units_per_intake", 1)),
+            "units_per_intake": int(
+                units_per_intake if units_per_intake is not None else current.get("units_per_intake", 1)
+            ),
             "alerted": bool(alerted if alerted is not None else current.get("alerted", False)),
         }
-        self._refill[entity_id] = new
-        await self._async_save()
+        await self._async_store_refill(entity_id, new)
 
     async def decrement_refill(self, entity_id: str, amount: int) -> Dict[str, Any] | None:
-        info = self._refill.get(entity_id)
+        info = await self.async_get_refill(entity_id)
         if not info:
             return None
         info = dict(info)
         info["remaining"] = max(0, int(info.get("remaining", 0)) - int(amount))
-        self._refill[entity_id] = info
-        await self._async_save()
+        await self._async_store_refill(entity_id, info)
         return info
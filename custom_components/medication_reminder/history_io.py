@@ -0,0 +1,226 @@
+"""History export and import files for the export_history/import_history services.
+
+Files are CSV (``entity_id,timestamp,status`` with a header row) or JSON
+lines with the same keys; timestamps are ISO 8601 in UTC. Both directions
+stream in chunks of ``HISTORY_TRANSFER_CHUNK`` events, with all file I/O
+and row formatting or parsing in the executor, so neither the event loop nor
+memory use grows with the size of the history.
+"""
+from __future__ import annotations
+
+import csv
+import json
+import logging
+import os
+from datetime import datetime
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+from homeassistant.core import HomeAssistant, valid_entity_id
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.util import dt as dt_util
+
+from .const import HISTORY_TRANSFER_CHUNK, HISTORY_TRANSFER_FORMATS
+from .history import HistoryManager, event_dict, parse_epoch, status_code
+
+_LOGGER = logging.getLogger(__name__)
+
+FIELDS = ["entity_id", "timestamp", "status"]
+
+
+def transfer_format(path: str, fmt: str | None) -> str:
+    """The requested format, else guessed from the file extension."""
+    if fmt:
+        if fmt not in HISTORY_TRANSFER_FORMATS:
+            raise HomeAssistantError(f"format must be one of {', '.join(HISTORY_TRANSFER_FORMATS)}")
+        return fmt
+    return "jsonl" if path.lower().endswith((".jsonl", ".ndjson")) else "csv"
+
+
+def resolve_path(hass: HomeAssistant, path: str) -> str:
+    """Absolute path for ``path``; relative paths are inside the config directory.
+
+    Paths outside the config directory must be listed in
+    ``allowlist_external_dirs``.
+    """
+    full = os.path.abspath(hass.config.path(path))
+    config_dir = os.path.abspath(hass.config.config_dir)
+    if os.path.commonpath([full, config_dir]) != config_dir and not hass.config.is_allowed_path(full):
+        raise HomeAssistantError(f"{path} is outside the configuration directory and not in allowlist_external_dirs")
+    return full
+
+
+def parse_time(raw: Any, key: str) -> datetime | None:
+    """Parse an optional service datetime; naive values are local time."""
+    if raw is None or raw == "":
+        return None
+    parsed = raw if isinstance(raw, datetime) else dt_util.parse_datetime(str(raw))
+    if parsed is None:
+        raise HomeAssistantError(f"Invalid {key}: {raw}")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=dt_util.DEFAULT_TIME_ZONE)
+    return parsed
+
+
+class _Writer:
+    """Writes to ``<path>.tmp`` and moves it into place once complete."""
+
+    def __init__(self, path: str, fmt: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._tmp = f"{path}.tmp"
+        self._fh = open(self._tmp, "w", encoding="utf-8", newline="")
+        self._csv = csv.writer(self._fh) if fmt == "csv" else None
+        if self._csv is not None:
+            self._csv.writerow(FIELDS)
+
+    def write(self, entity_id: str, ts: List[float], codes: bytes) -> None:
+        events = (event_dict(t, code) for t, code in zip(ts, codes))
+        if self._csv is not None:
+            self._csv.writerows((entity_id, e["timestamp"], e["status"]) for e in events)
+        else:
+            self._fh.writelines(json.dumps({"entity_id": entity_id, **e}) + "\n" for e in events)
+
+    def commit(self) -> None:
+        self._fh.close()
+        os.replace(self._tmp, self.path)
+
+    def abort(self) -> None:
+        self._fh.close()
+        os.remove(self._tmp)
+
+
+class _Reader:
+    """Reads a history file a chunk of rows at a time."""
+
+    def __init__(
+        self, path: str, fmt: str, entity_ids: Set[str] | None, start: float | None, end: float | None
+    ) -> None:
+        self._fh = open(path, encoding="utf-8", newline="")
+        self._rows: Iterable[Any] = csv.DictReader(self._fh) if fmt == "csv" else self._fh
+        self._json = fmt != "csv"
+        self._entity_ids = entity_ids
+        self._start = start
+        self._end = end
+        self.read = 0
+        self.invalid = 0
+        self.filtered = 0
+
+    def _parse(self, row: Any) -> Tuple[str, int, int] | None:
+        if self._json and not row.strip():
+            return None
+        self.read += 1
+        if self._json:
+            try:
+                row = json.loads(row)
+            except ValueError:
+                self.invalid += 1
+                return None
+        if not isinstance(row, dict):
+            self.invalid += 1
+            return None
+        entity_id = row.get("entity_id")
+        ts = parse_epoch(row.get("timestamp"))
+        if not isinstance(entity_id, str) or not valid_entity_id(entity_id) or ts is None or not row.get("status"):
+            self.invalid += 1
+            return None
+        if (
+            (self._entity_ids is not None and entity_id not in self._entity_ids)
+            or (self._start is not None and ts < self._start)
+            or (self._end is not None and ts > self._end)
+        ):
+            self.filtered += 1
+            return None
+        return entity_id, int(ts), status_code(row["status"])
+
+    def chunk(self) -> List[Tuple[str, int, int]] | None:
+        """The next valid, matching records; None once the file is exhausted."""
+        rows = list(islice(self._rows, HISTORY_TRANSFER_CHUNK))
+        if not rows:
+            return None
+        return [record for record in map(self._parse, rows) if record is not None]
+
+    def close(self) -> None:
+        self._fh.close()
+
+
+async def async_export_history(
+    hass: HomeAssistant,
+    history: HistoryManager,
+    entity_ids: List[str],
+    path: str,
+    fmt: str,
+    start: datetime | None,
+    end: datetime | None,
+) -> Dict[str, Any]:
+    """Write the events of ``entity_ids`` within ``[start, end]`` to ``path``."""
+    try:
+        writer = await hass.async_add_executor_job(_Writer, path, fmt)
+    except OSError as err:
+        raise HomeAssistantError(f"Cannot write {path}: {err}") from err
+    events = 0
+    exported: List[str] = []
+    try:
+        for entity_id in entity_ids:
+            count = 0
+            async for ts, codes in history.async_iter_events(entity_id, start, end):
+                await hass.async_add_executor_job(writer.write, entity_id, ts, codes)
+                count += len(ts)
+            if count:
+                exported.append(entity_id)
+                events += count
+        await hass.async_add_executor_job(writer.commit)
+    except Exception as err:
+        await hass.async_add_executor_job(writer.abort)
+        if isinstance(err, OSError):
+            raise HomeAssistantError(f"Cannot write {path}: {err}") from err
+        raise
+    _LOGGER.debug("Exported %d events of %d entities to %s", events, len(exported), path)
+    return {"path": path, "format": fmt, "events": events, "entity_ids": exported}
+
+
+async def async_import_history(
+    hass: HomeAssistant,
+    history: HistoryManager,
+    path: str,
+    fmt: str,
+    entity_ids: Set[str] | None,
+    start: datetime | None,
+    end: datetime | None,
+) -> Dict[str, Any]:
+    """Merge the events of a history file.
+
+    Events already stored are skipped. Events older than the medication's
+    raw-event retention (``history_days`` / ``history_max_events``) only count
+    in the per-day statistics, on days that had none before the import.
+    """
+    try:
+        reader = await hass.async_add_executor_job(
+            _Reader, path, fmt, entity_ids, start.timestamp() if start else None, end.timestamp() if end else None
+        )
+    except OSError as err:
+        raise HomeAssistantError(f"Cannot read {path}: {err}") from err
+    imported = 0
+    matched = 0
+    touched: Set[str] = set()
+    try:
+        while (records := await hass.async_add_executor_job(reader.chunk)) is not None:
+            matched += len(records)
+            imported += await history.async_import_events(records)
+            touched.update(eid for eid, _, _ in records)
+    except (OSError, UnicodeDecodeError, csv.Error) as err:
+        raise HomeAssistantError(f"Cannot read {path}: {err}") from err
+    finally:
+        await hass.async_add_executor_job(reader.close)
+        # Whatever was merged before a failure is kept and persisted
+        await history.async_import_done(touched)
+    _LOGGER.debug("Imported %d of %d events from %s", imported, reader.read, path)
+    return {
+        "path": path,
+        "read": reader.read,
+        "imported": imported,
+        "skipped": matched - imported,
+        "filtered": reader.filtered,
+        "invalid": reader.invalid,
+        "entity_ids": sorted(touched),
+    }
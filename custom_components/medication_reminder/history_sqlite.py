@@ -0,0 +1,494 @@
+"""SQLite history backend.
+
+Events and per-day rollups live in a local SQLite database and are queried on
+demand, so memory use stays flat as history grows and startup does not load or
+validate every event. All database work runs in the executor, serialized by a
+lock around a single connection.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from typing import Any, Callable, Dict, List, Tuple, TypeVar
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import STORAGE_DIR
+from homeassistant.util import dt as dt_util
+
+from .const import (
+    CODE_SKIPPED,
+    CODE_SNOOZED,
+    CODE_TAKEN,
+    DEFAULT_HISTORY_DAYS,
+    DEFAULT_HISTORY_MAX_EVENTS,
+    HISTORY_DB_FILE,
+    HISTORY_ROLLUP_DAYS,
+)
+from .history import (
+    EXPECTED_UNKNOWN,
+    HistoryBackend,
+    MemoryHistoryBackend,
+    SummaryRows,
+    event_dict,
+    local_day,
+    parse_epoch,
+    status_code,
+    validate_refill,
+)
+from .metrics import get_metrics
+
+_LOGGER = logging.getLogger(__name__)
+
+_T = TypeVar("_T")
+
+# Entities per query when filtering with IN (...); SQLite allows 999 parameters
+_IN_CHUNK = 500
+
+_CODE_KEYS = {CODE_TAKEN: "taken", CODE_SKIPPED: "skipped", CODE_SNOOZED: "snoozed"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    entity_id TEXT NOT NULL,
+    ts REAL NOT NULL,
+    code INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_entity_ts ON events (entity_id, ts);
+CREATE TABLE IF NOT EXISTS rollups (
+    entity_id TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    taken INTEGER NOT NULL DEFAULT 0,
+    skipped INTEGER NOT NULL DEFAULT 0,
+    snoozed INTEGER NOT NULL DEFAULT 0,
+    expected INTEGER NOT NULL DEFAULT -1,
+    PRIMARY KEY (entity_id, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS refill (
+    entity_id TEXT PRIMARY KEY,
+    remaining INTEGER NOT NULL,
+    threshold INTEGER NOT NULL,
+    units_per_intake INTEGER NOT NULL,
+    alerted INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Adds one event to its day's rollup, stamping expected doses if still unknown
+_ROLLUP_UPSERT = """
+INSERT INTO rollups (entity_id, day, taken, skipped, snoozed, expected)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (entity_id, day) DO UPDATE SET
+    taken = taken + excluded.taken,
+    skipped = skipped + excluded.skipped,
+    snoozed = snoozed + excluded.snoozed,
+    expected = CASE WHEN expected = -1 THEN excluded.expected ELSE expected END
+"""
+
+_INSERT_EVENTS = "INSERT INTO events (entity_id, ts, code) VALUES (?, ?, ?)"
+
+_NO_COUNTS = {"taken": 0, "skipped": 0, "snoozed": 0}
+
+
+def _empty_rows(entity_ids: List[str], doses_per_day: Dict[str, int]) -> Dict[str, SummaryRows]:
+    return {eid: SummaryRows(None, [], [], dict(_NO_COUNTS), doses_per_day.get(eid, 0)) for eid in entity_ids}
+
+
+def _rollup_row(entity_id: str, day: int, code: int, expected: int) -> tuple:
+    return (
+        entity_id,
+        day,
+        int(code == CODE_TAKEN),
+        int(code == CODE_SKIPPED),
+        int(code == CODE_SNOOZED),
+        expected,
+    )
+
+
+class SqliteHistoryBackend(HistoryBackend):
+    """History backend storing events in ``.storage/medication_reminder_history.db``."""
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        super().__init__(hass)
+        self.path = hass.config.path(STORAGE_DIR, HISTORY_DB_FILE)
+        self._conn: sqlite3.Connection | None = None
+        self._closed = False
+        self._lock = asyncio.Lock()
+        self._metrics = get_metrics(hass)
+
+    async def _async_run(self, func: Callable[..., _T], *args: Any, closed: Any = None) -> _T:
+        """Run ``func`` in the executor; once closed, return ``closed`` instead."""
+        async with self._lock:
+            if self._closed:
+                # Writes after the stop event are dropped and queries come back empty
+                _LOGGER.debug("History database closed; skipping %s", func.__name__)
+                return closed
+            # Timed per operation (e.g. "sqlite_record_many"), lock wait excluded
+            start = time.perf_counter()
+            try:
+                return await self.hass.async_add_executor_job(func, *args)
+            finally:
+                self._metrics.observe(f"sqlite{func.__name__}", start)
+
+    async def async_load(self) -> None:
+        imported = await self._async_run(self._open)
+        if not imported:
+            # First start on SQLite: import the existing JSON history once
+            legacy = MemoryHistoryBackend(self.hass, save_delay=0)
+            await legacy.async_load()
+            data = legacy._data_to_save()
+            await self._async_run(self._import, data)
+            _LOGGER.debug("Imported JSON history into %s", self.path)
+        self.refill = await self._async_run(self._load_refill)
+
+    def _open(self) -> bool:
+        """Open the database; returns whether the JSON history was already imported."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        self._conn = conn
+        row = conn.execute("SELECT value FROM meta WHERE key = 'imported'").fetchone()
+        return row is not None
+
+    def _import(self, data: Dict[str, Any]) -> None:
+        conn = self._conn
+        assert conn is not None
+        with conn:
+            for eid, columns in data.get("events", {}).items():
+                conn.executemany(
+                    _INSERT_EVENTS, [(eid, ts, code) for ts, code in zip(columns["ts"], map(int, columns["codes"]))]
+                )
+            for eid, days in data.get("rollups", {}).items():
+                rows = []
+                for day_iso, counters in days.items():
+                    day = dt_util.parse_date(day_iso)
+                    if day is not None:
+                        rows.append((eid, day.toordinal(), *counters))
+                conn.executemany(
+                    "INSERT OR REPLACE INTO rollups (entity_id, day, taken, skipped, snoozed, expected)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+            for eid, info in validate_refill(data.get("refill", {})).items():
+                self._write_refill(eid, info)
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('imported', '1')")
+
+    def _load_refill(self) -> Dict[str, Dict[str, Any]]:
+        conn = self._conn
+        assert conn is not None
+        rows = conn.execute("SELECT entity_id, remaining, threshold, units_per_intake, alerted FROM refill")
+        return {
+            eid: {
+                "remaining": remaining,
+                "threshold": threshold,
+                "units_per_intake": units,
+                "alerted": bool(alerted),
+            }
+            for eid, remaining, threshold, units, alerted in rows
+        }
+
+    def _write_refill(self, entity_id: str, info: Dict[str, Any]) -> None:
+        assert self._conn is not None
+        self._conn.execute(
+            "INSERT OR REPLACE INTO refill (entity_id, remaining, threshold, units_per_intake, alerted)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (entity_id, info["remaining"], info["threshold"], info["units_per_intake"], int(info["alerted"])),
+        )
+
+    def _close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def async_close(self) -> None:
+        await self._async_run(self._close)
+        self._closed = True
+
+    def _record_many(
+        self, records: List[Tuple[str, str, str]], expected: Dict[str, int], cutoffs: Dict[str, float]
+    ) -> None:
+        conn = self._conn
+        assert conn is not None
+        events = []
+        rollups = []
+        for entity_id, status, timestamp_iso in records:
+            ts = parse_epoch(timestamp_iso)
+            if ts is None:
+                ts = dt_util.utcnow().timestamp()
+            code = status_code(status)
+            events.append((entity_id, ts, code))
+            rollups.append(_rollup_row(entity_id, local_day(ts), code, expected[entity_id]))
+        with conn:
+            conn.executemany(_INSERT_EVENTS, events)
+            conn.executemany(_ROLLUP_UPSERT, rollups)
+            # Expired head entries are cheap to drop through the (entity_id, ts) index;
+            # the event-count cap is enforced by maintenance.
+            conn.executemany("DELETE FROM events WHERE entity_id = ? AND ts < ?", list(cutoffs.items()))
+
+    async def async_record_many(self, records: List[Tuple[str, str, str]]) -> None:
+        now_ts = time.time()
+        expected: Dict[str, int] = {}
+        cutoffs: Dict[str, float] = {}
+        for entity_id, _, _ in records:
+            expected[entity_id] = self.doses_per_day.get(entity_id, EXPECTED_UNKNOWN)
+            cutoffs[entity_id] = now_ts - self.retention_for(entity_id)[0] * 86400
+        await self._async_run(self._record_many, records, expected, cutoffs)
+
+    def _set_refill(self, entity_id: str, info: Dict[str, Any]) -> None:
+        assert self._conn is not None
+        with self._conn:
+            self._write_refill(entity_id, info)
+
+    async def async_set_refill(self, entity_id: str, info: Dict[str, Any]) -> None:
+        self.refill[entity_id] = info
+        await self._async_run(self._set_refill, entity_id, info)
+
+    def _set_expected(self, entity_id: str, day: int, doses_per_day: int) -> None:
+        conn = self._conn
+        assert conn is not None
+        with conn:
+            conn.execute(
+                "INSERT INTO rollups (entity_id, day, expected) VALUES (?, ?, ?)"
+                " ON CONFLICT (entity_id, day) DO UPDATE SET expected = excluded.expected",
+                (entity_id, day, doses_per_day),
+            )
+
+    async def async_set_expected(self, entity_id: str, day: int, doses_per_day: int) -> None:
+        await self._async_run(self._set_expected, entity_id, day, doses_per_day)
+
+    def _maintenance(self, retention: Dict[str, tuple[int, int]], now_ts: float, oldest_day: int) -> None:
+        conn = self._conn
+        assert conn is not None
+        with conn:
+            for (eid,) in conn.execute("SELECT DISTINCT entity_id FROM events").fetchall():
+                days, max_events = retention.get(eid, (DEFAULT_HISTORY_DAYS, DEFAULT_HISTORY_MAX_EVENTS))
+                conn.execute("DELETE FROM events WHERE entity_id = ? AND ts < ?", (eid, now_ts - days * 86400))
+                conn.execute(
+                    "DELETE FROM events WHERE entity_id = ? AND ts < ("
+                    " SELECT ts FROM events WHERE entity_id = ? ORDER BY ts DESC LIMIT 1 OFFSET ?)",
+                    (eid, eid, max_events - 1),
+                )
+            conn.execute("DELETE FROM rollups WHERE day < ?", (oldest_day,))
+
+    async def async_maintenance(self) -> None:
+        now = dt_util.now()
+        oldest_day = now.date().toordinal() - HISTORY_ROLLUP_DAYS
+        await self._async_run(self._maintenance, dict(self.retention), now.timestamp(), oldest_day)
+
+    def _recent(self, entity_id: str, limit: int) -> List[Dict[str, Any]]:
+        assert self._conn is not None
+        rows = self._conn.execute(
+            "SELECT ts, code FROM events WHERE entity_id = ? ORDER BY ts DESC LIMIT ?",
+            (entity_id, limit),
+        ).fetchall()
+        # Reported in the same form as the JSON backend
+        return [event_dict(ts, code) for ts, code in reversed(rows)]
+
+    async def async_recent(self, entity_id: str, limit: int) -> List[Dict[str, Any]]:
+        return await self._async_run(self._recent, entity_id, limit, closed=[])
+
+    def _events(
+        self, entity_id: str, start: float | None, end: float | None, limit: int
+    ) -> List[Tuple[float, Dict[str, Any]]]:
+        assert self._conn is not None
+        rows = self._conn.execute(
+            "SELECT ts, code FROM events WHERE entity_id = ? AND ts >= ? AND ts <= ?"
+            " ORDER BY ts DESC, rowid DESC LIMIT ?",
+            (entity_id, start if start is not None else float("-inf"), end if end is not None else float("inf"), limit),
+        ).fetchall()
+        return [(ts, event_dict(ts, code)) for ts, code in rows]
+
+    async def async_events(
+        self, entity_id: str, start: float | None, end: float | None, limit: int
+    ) -> List[Tuple[float, Dict[str, Any]]]:
+        return await self._async_run(self._events, entity_id, start, end, limit, closed=[])
+
+    def _counts_between(self, entity_id: str, start: float | None, end: float | None) -> Dict[str, int]:
+        assert self._conn is not None
+        rows = self._conn.execute(
+            "SELECT code, COUNT(*) FROM events WHERE entity_id = ? AND ts >= ? AND ts <= ? GROUP BY code",
+            (entity_id, start if start is not None else float("-inf"), end if end is not None else float("inf")),
+        ).fetchall()
+        by_code = dict(rows)
+        return {
+            "taken": by_code.get(CODE_TAKEN, 0),
+            "skipped": by_code.get(CODE_SKIPPED, 0),
+            "snoozed": by_code.get(CODE_SNOOZED, 0),
+        }
+
+    async def async_counts_between(self, entity_id: str, start: float | None, end: float | None) -> Dict[str, int]:
+        return await self._async_run(self._counts_between, entity_id, start, end, closed=dict(_NO_COUNTS))
+
+    def _period_counts(self, entity_id: str, first_day: int, last_day: int, doses_per_day: int) -> Dict[str, int]:
+        conn = self._conn
+        assert conn is not None
+        (tracking_start,) = conn.execute("SELECT MIN(day) FROM rollups WHERE entity_id = ?", (entity_id,)).fetchone()
+        if tracking_start is None:
+            return {**_NO_COUNTS, "expected": 0}
+        # Days before tracking started are never expected
+        first_day = max(first_day, tracking_start)
+        taken, skipped, snoozed, expected, buckets = conn.execute(
+            "SELECT COALESCE(SUM(taken), 0), COALESCE(SUM(skipped), 0), COALESCE(SUM(snoozed), 0),"
+            " COALESCE(SUM(CASE WHEN expected = -1 THEN ? ELSE expected END), 0), COUNT(*)"
+            " FROM rollups WHERE entity_id = ? AND day BETWEEN ? AND ?",
+            (doses_per_day, entity_id, first_day, last_day),
+        ).fetchone()
+        # Days without a bucket (no events, e.g. HA was off) use the current schedule
+        if last_day >= first_day:
+            expected += (last_day - first_day + 1 - buckets) * doses_per_day
+        return {"taken": taken, "skipped": skipped, "snoozed": snoozed, "expected": expected}
+
+    async def async_period_counts(self, entity_id: str, first_day: int, last_day: int) -> Dict[str, int]:
+        return await self._async_run(
+            self._period_counts,
+            entity_id,
+            first_day,
+            last_day,
+            self.doses_per_day.get(entity_id, 0),
+            closed={**_NO_COUNTS, "expected": 0},
+        )
+
+    def _summary_rows(
+        self, entity_ids: List[str], first_day: int, since: float, doses_per_day: Dict[str, int]
+    ) -> Dict[str, SummaryRows]:
+        conn = self._conn
+        assert conn is not None
+        out = _empty_rows(entity_ids, doses_per_day)
+        # Three grouped queries per chunk of entities, within SQLite's parameter limit
+        for pos in range(0, len(entity_ids), _IN_CHUNK):
+            chunk = entity_ids[pos:pos + _IN_CHUNK]
+            marks = ",".join("?" * len(chunk))
+            for eid, start in conn.execute(
+                f"SELECT entity_id, MIN(day) FROM rollups WHERE entity_id IN ({marks}) GROUP BY entity_id", chunk
+            ):
+                out[eid].tracking_start = start
+            for eid, day, taken, skipped, snoozed, expected in conn.execute(
+                "SELECT entity_id, day, taken, skipped, snoozed, expected FROM rollups"
+                f" WHERE entity_id IN ({marks}) AND day >= ? ORDER BY entity_id, day",
+                (*chunk, first_day),
+            ):
+                out[eid].days.append(day)
+                out[eid].buckets.append([taken, skipped, snoozed, expected])
+            for eid, code, count in conn.execute(
+                f"SELECT entity_id, code, COUNT(*) FROM events WHERE entity_id IN ({marks}) AND ts >= ?"
+                " GROUP BY entity_id, code",
+                (*chunk, since),
+            ):
+                key = _CODE_KEYS.get(code)
+                if key is not None:
+                    out[eid].recent[key] = count
+        return out
+
+    async def async_summary_rows(self, entity_ids: List[str], first_day: int, since: float) -> Dict[str, SummaryRows]:
+        doses_per_day = dict(self.doses_per_day)
+        return await self._async_run(
+            self._summary_rows,
+            entity_ids,
+            first_day,
+            since,
+            doses_per_day,
+            closed=_empty_rows(entity_ids, doses_per_day),
+        )
+
+    def _stats(self) -> Dict[str, Any]:
+        assert self._conn is not None
+        events, entities = self._conn.execute("SELECT COUNT(*), COUNT(DISTINCT entity_id) FROM events").fetchone()
+        (rollup_days,) = self._conn.execute("SELECT COUNT(*) FROM rollups").fetchone()
+        return {"entities": entities, "events_stored": events, "rollup_days": rollup_days}
+
+    async def async_stats(self) -> Dict[str, Any]:
+        return await self._async_run(self._stats, closed={})
+
+    def _entity_ids(self) -> List[str]:
+        assert self._conn is not None
+        return [eid for (eid,) in self._conn.execute("SELECT DISTINCT entity_id FROM events").fetchall()]
+
+    async def async_entity_ids(self) -> List[str]:
+        return await self._async_run(self._entity_ids, closed=[])
+
+    def _event_chunk(
+        self, entity_id: str, start: float | None, end: float | None, skip: int, limit: int
+    ) -> Tuple[List[float], bytes]:
+        assert self._conn is not None
+        rows = self._conn.execute(
+            "SELECT ts, code FROM events WHERE entity_id = ? AND ts >= ? AND ts <= ?"
+            " ORDER BY ts, rowid LIMIT ? OFFSET ?",
+            (
+                entity_id,
+                start if start is not None else float("-inf"),
+                end if end is not None else float("inf"),
+                limit,
+                skip,
+            ),
+        ).fetchall()
+        return [ts for ts, _ in rows], bytes(code for _, code in rows)
+
+    async def async_event_chunk(
+        self, entity_id: str, start: float | None, end: float | None, skip: int, limit: int
+    ) -> Tuple[List[float], bytes]:
+        return await self._async_run(self._event_chunk, entity_id, start, end, skip, limit, closed=([], b""))
+
+    def _import_events(
+        self, records: List[Tuple[str, int, int]], retention: Dict[str, Tuple[float, int]], oldest_day: int
+    ) -> List[Tuple[str, int, int]]:
+        conn = self._conn
+        assert conn is not None
+        # Oldest instant each entity keeps: its age cutoff, or its max_events-th newest event
+        floors = {}
+        for entity_id, (cutoff, max_events) in retention.items():
+            row = conn.execute(
+                "SELECT ts FROM events WHERE entity_id = ? ORDER BY ts DESC LIMIT 1 OFFSET ?",
+                (entity_id, max_events - 1),
+            ).fetchone()
+            floors[entity_id] = max(cutoff, row[0]) if row else cutoff
+            if entity_id not in self.import_counted_days:
+                self.import_counted_days[entity_id] = {
+                    day
+                    for (day,) in conn.execute(
+                        "SELECT day FROM rollups WHERE entity_id = ? AND taken + skipped + snoozed > 0", (entity_id,)
+                    )
+                }
+        added = []
+        events = []
+        rollups = []
+        seen = set()
+        for record in records:
+            if record in seen:
+                continue
+            seen.add(record)
+            entity_id, ts, code = record
+            day = local_day(ts)
+            if ts < floors[entity_id]:
+                # Retention would prune it, so a repeat import could not recognize it:
+                # it only counts in the rollups, on days not counted before
+                if day < oldest_day or day in self.import_counted_days[entity_id]:
+                    continue
+            elif conn.execute(
+                # Recorded events keep fractional seconds; exported ones are whole seconds
+                "SELECT 1 FROM events WHERE entity_id = ? AND ts >= ? AND ts < ? AND code = ? LIMIT 1",
+                (entity_id, ts, ts + 1, code),
+            ).fetchone():
+                continue
+            else:
+                events.append(record)
+            rollups.append(_rollup_row(entity_id, day, code, EXPECTED_UNKNOWN))
+            added.append(record)
+        with conn:
+            conn.executemany(_INSERT_EVENTS, events)
+            conn.executemany(_ROLLUP_UPSERT, rollups)
+        return added
+
+    async def async_import_events(self, records: List[Tuple[str, int, int]]) -> List[Tuple[str, int, int]]:
+        now = dt_util.now()
+        retention = {}
+        for entity_id, _, _ in records:
+            days, max_events = self.retention_for(entity_id)
+            retention[entity_id] = (now.timestamp() - days * 86400, max_events)
+        oldest_day = now.date().toordinal() - HISTORY_ROLLUP_DAYS
+        return await self._async_run(self._import_events, records, retention, oldest_day, closed=[])
@@ -0,0 +1,208 @@
+"""Medication lists: payload parsing and the import_medications service."""
+from __future__ import annotations
+
+import csv
+import io
+import json
+from typing import Any, Dict, Iterable, List, Optional
+
+import voluptuous as vol
+import yaml
+
+from homeassistant.config_entries import SOURCE_IMPORT, ConfigEntry
+from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import config_validation as cv
+
+from .const import (
+    DOMAIN,
+    ATTR_NAME,
+    ATTR_DOSE,
+    ATTR_TIMES,
+    CONF_ENTRY_TYPE,
+    CONF_LIST_NAME,
+    CONF_MEDICATIONS,
+    ENTRY_TYPE_LIST,
+    DEFAULT_SNOOZE_MINUTES,
+    MIN_SNOOZE_MINUTES,
+    MAX_SNOOZE_MINUTES,
+    DEFAULT_HISTORY_DAYS,
+    DEFAULT_HISTORY_MAX_EVENTS,
+    MAX_REFILL_LEAD_DAYS,
+)
+
+
+def _slugify(name: str) -> str:
+    base = "".join(ch if ch.isalnum() else "_" for ch in name.lower())
+    return "_".join([p for p in base.split("_") if p])
+
+
+def _times(value: Any) -> List[str]:
+    """HH:MM values as a list or a comma/semicolon separated string."""
+    if isinstance(value, (list, tuple)):
+        items = [str(v).strip() for v in value]
+    else:
+        items = [v.strip() for v in str(value).replace(";", ",").split(",")]
+    out: List[str] = []
+    for t in items:
+        if not t:
+            continue
+        try:
+            hh, mm = t.split(":")
+            hhi = int(hh)
+            mmi = int(mm)
+        except ValueError as err:
+            raise vol.Invalid(f"Invalid time format: {t}") from err
+        if not (0 <= hhi <= 23 and 0 <= mmi <= 59):
+            raise vol.Invalid(f"Invalid time value: {t}")
+        out.append(f"{hhi:02d}:{mmi:02d}")
+    if not out:
+        raise vol.Invalid("At least one time is required")
+    return list(dict.fromkeys(out))
+
+
+def _services(value: Any) -> str:
+    """Notify services as stored by the options flow: one comma-separated string."""
+    if isinstance(value, (list, tuple)):
+        return ", ".join(str(v).strip() for v in value if str(v).strip())
+    return str(value).strip()
+
+
+def _int(low: int, high: Optional[int] = None):
+    return vol.All(vol.Coerce(int), vol.Clamp(min=low, max=high))
+
+
+# One medication of a list entry; keys and bounds match the options flow
+MEDICATION_SCHEMA = vol.Schema(
+    {
+        vol.Required(ATTR_NAME): vol.All(cv.string, vol.Strip, vol.Length(min=1)),
+        vol.Optional(ATTR_DOSE, default=""): vol.All(cv.string, vol.Strip),
+        vol.Required(ATTR_TIMES): _times,
+        vol.Optional("snooze_minutes", default=DEFAULT_SNOOZE_MINUTES): _int(MIN_SNOOZE_MINUTES, MAX_SNOOZE_MINUTES),
+        vol.Optional("notify_services", default=""): _services,
+        vol.Optional("nag_interval_minutes", default=5): _int(0, 120),
+        vol.Optional("nag_max", default=3): _int(0, 48),
+        vol.Optional("refill_total", default=0): _int(0),
+        vol.Optional("refill_threshold", default=0): _int(0),
+        vol.Optional("refill_lead_days", default=0): _int(0, MAX_REFILL_LEAD_DAYS),
+        vol.Optional("dose_units_per_intake", default=1): _int(1),
+        vol.Optional("history_days", default=DEFAULT_HISTORY_DAYS): _int(1, 3650),
+        vol.Optional("history_max_events", default=DEFAULT_HISTORY_MAX_EVENTS): _int(10, 20000),
+        vol.Optional("group_notifications", default=False): cv.boolean,
+    }
+)
+
+
+def parse_payload(payload: str, fmt: str) -> List[Any]:
+    """Decode a YAML, JSON or CSV document into raw medication mappings.
+
+    YAML and JSON accept a list of medications or a mapping with a
+    ``medications`` list; CSV needs a header row naming the fields, and empty
+    cells fall back to the defaults.
+    """
+    try:
+        if fmt == "csv":
+            rows = csv.DictReader(io.StringIO(payload.strip()))
+            return [
+                {key.strip(): value.strip() for key, value in row.items() if key and value and value.strip()}
+                for row in rows
+            ]
+        data = json.loads(payload) if fmt == "json" else yaml.safe_load(payload)
+    except (ValueError, yaml.YAMLError, csv.Error) as err:
+        raise vol.Invalid(f"Could not parse {fmt} payload: {err}") from err
+    if isinstance(data, dict):
+        data = data.get(CONF_MEDICATIONS)
+    if not isinstance(data, list):
+        raise vol.Invalid("Expected a list of medications")
+    return data
+
+
+def validate_medications(items: Iterable[Any]) -> List[Dict[str, Any]]:
+    """Validate raw medications; the error names the first one that is invalid."""
+    out: List[Dict[str, Any]] = []
+    seen: set[str] = set()
+    for index, item in enumerate(items, start=1):
+        label = item.get(ATTR_NAME) if isinstance(item, dict) else None
+        try:
+            med = MEDICATION_SCHEMA(item)
+        except vol.Invalid as err:
+            raise vol.Invalid(f"Medication {index} ({label or 'unnamed'}): {err}") from err
+        slug = _slugify(med[ATTR_NAME])
+        if not slug or slug in seen:
+            raise vol.Invalid(f"Medication {index} ({med[ATTR_NAME]}): duplicate or empty name")
+        seen.add(slug)
+        out.append(med)
+    return out
+
+
+def load_medications(payload: str, fmt: str) -> List[Dict[str, Any]]:
+    """Parse and validate a payload; does blocking work, run it in the executor."""
+    return validate_medications(parse_payload(payload, fmt))
+
+
+def dump_medications(medications: List[Dict[str, Any]]) -> str:
+    """Render a list entry's medications as YAML for editing."""
+    return yaml.safe_dump(list(medications), sort_keys=False, allow_unicode=True)
+
+
+def is_list_entry(entry: ConfigEntry) -> bool:
+    return entry.data.get(CONF_ENTRY_TYPE) == ENTRY_TYPE_LIST
+
+
+def configured_slugs(hass: HomeAssistant, exclude: Optional[str] = None) -> set[str]:
+    """Slugs of every configured medication, skipping the entry ``exclude``."""
+    slugs: set[str] = set()
+    for entry in hass.config_entries.async_entries(DOMAIN):
+        if entry.entry_id == exclude:
+            continue
+        if is_list_entry(entry):
+            slugs.update(_slugify(med[ATTR_NAME]) for med in entry.data.get(CONF_MEDICATIONS, []))
+        else:
+            slugs.add(_slugify(entry.data.get(ATTR_NAME) or entry.title or ""))
+    return slugs
+
+
+async def async_import_medications(
+    hass: HomeAssistant, medications: List[Dict[str, Any]], list_name: str, replace: bool = False
+) -> Dict[str, Any]:
+    """Add or update validated medications in the list entry called ``list_name``.
+
+    The list entry is created when missing. Medications are matched by name;
+    with ``replace`` the ones absent from ``medications`` are removed. Names
+    already configured by another entry are skipped and reported.
+    """
+    unique_id = f"list_{_slugify(list_name)}"
+    entry = next(
+        (e for e in hass.config_entries.async_entries(DOMAIN) if e.unique_id == unique_id and is_list_entry(e)),
+        None,
+    )
+    taken = configured_slugs(hass, exclude=entry.entry_id if entry else None)
+    current = {_slugify(med[ATTR_NAME]): med for med in (entry.data.get(CONF_MEDICATIONS, []) if entry else [])}
+    merged = {} if replace else dict(current)
+    added: List[str] = []
+    updated: List[str] = []
+    skipped: List[Dict[str, str]] = []
+    for med in medications:
+        slug = _slugify(med[ATTR_NAME])
+        if slug in taken:
+            skipped.append({ATTR_NAME: med[ATTR_NAME], "reason": "configured by another entry"})
+            continue
+        if slug not in current:
+            added.append(med[ATTR_NAME])
+        elif current[slug] != med:
+            updated.append(med[ATTR_NAME])
+        merged[slug] = med
+    removed = [med[ATTR_NAME] for slug, med in current.items() if slug not in merged]
+
+    data = {CONF_ENTRY_TYPE: ENTRY_TYPE_LIST, CONF_LIST_NAME: list_name, CONF_MEDICATIONS: list(merged.values())}
+    if entry is None:
+        result = await hass.config_entries.flow.async_init(DOMAIN, context={"source": SOURCE_IMPORT}, data=data)
+        created = result.get("result")
+        if created is None:
+            raise HomeAssistantError(f"Could not create medication list {list_name}: {result.get('reason')}")
+        entry_id = created.entry_id
+    else:
+        if added or updated or removed:
+            hass.config_entries.async_update_entry(entry, data=data)
+        entry_id = entry.entry_id
+    return {"entry_id": entry_id, "added": added, "updated": updated, "removed": removed, "skipped": skipped}
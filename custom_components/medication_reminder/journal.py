@@ -0,0 +1,135 @@
+"""Append-only JSON-lines journal for adherence history and the dose-slot ledger.
+
+The journal complements a snapshot kept in ``.storage``: every change is
+appended as one line instead of rewriting the whole document, and the
+snapshot is only rewritten on compaction. On load the snapshot is read first
+and the journal tail replayed on top of it.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Dict, List, Tuple
+
+from homeassistant.core import HomeAssistant
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _read_lines(path: str, after_seq: int) -> Tuple[List[Dict[str, Any]], int, bool]:
+    """Read journal operations newer than ``after_seq``.
+
+    Returns the operations, the highest sequence seen and whether the file
+    needs repairing (a torn or corrupt line, usually from a crash mid-write).
+    """
+    ops: List[Dict[str, Any]] = []
+    last_seq = after_seq
+    damaged = False
+    try:
+        with open(path, "rb") as fh:
+            raw = fh.read()
+    except FileNotFoundError:
+        return ops, last_seq, False
+    lines = raw.split(b"\n")
+    # A complete file ends with a newline, leaving an empty last element
+    if lines and lines[-1] == b"":
+        lines.pop()
+    elif lines:
+        damaged = True
+    for line in lines:
+        try:
+            op = json.loads(line)
+            seq = int(op["n"])
+        except (ValueError, TypeError, KeyError):
+            damaged = True
+            continue
+        last_seq = max(last_seq, seq)
+        if seq > after_seq:
+            ops.append(op)
+    return ops, last_seq, damaged
+
+
+def _append_lines(path: str, lines: List[str]) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a", encoding="utf-8") as fh:
+        fh.write("".join(lines))
+        fh.flush()
+
+
+def _rewrite_after(path: str, after_seq: int) -> int:
+    """Keep only valid lines newer than ``after_seq``; returns how many were kept."""
+    ops, _, _ = _read_lines(path, after_seq)
+    if not ops:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        return 0
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        fh.write("".join(json.dumps(op, separators=(",", ":")) + "\n" for op in ops))
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+    return len(ops)
+
+
+class HistoryJournal:
+    """Buffered writer/reader for one journal file."""
+
+    def __init__(self, hass: HomeAssistant, path: str) -> None:
+        self.hass = hass
+        self.path = path
+        self._seq = 0
+        self._pending: List[str] = []
+        self._lines = 0
+        # Serializes file access between appends, compaction and replay
+        self._lock = asyncio.Lock()
+        self._flush_task: asyncio.Task | None = None
+
+    @property
+    def seq(self) -> int:
+        """Sequence number of the last operation handed to the journal."""
+        return self._seq
+
+    @property
+    def lines(self) -> int:
+        """Operations written or buffered since the last compaction."""
+        return self._lines
+
+    async def async_replay(self, after_seq: int) -> List[Dict[str, Any]]:
+        """Return operations newer than the snapshot, repairing a torn tail."""
+        async with self._lock:
+            ops, last_seq, damaged = await self.hass.async_add_executor_job(_read_lines, self.path, after_seq)
+            if damaged:
+                _LOGGER.warning("Journal %s had unreadable lines; dropping them", self.path)
+                await self.hass.async_add_executor_job(_rewrite_after, self.path, after_seq)
+        self._seq = max(self._seq, last_seq)
+        self._lines = len(ops)
+        return ops
+
+    def append(self, op: Dict[str, Any]) -> None:
+        """Queue one operation; it is written by a background flush."""
+        self._seq += 1
+        op["n"] = self._seq
+        self._pending.append(json.dumps(op, separators=(",", ":")) + "\n")
+        self._lines += 1
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = self.hass.async_create_task(self.async_flush())
+
+    async def async_flush(self) -> None:
+        """Write all queued lines to disk."""
+        async with self._lock:
+            # Lines queued while a write is in flight are picked up by the next pass
+            while self._pending:
+                lines, self._pending = self._pending, []
+                await self.hass.async_add_executor_job(_append_lines, self.path, lines)
+
+    async def async_truncate(self, upto_seq: int) -> None:
+        """Drop operations already contained in a snapshot saved at ``upto_seq``."""
+        await self.async_flush()
+        async with self._lock:
+            kept = await self.hass.async_add_executor_job(_rewrite_after, self.path, upto_seq)
+            self._lines = kept + len(self._pending)
@@ -0,0 +1,444 @@
+"""Dose-slot ledger: every scheduled dose instant and what became of it.
+
+Slots are generated from each medication's dose times a little ahead of
+now. A taken or skipped event is matched to the nearest pending slot within
+``DOSE_SLOT_TOLERANCE``; a taken dose up to ``DOSE_ON_TIME`` after its slot
+(or early) is on time, later ones are late. A slot still pending once its
+tolerance window has closed becomes missed. Events that match no slot,
+such as a second tap on the same dose, only count as extra.
+
+Slots are kept as parallel columns per medication like the event index, so
+the status of a slot and the counts over a time range are bisects and
+slice counts rather than rescans of the history.
+
+Generating and closing slots only depends on the dose times and the clock,
+so the ledger persists just the matched events and dose time changes, one
+journal line each, on top of a snapshot that is rewritten when the journal
+is compacted. Loading replays the journal and regenerates the rest.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, time
+from typing import Any, Callable, Dict, Iterable, List, Set, Tuple
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.event import async_track_point_in_utc_time
+from homeassistant.helpers.storage import STORAGE_DIR, Store
+from homeassistant.util import dt as dt_util
+
+from .const import (
+    CODE_SKIPPED,
+    CODE_TAKEN,
+    DOSE_LEDGER_DAYS,
+    DOSE_LEDGER_STORE_KEY,
+    DOSE_LEDGER_STORE_VERSION,
+    DOSE_ON_TIME,
+    DOSE_SLOT_TOLERANCE,
+    JOURNAL_COMPACT_LINES,
+    SLOT_LATE,
+    SLOT_MISSED,
+    SLOT_ON_TIME,
+    SLOT_PENDING,
+    SLOT_SKIPPED,
+)
+from .journal import HistoryJournal
+
+_LOGGER = logging.getLogger(__name__)
+
+TOLERANCE = int(DOSE_SLOT_TOLERANCE.total_seconds())
+ON_TIME = int(DOSE_ON_TIME.total_seconds())
+# Slots are generated this far ahead, so the next dose of a daily medication always exists
+HORIZON = 86400 + TOLERANCE
+_OPEN = (SLOT_PENDING, SLOT_MISSED)
+
+
+def _instant(day: int, hhmm: str) -> int:
+    """Epoch seconds of ``HH:MM`` local time on the date ordinal ``day``."""
+    hh, mm = (int(x) for x in hhmm.split(":"))
+    return int(datetime.combine(date.fromordinal(day), time(hh, mm), dt_util.DEFAULT_TIME_ZONE).timestamp())
+
+
+def _local_day(ts: float) -> int:
+    return dt_util.as_local(dt_util.utc_from_timestamp(ts)).date().toordinal()
+
+
+def day_start(day: int) -> int:
+    """Epoch seconds of local midnight starting the date ordinal ``day``."""
+    return _instant(day, "00:00")
+
+
+class DoseSlots:
+    """One medication's slots: scheduled instants, status codes and delays in seconds.
+
+    ``since`` is the instant from which every dose is in the ledger, ``until``
+    the instant up to which slots have been generated and ``open`` indexes
+    the first slot whose tolerance window may still be open.
+    """
+
+    __slots__ = ("ts", "status", "delay", "open", "since", "until", "extra")
+
+    def __init__(
+        self,
+        ts: Iterable[int] = (),
+        status: bytes = b"",
+        delay: Iterable[int] = (),
+        since: int = 0,
+        until: int = 0,
+        extra: int = 0,
+    ) -> None:
+        self.ts = array("q", ts)
+        self.status = bytearray(status)
+        self.delay = array("i", delay)
+        self.open = 0
+        self.since = since
+        self.until = until
+        self.extra = extra
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def extend(self, times: List[str], until: int) -> None:
+        """Generate the slots of ``times`` in ``[self.until, until)``."""
+        if until <= self.until:
+            return
+        for day in range(_local_day(self.until), _local_day(until) + 1):
+            for t in times:
+                ts = _instant(day, t)
+                if self.until <= ts < until:
+                    self.ts.append(ts)
+                    self.status.append(SLOT_PENDING)
+                    self.delay.append(0)
+        self.until = until
+
+    def drop_future(self, now: int) -> None:
+        """Forget pending slots after ``now``, e.g. before regenerating for new dose times."""
+        cut = bisect_right(self.ts, now)
+        keep = [i for i in range(cut, len(self.ts)) if self.status[i] != SLOT_PENDING]
+        last = self.ts[keep[-1]] + 1 if keep else now
+        self.ts[cut:] = array("q", (self.ts[i] for i in keep))
+        self.status[cut:] = bytes(self.status[i] for i in keep)
+        self.delay[cut:] = array("i", (self.delay[i] for i in keep))
+        self.until = max(now, last)
+
+    def match(self, ts: int, code: int) -> bool:
+        """Fill the nearest open slot within the tolerance; False when none is left.
+
+        Slots already marked missed count as open too, so backdated or
+        imported events still fill them.
+        """
+        best = -1
+        for i in range(bisect_left(self.ts, ts - TOLERANCE), bisect_right(self.ts, ts + TOLERANCE)):
+            if self.status[i] in _OPEN and (best < 0 or abs(self.ts[i] - ts) < abs(self.ts[best] - ts)):
+                best = i
+        if best < 0:
+            # Events from before the ledger started have no slots to match
+            if ts >= self.since:
+                self.extra += 1
+            return False
+        if code == CODE_SKIPPED:
+            self.status[best] = SLOT_SKIPPED
+        else:
+            delay = ts - self.ts[best]
+            self.delay[best] = delay
+            self.status[best] = SLOT_ON_TIME if delay <= ON_TIME else SLOT_LATE
+        return True
+
+    def close(self, now: int) -> bool:
+        """Mark slots whose window has closed unmatched as missed; True if any were."""
+        changed = False
+        while self.open < len(self.ts) and self.ts[self.open] + TOLERANCE <= now:
+            if self.status[self.open] == SLOT_PENDING:
+                self.status[self.open] = SLOT_MISSED
+                changed = True
+            self.open += 1
+        return changed
+
+    def prune(self, cutoff: int) -> None:
+        cut = bisect_left(self.ts, cutoff)
+        if cut:
+            del self.ts[:cut]
+            del self.status[:cut]
+            del self.delay[:cut]
+            self.open = max(0, self.open - cut)
+        self.since = max(self.since, cutoff)
+
+    @property
+    def covered_from(self) -> int:
+        """First local day (ordinal) whose doses are all in the ledger."""
+        return _local_day(self.since - 1) + 1
+
+    def next_close(self) -> int | None:
+        return self.ts[self.open] + TOLERANCE if self.open < len(self.ts) else None
+
+    def span(self, start: float | None, end: float | None) -> Tuple[int, int]:
+        """Index range of the slots scheduled within ``[start, end]``."""
+        lo = 0 if start is None else bisect_left(self.ts, start)
+        hi = len(self.ts) if end is None else bisect_right(self.ts, end)
+        return lo, hi
+
+    def counts(self, start: float | None, end: float | None) -> Dict[str, int]:
+        lo, hi = self.span(start, end)
+        status = self.status[lo:hi]
+        return {
+            "on_time": status.count(SLOT_ON_TIME),
+            "late": status.count(SLOT_LATE),
+            "skipped": status.count(SLOT_SKIPPED),
+            "missed": status.count(SLOT_MISSED),
+            "pending": status.count(SLOT_PENDING),
+        }
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "ts": self.ts.tolist(),
+            "status": "".join(map(str, self.status)),
+            "delay": self.delay.tolist(),
+            "since": self.since,
+            "until": self.until,
+            "extra": self.extra,
+        }
+
+
+def _decode(raw: Any) -> DoseSlots | None:
+    """Slots from their stored form; None when malformed."""
+    try:
+        slots = DoseSlots(
+            raw["ts"],
+            bytes(int(c) for c in raw["status"]),
+            raw["delay"],
+            int(raw["since"]),
+            int(raw["until"]),
+            int(raw.get("extra", 0)),
+        )
+    except (KeyError, TypeError, ValueError, OverflowError):
+        return None
+    if not (len(slots.ts) == len(slots.status) == len(slots.delay)) or any(c > SLOT_MISSED for c in slots.status):
+        return None
+    return slots
+
+
+class DoseLedger:
+    """Slots of every medication, kept current by one timer and persisted through a journal.
+
+    ``on_change`` is called with the medications whose slots changed when
+    windows close, so their statistics are refreshed.
+    """
+
+    def __init__(self, hass: HomeAssistant, on_change: Callable[[Set[str]], None]) -> None:
+        self.hass = hass
+        self._store: Store = Store(hass, DOSE_LEDGER_STORE_VERSION, DOSE_LEDGER_STORE_KEY)
+        self._journal = HistoryJournal(hass, hass.config.path(STORAGE_DIR, f"{DOSE_LEDGER_STORE_KEY}.journal"))
+        self._compact_task: asyncio.Task | None = None
+        self._on_change = on_change
+        self._slots: Dict[str, DoseSlots] = {}
+        self._times: Dict[str, List[str]] = {}
+        # Stored dose times of medications not set up since the load; they generate no slots
+        self._stored_times: Dict[str, List[str]] = {}
+        self._loaded = False
+        self._unsub_timer: CALLBACK_TYPE | None = None
+
+    async def async_load(self) -> None:
+        data = await self._store.async_load() or {}
+        for eid, raw in (data.get("entities") or {}).items():
+            slots = _decode(raw)
+            if slots is None:
+                _LOGGER.warning("Dropping malformed dose slots of %s", eid)
+                continue
+            self._slots[eid] = slots
+        # Dose times the slots were generated from
+        raw_times = data.get("times")
+        stored_times = {
+            eid: times
+            for eid, times in (raw_times if isinstance(raw_times, dict) else {}).items()
+            if isinstance(times, list) and all(isinstance(t, str) for t in times)
+        }
+        try:
+            journal_seq = int(data.get("journal_seq", 0) or 0)
+        except (TypeError, ValueError):
+            journal_seq = 0
+        for op in await self._journal.async_replay(journal_seq):
+            self._apply_op(op, stored_times)
+        self._loaded = True
+        now = int(dt_util.utcnow().timestamp())
+        for eid, times in self._times.items():
+            previous = stored_times.pop(eid, None)
+            self._apply_times(eid, times, previous, now)
+            if previous != times:
+                self._journal.append({"e": eid, "times": times, "now": now})
+        self._stored_times = stored_times
+        self._advance(now)
+        self._async_compact_if_needed()
+        self._arm()
+
+    def _apply_op(self, op: Dict[str, Any], times: Dict[str, List[str]]) -> None:
+        """Apply one replayed journal operation; ``times`` holds the dose times as of the operation."""
+        eid = op.get("e")
+        if not isinstance(eid, str):
+            return
+        try:
+            if "times" in op:
+                new = sorted(set(str(t) for t in op["times"]))
+                self._apply_times(eid, new, times.get(eid), int(op["now"]))
+                if new:
+                    times[eid] = new
+                else:
+                    times.pop(eid, None)
+            else:
+                slots = self._slots.get(eid)
+                if slots is not None:
+                    if times.get(eid):
+                        slots.extend(times[eid], int(op["t"]) + HORIZON)
+                    slots.match(int(op["t"]), int(op["c"]))
+        except (KeyError, TypeError, ValueError, OverflowError):
+            _LOGGER.warning("Skipping malformed dose ledger journal line %s", op.get("n"))
+
+    async def async_flush(self) -> None:
+        await self._journal.async_flush()
+
+    async def async_unload(self) -> None:
+        if self._unsub_timer is not None:
+            self._unsub_timer()
+            self._unsub_timer = None
+        if self._compact_task is not None:
+            await self._compact_task
+        await self.async_flush()
+
+    def _data_to_save(self) -> Dict[str, Any]:
+        return {
+            "entities": {eid: slots.as_dict() for eid, slots in self._slots.items()},
+            "times": {**self._stored_times, **self._times},
+            # Journal operations up to this sequence are contained in the snapshot
+            "journal_seq": self._journal.seq,
+        }
+
+    @callback
+    def _async_compact_if_needed(self) -> None:
+        if self._journal.lines >= JOURNAL_COMPACT_LINES and (self._compact_task is None or self._compact_task.done()):
+            self._compact_task = self.hass.async_create_task(self._async_compact())
+
+    async def _async_compact(self) -> None:
+        """Write a fresh snapshot and drop the journal lines it contains."""
+        data = self._data_to_save()
+        await self._store.async_save(data)
+        await self._journal.async_truncate(data["journal_seq"])
+
+    @callback
+    def set_times(self, entity_id: str, times: List[str]) -> None:
+        """Generate slots for new or changed dose times; no times stops generating them."""
+        times = sorted(set(times))
+        previous = self._times.get(entity_id)
+        if times:
+            self._times[entity_id] = times
+        else:
+            self._times.pop(entity_id, None)
+        if not self._loaded:
+            return
+        # Set up after the load: the stored times tell which doses were due while it was not
+        stored = previous is None and entity_id in self._stored_times
+        if stored:
+            previous = self._stored_times.pop(entity_id)
+        elif previous == times:
+            return
+        now = int(dt_util.utcnow().timestamp())
+        self._apply_times(entity_id, times, previous, now)
+        if previous != times:
+            self._journal.append({"e": entity_id, "times": times, "now": now})
+            self._async_compact_if_needed()
+        self._arm()
+
+    def _apply_times(self, entity_id: str, times: List[str], previous: List[str] | None, now: int) -> None:
+        """Bring slots up to date with ``times``; ``previous`` is None for a medication (re)added now."""
+        slots = self._slots.get(entity_id)
+        if slots is None:
+            # Tracking starts now; nothing is known about earlier doses
+            slots = self._slots[entity_id] = DoseSlots(since=now, until=now)
+        elif previous is None:
+            # Re-added after its removal; no doses were due in between
+            slots.drop_future(now)
+        else:
+            # Off for a while (e.g. Home Assistant was stopped): the doses due meanwhile were missed
+            slots.until = max(slots.until, now - DOSE_LEDGER_DAYS * 86400)
+            slots.extend(previous, now)
+            if previous != times:
+                slots.drop_future(now)
+        slots.extend(times, now + HORIZON)
+        slots.close(now)
+
+    @callback
+    def match(self, records: List[Tuple[str, int, int]]) -> None:
+        """Match ``(entity_id, epoch, code)`` events; only taken and skipped fill slots."""
+        if not self._loaded:
+            return
+        for eid, ts, code in records:
+            if code not in (CODE_TAKEN, CODE_SKIPPED):
+                continue
+            slots = self._slots.get(eid)
+            if slots is None:
+                continue
+            times = self._times.get(eid)
+            if times:
+                slots.extend(times, ts + HORIZON)
+            slots.match(ts, code)
+            self._journal.append({"e": eid, "t": ts, "c": code})
+        self._async_compact_if_needed()
+
+    def _advance(self, now: int) -> Set[str]:
+        changed: Set[str] = set()
+        cutoff = now - DOSE_LEDGER_DAYS * 86400
+        for eid, slots in list(self._slots.items()):
+            times = self._times.get(eid)
+            if times:
+                slots.extend(times, now + HORIZON)
+            if slots.close(now):
+                changed.add(eid)
+            slots.prune(cutoff)
+            if not times and not len(slots):
+                # Removed long enough ago that nothing is left
+                del self._slots[eid]
+                self._stored_times.pop(eid, None)
+        return changed
+
+    @callback
+    def _arm(self) -> None:
+        if self._unsub_timer is not None:
+            self._unsub_timer()
+            self._unsub_timer = None
+        closes = [ts for ts in (slots.next_close() for slots in self._slots.values()) if ts is not None]
+        if closes:
+            self._unsub_timer = async_track_point_in_utc_time(
+                self.hass, self._handle_timer, dt_util.utc_from_timestamp(min(closes))
+            )
+
+    @callback
+    def _handle_timer(self, now: datetime) -> None:
+        self._unsub_timer = None
+        # Closing slots only depends on the clock, so nothing is written
+        changed = self._advance(int(now.timestamp()))
+        self._arm()
+        if changed:
+            self._on_change(changed)
+
+    def get(self, entity_id: str) -> DoseSlots | None:
+        return self._slots.get(entity_id)
+
+    def day_counts(self, entity_id: str, first: int, last: int) -> Dict[str, int] | None:
+        """Slot statuses of the local days ``first``..``last`` (date ordinals); None without slots."""
+        slots = self._slots.get(entity_id)
+        return None if slots is None else slots.counts(day_start(first), day_start(last + 1) - 1)
+
+    def covered_from(self, entity_id: str) -> int | None:
+        """First local day whose doses are all in the ledger; earlier days fall back to estimates."""
+        slots = self._slots.get(entity_id)
+        return None if slots is None else slots.covered_from
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "medications": len(self._slots),
+            "slots": sum(len(slots) for slots in self._slots.values()),
+            "extra_events": sum(slots.extra for slots in self._slots.values()),
+            "journal_lines": self._journal.lines,
+        }
+
@@ -0,0 +1,178 @@
+"""Internal counters and latency histograms for diagnostics and the debug sensor."""
+from __future__ import annotations
+
+import os
+import time
+import weakref
+from bisect import bisect_left
+from typing import TYPE_CHECKING, Any, Dict, List
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import STORAGE_DIR
+
+from .const import DOMAIN, DOSE_LEDGER_STORE_KEY, FORECAST_STORE_KEY, HISTORY_DB_FILE, HISTORY_STORE_KEY
+
+if TYPE_CHECKING:
+    from .sensor import MedicationSensor
+
+# Histogram bucket upper bounds in milliseconds; the last bucket is unbounded
+BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram; recording is O(log buckets) and allocation free."""
+
+    __slots__ = ("count", "total_ms", "max_ms", "buckets")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def observe(self, ms: float) -> None:
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+        self.buckets[bisect_left(BUCKETS_MS, ms)] += 1
+
+    def quantile(self, q: float) -> float | None:
+        """Upper bound of the bucket holding the ``q`` quantile (the max for the last one)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return BUCKETS_MS[i] if i < len(BUCKETS_MS) else round(self.max_ms, 3)
+        return round(self.max_ms, 3)
+
+    def as_dict(self) -> Dict[str, Any]:
+        labels = [f"<={b}ms" for b in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}ms"]
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else None,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "max_ms": round(self.max_ms, 3),
+            "buckets": {label: n for label, n in zip(labels, self.buckets) if n},
+        }
+
+
+class Metrics:
+    """Named latency histograms and counters for the integration's hot paths."""
+
+    def __init__(self) -> None:
+        self.started = time.time()
+        self.latency: Dict[str, LatencyHistogram] = {}
+        self.counters: Dict[str, int] = {}
+        # Every MedicationSensor created, so timers left on removed ones can be found
+        self.medications: "weakref.WeakSet[MedicationSensor]" = weakref.WeakSet()
+
+    def observe(self, name: str, start: float) -> None:
+        """Record the time since ``start`` (a ``time.perf_counter()`` value) under ``name``."""
+        hist = self.latency.get(name)
+        if hist is None:
+            hist = self.latency[name] = LatencyHistogram()
+        hist.observe((time.perf_counter() - start) * 1000)
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def hit_rates(self) -> Dict[str, float | None]:
+        """Hit rate of every cache counted as ``<name>_cache_hits`` / ``<name>_cache_misses``."""
+        rates: Dict[str, float | None] = {}
+        for counter, hits in self.counters.items():
+            if counter.endswith("_cache_hits"):
+                name = counter[: -len("_cache_hits")]
+                total = hits + self.counters.get(f"{name}_cache_misses", 0)
+                rates[name] = round(hits / total, 4) if total else None
+        return dict(sorted(rates.items()))
+
+    @property
+    def busy_ms(self) -> float:
+        """Total time spent in the timed paths."""
+        return sum(hist.total_ms for hist in self.latency.values())
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "uptime_s": round(time.time() - self.started),
+            "busy_ms": round(self.busy_ms, 3),
+            "latency": {name: hist.as_dict() for name, hist in sorted(self.latency.items())},
+            "counters": dict(sorted(self.counters.items())),
+            "cache_hit_rate": self.hit_rates(),
+        }
+
+
+def get_metrics(hass: HomeAssistant) -> Metrics:
+    """The installation-wide metrics, created on first use."""
+    store = hass.data.setdefault(DOMAIN, {})
+    metrics = store.get("metrics")
+    if metrics is None:
+        metrics = store["metrics"] = Metrics()
+    return metrics
+
+
+def track_medication(hass: HomeAssistant, entity: "MedicationSensor") -> None:
+    get_metrics(hass).medications.add(entity)
+
+
+def timer_report(hass: HomeAssistant) -> Dict[str, Any]:
+    """Scheduled dose slots and pending snooze/nag timers per medication.
+
+    Timers still held by medications that are no longer registered are
+    reported as leaked, as are scheduler slots of unknown entities.
+    """
+    registry = hass.data.get(DOMAIN, {}).get("entities", {})
+    scheduler = hass.data.get(DOMAIN, {}).get("scheduler")
+    slots = scheduler.slots_by_entity() if scheduler is not None else {}
+    medications: Dict[str, Dict[str, Any]] = {}
+    leaked: List[Dict[str, Any]] = []
+    for entity in list(get_metrics(hass).medications):
+        timers = entity.pending_timers
+        if registry.get(entity.entity_id) is entity:
+            medications[entity.entity_id] = {"dose_slots": slots.get(entity.entity_id, 0), **timers}
+        elif any(timers.values()):
+            leaked.append({"entity_id": entity.entity_id, **timers})
+    return {
+        "scheduler_slots": scheduler.slot_count if scheduler is not None else 0,
+        "scheduler_timer_armed": scheduler.timer_armed if scheduler is not None else False,
+        "orphan_slots": {eid: n for eid, n in slots.items() if eid not in registry},
+        "medications": medications,
+        "leaked": leaked,
+    }
+
+
+def _file_sizes(paths: List[str]) -> Dict[str, int]:
+    return {os.path.basename(p): os.path.getsize(p) for p in paths if os.path.exists(p)}
+
+
+async def async_storage_sizes(hass: HomeAssistant) -> Dict[str, int]:
+    """Size in bytes of each history file present in ``.storage``."""
+    base = hass.config.path(STORAGE_DIR)
+    names = [
+        HISTORY_STORE_KEY,
+        f"{HISTORY_STORE_KEY}.journal",
+        HISTORY_DB_FILE,
+        f"{HISTORY_DB_FILE}-wal",
+        DOSE_LEDGER_STORE_KEY,
+        f"{DOSE_LEDGER_STORE_KEY}.journal",
+        FORECAST_STORE_KEY,
+    ]
+    return await hass.async_add_executor_job(_file_sizes, [os.path.join(base, name) for name in names])
+
+
+async def async_build_report(hass: HomeAssistant) -> Dict[str, Any]:
+    """Everything the diagnostics download and the debug sensor show."""
+    store = hass.data.get(DOMAIN, {})
+    history = store.get("history")
+    return {
+        "metrics": get_metrics(hass).as_dict(),
+        "notify": dict(store.get("notify_stats", {})),
+        "timers": timer_report(hass),
+        "history": await history.async_stats() if history is not None else None,
+        "storage_bytes": await async_storage_sizes(hass),
+    }
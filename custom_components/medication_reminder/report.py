@@ -0,0 +1,212 @@
+"""Adherence reports for the get_adherence_report service.
+
+A report has, per medication and for all of them together, weekday × hour
+matrices of taken, skipped and missed doses, the mean delay of taken doses
+and adherence trends over consecutive windows.
+
+Matrices are counted per local hour of the week. Dose-ledger slots count at
+their scheduled time and give taken, skipped and missed doses; before a
+medication's ledger started, raw events count at the time they were
+recorded and give taken and skipped only. Both are tallied straight from the
+compact columns: hour-of-week keys come from ``map`` over ``operator``
+functions with one UTC offset per DST period and are counted by ``Counter``,
+so no Python code runs per event. Trends are the adherence percents the
+stats sensor shows, from the day rollups, with a least-squares slope.
+"""
+from __future__ import annotations
+
+import time
+from bisect import bisect_left
+from collections import Counter
+from datetime import date
+from itertools import compress, repeat
+from operator import add, floordiv, mod, mul
+from statistics import StatisticsError, linear_regression
+from typing import Any, Dict, List, Sequence, Tuple
+
+from homeassistant.util import dt as dt_util
+
+from .const import CODE_SKIPPED, CODE_TAKEN, SLOT_LATE, SLOT_MISSED, SLOT_ON_TIME, SLOT_SKIPPED
+from .history import HistoryManager, SummaryRows
+from .ledger import DoseSlots, day_start
+from .metrics import get_metrics
+
+WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+MATRICES = ("taken", "skipped", "missed")
+HOURS_PER_WEEK = 7 * 24
+# The epoch began on a Thursday; shifted by three days, hour 0 of the week is Monday 00:00
+_MONDAY = 3 * 86400
+# Matrix of each slot status and event code; the key is ``hour_of_week * 8 + code``
+_SLOT_MATRIX = {SLOT_ON_TIME: "taken", SLOT_LATE: "taken", SLOT_SKIPPED: "skipped", SLOT_MISSED: "missed"}
+_EVENT_MATRIX = {CODE_TAKEN: "taken", CODE_SKIPPED: "skipped"}
+# bytes.translate table turning slot statuses into a taken mask
+_TAKEN_MASK = bytes(1 if code in (SLOT_ON_TIME, SLOT_LATE) else 0 for code in range(256))
+
+
+def _utc_offset(ts: int) -> int:
+    return int(dt_util.as_local(dt_util.utc_from_timestamp(ts)).utcoffset().total_seconds())
+
+
+def offset_segments(start: int, end: int) -> List[Tuple[int, int]]:
+    """``(from_epoch, utc_offset)`` of each DST period within ``[start, end]``."""
+    segments = [(start, _utc_offset(start))]
+    t = start
+    while t < end:
+        nxt = min(t + 86400, end)
+        offset = _utc_offset(nxt)
+        if offset != segments[-1][1]:
+            # Narrow the transition down to the second
+            lo, hi = t, nxt
+            while hi - lo > 1:
+                mid = (lo + hi) // 2
+                if _utc_offset(mid) == segments[-1][1]:
+                    lo = mid
+                else:
+                    hi = mid
+            segments.append((hi, offset))
+        t = nxt
+    return segments
+
+
+def count_hours(counter: Counter, ts: Sequence[float], codes: Sequence[int], segments: List[Tuple[int, int]]) -> None:
+    """Tally ``hour_of_week * 8 + code`` of sorted columns; instants before the first segment are left out."""
+    edges = [bisect_left(ts, begin) for begin, _ in segments] + [len(ts)]
+    for (_, offset), lo, hi in zip(segments, edges, edges[1:]):
+        if lo == hi:
+            continue
+        hours = map(floordiv, map(add, ts[lo:hi], repeat(offset + _MONDAY)), repeat(3600))
+        counter.update(map(add, map(mul, map(mod, hours, repeat(HOURS_PER_WEEK)), repeat(8)), codes[lo:hi]))
+
+
+def _empty_matrices() -> Dict[str, List[List[int]]]:
+    return {name: [[0] * 24 for _ in WEEKDAYS] for name in MATRICES}
+
+
+def _fold(matrices: Dict[str, List[List[int]]], counter: Counter, names: Dict[int, str]) -> None:
+    for key, n in counter.items():
+        hour, code = divmod(int(key), 8)
+        name = names.get(code)
+        if name is not None:
+            matrices[name][hour // 24][hour % 24] += n
+
+
+def _add_matrices(total: Dict[str, List[List[int]]], matrices: Dict[str, List[List[int]]]) -> None:
+    for name, rows in matrices.items():
+        for into, row in zip(total[name], rows):
+            into[:] = map(add, into, row)
+
+
+def _slot_delays(slots: DoseSlots, lo: int) -> Tuple[int, int, int]:
+    """On-time and late doses and their summed delay in seconds, from slot ``lo`` on."""
+    status = slots.status[lo:]
+    mask = status.translate(_TAKEN_MASK)
+    return status.count(SLOT_ON_TIME), status.count(SLOT_LATE), sum(compress(slots.delay[lo:], mask))
+
+
+def _delay(on_time: int, late: int, seconds: int) -> Dict[str, Any]:
+    taken = on_time + late
+    return {
+        "on_time": on_time,
+        "late": late,
+        "mean_minutes": round(seconds / taken / 60, 1) if taken else None,
+    }
+
+
+def window_bounds(first_day: int, today: int, window_days: int) -> List[Tuple[int, int]]:
+    """First and last day of consecutive ``window_days`` windows, the last one ending today."""
+    count = max(1, (today - first_day + 1) // window_days)
+    return [(last - window_days + 1, last) for last in range(today - (count - 1) * window_days, today + 1, window_days)]
+
+
+def _windows(rows: SummaryRows, bounds: List[Tuple[int, int]]) -> List[List[int]]:
+    """Taken, skipped and expected doses of each window."""
+    tracking_start = rows.tracking_start
+    out = []
+    for first, last in bounds:
+        if tracking_start is None or tracking_start > last:
+            out.append([0, 0, 0])
+            continue
+        taken, skipped, _, expected = rows.totals(max(first, tracking_start), last)
+        out.append([taken, skipped, expected])
+    return out
+
+
+def _trend(windows: List[List[int]], labels: List[Tuple[str, str]], window_days: int) -> Dict[str, Any]:
+    rows = []
+    points: List[Tuple[int, float]] = []
+    for i, ((taken, skipped, expected), (start, end)) in enumerate(zip(windows, labels)):
+        percent = round(taken / expected * 100, 1) if expected else None
+        if percent is not None:
+            points.append((i, percent))
+        rows.append(
+            {"start": start, "end": end, "taken": taken, "skipped": skipped, "expected": expected, "percent": percent}
+        )
+    try:
+        slope = round(linear_regression(*zip(*points)).slope, 2) if len(points) > 1 else None
+    except StatisticsError:
+        slope = None
+    # Slope is in percentage points per window
+    return {"window_days": window_days, "slope": slope, "windows": rows}
+
+
+async def async_adherence_report(
+    history: HistoryManager, entity_ids: List[str], days: int, window_days: int
+) -> Dict[str, Any]:
+    """Report over the last ``days`` local days, today included, with trend windows of ``window_days``."""
+    began = time.perf_counter()
+    now = dt_util.now()
+    today = now.date().toordinal()
+    first_day = today - days + 1
+    start = day_start(first_day)
+    # Slots up to a day ahead can already be taken early
+    segments = offset_segments(start, int(now.timestamp()) + 2 * 86400)
+    bounds = window_bounds(first_day, today, window_days)
+    labels = [(date.fromordinal(first).isoformat(), date.fromordinal(last).isoformat()) for first, last in bounds]
+    rows = await history.async_summary_rows(entity_ids, days, now)
+    # Rollup buckets may be the backend's own lists; read them before awaiting again
+    windows = {eid: _windows(rows[eid], bounds) for eid in entity_ids}
+
+    overall_matrices = _empty_matrices()
+    overall_delay = [0, 0, 0]
+    medications: Dict[str, Any] = {}
+    for eid in entity_ids:
+        matrices = _empty_matrices()
+        delays = (0, 0, 0)
+        events_before = None
+        slots = history.ledger.get(eid)
+        if slots is not None:
+            lo = bisect_left(slots.ts, start)
+            counter: Counter = Counter()
+            count_hours(counter, slots.ts[lo:], slots.status[lo:], segments)
+            _fold(matrices, counter, _SLOT_MATRIX)
+            delays = _slot_delays(slots, lo)
+            events_before = slots.since
+        if events_before is None or events_before > start:
+            # Before the ledger started only the recorded events are known
+            counter = Counter()
+            end = dt_util.utc_from_timestamp(events_before - 1) if events_before is not None else None
+            async for ts, codes in history.async_iter_events(eid, dt_util.utc_from_timestamp(start), end):
+                count_hours(counter, ts, codes, segments)
+            _fold(matrices, counter, _EVENT_MATRIX)
+        _add_matrices(overall_matrices, matrices)
+        overall_delay[:] = map(add, overall_delay, delays)
+        medications[eid] = {
+            "matrix": matrices,
+            "delay": _delay(*delays),
+            "trend": _trend(windows[eid], labels, window_days),
+            "ledger_since": dt_util.utc_from_timestamp(slots.since).isoformat() if slots is not None else None,
+        }
+
+    overall_windows = [list(map(sum, zip(*column))) for column in zip(*windows.values())] if windows else []
+    get_metrics(history.hass).observe("adherence_report", began)
+    return {
+        "start": date.fromordinal(first_day).isoformat(),
+        "end": date.fromordinal(today).isoformat(),
+        "weekdays": WEEKDAYS,
+        "overall": {
+            "matrix": overall_matrices,
+            "delay": _delay(*overall_delay),
+            "trend": _trend(overall_windows, labels, window_days),
+        },
+        "medications": medications,
+    }
@@ -0,0 +1,200 @@
+"""Integration-wide scheduler for medication dose times."""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Iterable, List, Set, Tuple
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.event import async_track_point_in_utc_time
+from homeassistant.util import dt as dt_util
+
+from .metrics import get_metrics
+
+_LOGGER = logging.getLogger(__name__)
+
+DoseAction = Callable[[], Awaitable[None]]
+GroupAction = Callable[[List[str]], Awaitable[None]]
+
+
+def next_dose_time(time_str: str, now: datetime) -> datetime:
+    """Return the next local occurrence of ``HH:MM`` strictly after ``now``."""
+    hh, mm = (int(x) for x in time_str.split(":"))
+    target = now.replace(hour=hh, minute=mm, second=0, microsecond=0)
+    if target <= now:
+        target += timedelta(days=1)
+    return target
+
+
+class DoseScheduler:
+    """Keeps every medication's upcoming dose slots in one heap.
+
+    Only a single Home Assistant timer is armed, for the earliest slot. When it
+    fires, every medication due in that minute is dispatched together and its
+    next-day slot is pushed back onto the heap, so the number of timers stays
+    constant no matter how many medications and dose times are configured.
+
+    Medications registered with ``group=True`` that fall due in the same
+    minute are handed to ``group_action`` as one batch instead of running
+    their own actions.
+    """
+
+    def __init__(self, hass: HomeAssistant, group_action: GroupAction | None = None) -> None:
+        self.hass = hass
+        self._group_action = group_action
+        self._grouped: Set[str] = set()
+        # (due timestamp, entity_id, "HH:MM", registration generation)
+        self._heap: List[Tuple[float, str, str, int]] = []
+        self._actions: Dict[str, DoseAction] = {}
+        # Re-registering bumps the generation; stale heap entries are skipped lazily
+        self._generation: Dict[str, int] = {}
+        self._live = 0
+        self._unsub_timer: CALLBACK_TYPE | None = None
+        self._timer_ts: float | None = None
+
+    @property
+    def slot_count(self) -> int:
+        """Number of live dose slots currently scheduled."""
+        return self._live
+
+    @callback
+    def async_register(self, entity_id: str, times: List[str], action: DoseAction, group: bool = False) -> None:
+        """Schedule ``action`` at each of ``times`` every day, replacing earlier slots."""
+        self.async_unregister(entity_id)
+        gen = self._generation.get(entity_id, 0) + 1
+        self._generation[entity_id] = gen
+        self._actions[entity_id] = action
+        if group:
+            self._grouped.add(entity_id)
+        now = dt_util.now()
+        for t in times:
+            heapq.heappush(self._heap, (next_dose_time(t, now).timestamp(), entity_id, t, gen))
+            self._live += 1
+        self._compact()
+        self._arm()
+
+    @callback
+    def async_register_many(self, registrations: Iterable[Tuple[str, List[str], DoseAction, bool]]) -> None:
+        """Register several ``(entity_id, times, action, group)`` at once.
+
+        Equivalent to calling ``async_register`` for each, but the heap is
+        rebuilt and the timer re-armed only once for the whole batch.
+        """
+        now = dt_util.now()
+        for entity_id, times, action, group in registrations:
+            self._grouped.discard(entity_id)
+            gen = self._generation.get(entity_id, 0) + 1
+            self._generation[entity_id] = gen
+            self._actions[entity_id] = action
+            if group:
+                self._grouped.add(entity_id)
+            self._heap.extend((next_dose_time(t, now).timestamp(), entity_id, t, gen) for t in times)
+        self._live = sum(1 for entry in self._heap if self._is_live(entry))
+        heapq.heapify(self._heap)
+        self._compact()
+        self._arm()
+
+    def is_registered(self, entity_id: str) -> bool:
+        return entity_id in self._actions
+
+    @property
+    def timer_armed(self) -> bool:
+        return self._unsub_timer is not None
+
+    def slots_by_entity(self) -> Dict[str, int]:
+        """Live dose slots per entity_id."""
+        slots: Dict[str, int] = {}
+        for entry in self._heap:
+            if self._is_live(entry):
+                slots[entry[1]] = slots.get(entry[1], 0) + 1
+        return slots
+
+    @callback
+    def async_unregister(self, entity_id: str) -> None:
+        """Drop all slots for ``entity_id``."""
+        self._grouped.discard(entity_id)
+        if self._actions.pop(entity_id, None) is None:
+            return
+        self._generation[entity_id] = self._generation.get(entity_id, 0) + 1
+        self._live = sum(1 for _, eid, _, gen in self._heap if self._generation.get(eid) == gen)
+        self._compact()
+        self._arm()
+
+    @callback
+    def async_stop(self) -> None:
+        """Cancel the timer and forget every slot."""
+        if self._unsub_timer is not None:
+            self._unsub_timer()
+            self._unsub_timer = None
+            self._timer_ts = None
+        self._heap.clear()
+        self._actions.clear()
+        self._grouped.clear()
+        self._live = 0
+
+    def _is_live(self, entry: Tuple[float, str, str, int]) -> bool:
+        return self._generation.get(entry[1]) == entry[3] and entry[1] in self._actions
+
+    def _compact(self) -> None:
+        # Rebuild once stale entries outnumber live ones to keep the heap bounded
+        if len(self._heap) > 2 * self._live + 16:
+            self._heap = [entry for entry in self._heap if self._is_live(entry)]
+            heapq.heapify(self._heap)
+
+    def _arm(self) -> None:
+        while self._heap and not self._is_live(self._heap[0]):
+            heapq.heappop(self._heap)
+        next_ts = self._heap[0][0] if self._heap else None
+        if next_ts == self._timer_ts:
+            return
+        if self._unsub_timer is not None:
+            self._unsub_timer()
+            self._unsub_timer = None
+        self._timer_ts = next_ts
+        if next_ts is not None:
+            self._unsub_timer = async_track_point_in_utc_time(
+                self.hass, self._handle_timer, dt_util.utc_from_timestamp(next_ts)
+            )
+
+    @callback
+    def _handle_timer(self, _now: datetime) -> None:
+        self._unsub_timer = None
+        self._timer_ts = None
+        now = dt_util.now()
+        # Everything due up to the end of this minute fires together
+        horizon = now.replace(second=59, microsecond=999999).timestamp()
+        due: List[str] = []
+        while self._heap and self._heap[0][0] <= horizon:
+            entry = heapq.heappop(self._heap)
+            if not self._is_live(entry):
+                continue
+            _, entity_id, t, gen = entry
+            due.append(entity_id)
+            heapq.heappush(self._heap, (next_dose_time(t, now).timestamp(), entity_id, t, gen))
+        self._arm()
+        if due:
+            _LOGGER.debug("Dose slot %s: %d medication(s) due", now.strftime("%H:%M"), len(due))
+            self.hass.async_create_task(self._async_dispatch(due))
+
+    async def _async_dispatch(self, entity_ids: List[str]) -> None:
+        metrics = get_metrics(self.hass)
+        start = time.perf_counter()
+        due = [eid for eid in dict.fromkeys(entity_ids) if eid in self._actions]
+        grouped = [eid for eid in due if eid in self._grouped]
+        if self._group_action is None or len(grouped) < 2:
+            grouped = []
+        names = [eid for eid in due if eid not in grouped]
+        jobs = [self._actions[eid]() for eid in names]
+        if grouped:
+            jobs.append(self._group_action(grouped))
+            names.append(", ".join(grouped))
+        results = await asyncio.gather(*jobs, return_exceptions=True)
+        metrics.observe("reminder_dispatch", start)
+        metrics.increment("reminders_dispatched", len(due))
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                metrics.increment("reminder_failures")
+                _LOGGER.error("Reminder for %s failed: %s", name, result)
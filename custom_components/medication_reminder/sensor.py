@@ -3,19 +3,23 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from datetime import timedelta
-from typing import Callable, List, Optional
+import logging
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
 import re
 
 import voluptuous as vol
 
 from homeassistant.components.sensor import SensorEntity, SensorStateClass
 from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import EntityCategory, UnitOfTime
 from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.event import async_track_point_in_time, async_call_later
-from homeassistant.helpers.dispatcher import async_dispatcher_connect
 from homeassistant.util import dt as dt_util
 from homeassistant.helpers.entity import async_generate_entity_id
+from homeassistant.helpers import entity_registry as er
+from homeassistant.helpers.dispatcher import async_dispatcher_connect, async_dispatcher_send
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
 
 from .const import (
     DOMAIN,
@@ -23,19 +27,40 @@ from .const import (
     ATTR_LAST_ACTION,
     ATTR_NAME,
     ATTR_TIMES,
+    CONF_ENTRY_TYPE,
+    CONF_MEDICATIONS,
+    ENTRY_TYPE_LIST,
     DEFAULT_SNOOZE_MINUTES,
+    DEFAULT_HISTORY_DAYS,
+    DEFAULT_HISTORY_MAX_EVENTS,
+    SIGNAL_MEDICATIONS_UPDATED,
+    SIGNAL_REFILL_UPDATED,
     STATE_PENDING,
     STATE_SNOOZED,
-    SIGNAL_HISTORY_UPDATED,
 )
+from .coordinator import MedicationCoordinator
 from .history import HistoryManager
+from .metrics import async_build_report, get_metrics, track_medication
+from .scheduler import DoseScheduler
+from .util import async_send_notifications
 
+_LOGGER = logging.getLogger(__name__)
 
 def _slugify(name: str) -> str:
     base = "".join(ch if ch.isalnum() else "_" for ch in name.lower())
     return "_".join([p for p in base.split("_") if p])
 
 
+def _entity_id(hass: HomeAssistant, unique_id: str, object_id: str) -> str:
+    """The registered entity_id for ``unique_id``, else a free ``sensor.<object_id>``.
+
+    Known before the entity is added, so schedules and retention can be
+    registered under the id the entity will actually get.
+    """
+    registered = er.async_get(hass).async_get_entity_id("sensor", DOMAIN, unique_id)
+    return registered or async_generate_entity_id("sensor.{}", object_id, hass=hass)
+
+
 def _parse_times(value: str | list[str]) -> list[str]:
     """Parse HH:MM or list of HH:MM values; return normalized list."""
     if isinstance(value, list):
@@ -65,110 +90,202 @@ def _parse_times(value: str | list[str]) -> list[str]:
     return unique
 
 
+def _sanitize_services(raw: str) -> List[str]:
+    """Allow 'notify.xxx' or 'xxx'; return normalized unique list of 'xxx'."""
+    out: list[str] = []
+    seen: set[str] = set()
+    pat = re.compile(r"^(?:notify\.)?[a-z0-9_]+$")
+    for svc in (s.strip() for s in (raw or "").split(",")):
+        if not pat.fullmatch(svc):
+            continue
+        name = svc.split(".", 1)[1] if svc.startswith("notify.") else svc
+        if name not in seen:
+            seen.add(name)
+            out.append(name)
+    return out
+
+
+def _entry_config(entry: ConfigEntry) -> Dict[str, Any]:
+    """Entry data overlaid with its non-empty options."""
+    options = {key: value for key, value in entry.options.items() if value not in ("", None, [])}
+    return {ATTR_NAME: entry.title, **entry.data, **options}
+
+
+def _medication_settings(config: Mapping[str, Any]) -> Dict[str, Any]:
+    """MedicationSensor arguments from an entry config or a list item."""
+    times_raw = config.get(ATTR_TIMES) or []
+    return {
+        "name": config.get(ATTR_NAME) or "Medication",
+        "dose": (config.get(ATTR_DOSE) or "").strip(),
+        "times": _parse_times(times_raw) if isinstance(times_raw, str) else list(times_raw),
+        "snooze_minutes": int(config.get("snooze_minutes", DEFAULT_SNOOZE_MINUTES)),
+        "notify_services": _sanitize_services(config.get("notify_services") or ""),
+        "nag_interval": int(config.get("nag_interval_minutes", 5)),
+        "nag_max": int(config.get("nag_max", 3)),
+        "refill_total": int(config.get("refill_total", 0)),
+        "refill_threshold": int(config.get("refill_threshold", 0)),
+        "refill_lead_days": int(config.get("refill_lead_days", 0)),
+        "units_per_intake": int(config.get("dose_units_per_intake", 1)),
+        "history_days": int(config.get("history_days", DEFAULT_HISTORY_DAYS)),
+        "history_max_events": int(config.get("history_max_events", DEFAULT_HISTORY_MAX_EVENTS)),
+        "group_notifications": bool(config.get("group_notifications", False)),
+    }
+
+
+_Medication = Tuple["MedicationSensor", "MedicationAdherenceSensor", "MedicationStatsSensor", "MedicationSupplySensor"]
+
+
+def _create_medication(hass: HomeAssistant, settings: Dict[str, Any], entry_id: str) -> _Medication:
+    history: HistoryManager = hass.data[DOMAIN]["history"]
+    coordinator: MedicationCoordinator = hass.data[DOMAIN]["coordinator"]
+    med_entity = MedicationSensor(hass=hass, entry_id=entry_id, **settings)
+    slug = _slugify(settings["name"])
+    hist_entity = MedicationAdherenceSensor(hass, settings["name"], coordinator, med_entity.entity_id, slug)
+    stats_entity = MedicationStatsSensor(hass, settings["name"], coordinator, med_entity.entity_id, slug)
+    supply_entity = MedicationSupplySensor(hass, settings["name"], coordinator, med_entity.entity_id, slug)
+    # Register schedule and retention before the coordinator computes the first statistics
+    history.set_retention(med_entity.entity_id, settings["history_days"], settings["history_max_events"])
+    history.set_schedule(med_entity.entity_id, len(settings["times"]))
+    history.set_dose_times(med_entity.entity_id, settings["times"])
+    coordinator.async_set_medication(med_entity.entity_id, settings["times"])
+    return med_entity, hist_entity, stats_entity, supply_entity
+
+
+@callback
+def _async_add_medications(
+    hass: HomeAssistant, medications: List[_Medication], async_add_entities: AddEntitiesCallback
+) -> None:
+    """Schedule every dose in one pass, then add all sensors in one call."""
+    if not medications:
+        return
+    scheduler: DoseScheduler = hass.data[DOMAIN]["scheduler"]
+    scheduler.async_register_many(medication[0].dose_registration for medication in medications)
+    async_add_entities([entity for medication in medications for entity in medication])
+
+
+@callback
+def _async_add_debug_sensor(hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback) -> None:
+    """Add the installation's single debug sensor to the entry that set up first."""
+    store = hass.data[DOMAIN]
+    if store.get("debug_entry") not in (None, entry.entry_id):
+        return
+    store["debug_entry"] = entry.entry_id
+    async_add_entities([MedicationDiagnosticsSensor(hass)])
+
+
+@callback
+def _async_apply_settings(
+    medication: _Medication, settings: Dict[str, Any], previous: Optional[Dict[str, Any]] = None
+) -> None:
+    """Push changed settings to a medication's sensors; everything when ``previous`` is None."""
+    med_entity = medication[0]
+    changes = {
+        key: value for key, value in settings.items()
+        if key != "name" and (previous is None or previous.get(key) != value)
+    }
+    if not changes:
+        return
+    med_entity.update_config(**changes)
+
+
 async def async_setup_entry(
     hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback
 ) -> None:
-    name: str = entry.data.get(ATTR_NAME) or entry.title or "Medication"
-    dose: str = (entry.options.get(ATTR_DOSE) or entry.data.get(ATTR_DOSE) or "").strip()
-    times_raw = entry.options.get(ATTR_TIMES) or entry.data.get(ATTR_TIMES) or []
-    times = _parse_times(times_raw) if isinstance(times_raw, str) else list(times_raw)
-
-    snooze_minutes = int(entry.options.get("snooze_minutes", DEFAULT_SNOOZE_MINUTES))
-    notify_services_raw = (entry.options.get("notify_services") or "").strip()
-    raw_services = [s.strip() for s in notify_services_raw.split(",") if s.strip()]
-
-    def _sanitize_services(services: List[str]) -> List[str]:
-        """Allow 'notify.xxx' or 'xxx'; return normalized unique list of 'xxx'."""
-        out: list[str] = []
-        seen: set[str] = set()
-        pat = re.compile(r"^(?:notify\.)?[a-z0-9_]+$")
-        for svc in services:
-            if not pat.fullmatch(svc):
-                continue
-            name = svc.split(".", 1)[1] if svc.startswith("notify.") else svc
-            if name not in seen:
-                seen.add(name)
-                out.append(name)
-        return out
-
-    notify_services = _sanitize_services(raw_services)
-
-    nag_interval = int(entry.options.get("nag_interval_minutes", 5))
-    nag_max = int(entry.options.get("nag_max", 3))
-    refill_total = int(entry.options.get("refill_total", 0))
-    refill_threshold = int(entry.options.get("refill_threshold", 0))
-    units_per_intake = int(entry.options.get("dose_units_per_intake", 1))
-
-    med_entity = MedicationSensor(
-        hass=hass,
-        name=name,
-        dose=dose,
-        times=times,
-        snooze_minutes=snooze_minutes,
-        notify_services=notify_services,
-        nag_interval=nag_interval,
-        nag_max=nag_max,
-        refill_total=refill_total,
-        refill_threshold=refill_threshold,
-        units_per_intake=units_per_intake,
-        entry_id=entry.entry_id,
-    )
+    _async_add_debug_sensor(hass, entry, async_add_entities)
+    if entry.data.get(CONF_ENTRY_TYPE) == ENTRY_TYPE_LIST:
+        await _async_setup_list_entry(hass, entry, async_add_entities)
+        return
 
-    history: HistoryManager = hass.data[DOMAIN]["history"]
-    hist_entity = MedicationAdherenceSensor(
-        hass=hass,
-        name=name,
-        times=times,
-        history=history,
-        source_entity_id=None,  # Will be filled after med_entity has entity_id
-        slug=_slugify(name),
-    )
-
-    stats_entity = MedicationStatsSensor(
-        hass=hass,
-        name=name,
-        times=times,
-        history=history,
-        source_entity_id=None,  # Set after med_entity created
-        slug=_slugify(name),
-    )
-
-    # Link adherence sensor to the medication entity
-    hist_entity.set_source_entity_id(med_entity.entity_id)
-    stats_entity.set_source_entity_id(med_entity.entity_id)
-    async_add_entities([med_entity, hist_entity, stats_entity])
+    medication = _create_medication(hass, _medication_settings(_entry_config(entry)), entry.entry_id)
+    _async_add_medications(hass, [medication], async_add_entities)
 
     async def _options_updated(hass: HomeAssistant, updated_entry: ConfigEntry):
-        new_dose = (updated_entry.options.get(ATTR_DOSE) or updated_entry.data.get(ATTR_DOSE) or "").strip()
-        new_times_raw = updated_entry.options.get(ATTR_TIMES) or updated_entry.data.get(ATTR_TIMES) or []
-        new_times = (
-            _parse_times(new_times_raw) if isinstance(new_times_raw, str) else list(new_times_raw)
-        )
-        new_snooze = int(updated_entry.options.get("snooze_minutes", DEFAULT_SNOOZE_MINUTES))
-        new_notify_raw = (updated_entry.options.get("notify_services") or "").strip()
-        new_notify = [s.strip() for s in new_notify_raw.split(",") if s.strip()]
-        new_nag_interval = int(updated_entry.options.get("nag_interval_minutes", 5))
-        new_nag_max = int(updated_entry.options.get("nag_max", 3))
-        new_units = int(updated_entry.options.get("dose_units_per_intake", 1))
-        new_refill_total = int(updated_entry.options.get("refill_total", 0))
-        new_refill_threshold = int(updated_entry.options.get("refill_threshold", 0))
-        med_entity.update_config(
-            dose=new_dose,
-            times=new_times,
-            snooze_minutes=new_snooze,
-            notify_services=new_notify,
-            nag_interval=new_nag_interval,
-            nag_max=new_nag_max,
-            units_per_intake=new_units,
-            refill_total=new_refill_total,
-            refill_threshold=new_refill_threshold,
-        )
-        hist_entity.update_times(new_times)
-        stats_entity.update_times(new_times)
+        _async_apply_settings(medication, _medication_settings(_entry_config(updated_entry)))
 
     entry.async_on_unload(entry.add_update_listener(_options_updated))
 
 
+async def _async_setup_list_entry(
+    hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback
+) -> None:
+    """Set up every medication of a list entry with a single add and scheduling pass.
+
+    Later edits to the list (options flow or ``import_medications``) update,
+    add and remove medications in place instead of reloading the entry.
+    """
+    medications: Dict[str, _Medication] = {}
+    applied: Dict[str, Dict[str, Any]] = {}
+
+    @callback
+    def _add(configs: List[Mapping[str, Any]]) -> None:
+        new: List[_Medication] = []
+        for config in configs:
+            settings = _medication_settings(config)
+            slug = _slugify(settings["name"])
+            if slug in medications:
+                continue
+            medications[slug] = _create_medication(hass, settings, entry.entry_id)
+            applied[slug] = settings
+            new.append(medications[slug])
+        _async_add_medications(hass, new, async_add_entities)
+
+    _add(entry.data.get(CONF_MEDICATIONS, []))
+    _LOGGER.debug("%s: list %s set up with %d medication(s)", DOMAIN, entry.title, len(medications))
+
+    async def _list_updated(hass: HomeAssistant, updated_entry: ConfigEntry):
+        wanted = {_slugify(config[ATTR_NAME]): config for config in updated_entry.data.get(CONF_MEDICATIONS, [])}
+        registry = er.async_get(hass)
+        for slug in [slug for slug in medications if slug not in wanted]:
+            applied.pop(slug)
+            for entity in medications.pop(slug):
+                if registry.async_get(entity.entity_id):
+                    # Removing the registry entry removes the entity as well
+                    registry.async_remove(entity.entity_id)
+                else:
+                    await entity.async_remove()
+        for slug, config in wanted.items():
+            if slug in medications:
+                settings = _medication_settings(config)
+                _async_apply_settings(medications[slug], settings, applied[slug])
+                applied[slug] = settings
+        _add([config for slug, config in wanted.items() if slug not in medications])
+
+    entry.async_on_unload(entry.add_update_listener(_list_updated))
+
+
+async def async_send_group_reminder(hass: HomeAssistant, entity_ids: List[str]) -> None:
+    """Send one reminder per recipient for several medications due together.
+
+    Every notify service gets a single message listing the medications it
+    covers, with "Taken all" / "Snooze all" actions carrying their entity ids.
+    """
+    registry = hass.data[DOMAIN]["entities"]
+    meds: List[MedicationSensor] = [registry[eid] for eid in entity_ids if eid in registry]
+    if not meds:
+        return
+    title = "Medication Reminder"
+    message = "\n".join(med.reminder_message for med in meds)
+    calls = [("persistent_notification", "create", {"title": title, "message": message})]
+    by_service: dict[str, List[MedicationSensor]] = {}
+    for med in meds:
+        for service in med.notify_services:
+            by_service.setdefault(service, []).append(med)
+    for service, targets in by_service.items():
+        data = {
+            "tag": f"{DOMAIN}_group",
+            "actions": [
+                {"action": "MED_TAKEN_ALL", "title": "Taken all"},
+                {"action": "MED_SNOOZE_ALL", "title": "Snooze all"},
+            ],
+            "action_data": {"entity_ids": [med.entity_id for med in targets]},
+        }
+        text = "\n".join(med.reminder_message for med in targets)
+        calls.append(("notify", service, {"title": title, "message": text, "data": data}))
+    await async_send_notifications(hass, calls)
+    for med in meds:
+        med.reminder_sent()
+
+
 @dataclass
 class _LastAction:
     status: str
@@ -180,14 +297,32 @@ class MedicationSensor(SensorEntity):
 
     _attr_icon = "mdi:pill"
 
-    def __init__(self, hass: HomeAssistant, name: str, dose: str, times: list[str], snooze_minutes: int, notify_services: list[str], nag_interval: int, nag_max: int, refill_total: int, refill_threshold: int, units_per_intake: int, entry_id: str):
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        name: str,
+        dose: str,
+        times: list[str],
+        snooze_minutes: int,
+        notify_services: list[str],
+        nag_interval: int,
+        nag_max: int,
+        refill_total: int,
+        refill_threshold: int,
+        units_per_intake: int,
+        entry_id: str,
+        history_days: int = DEFAULT_HISTORY_DAYS,
+        history_max_events: int = DEFAULT_HISTORY_MAX_EVENTS,
+        group_notifications: bool = False,
+        refill_lead_days: int = 0,
+    ):
         self.hass = hass
         self._name = name
         self._dose = dose
         self._times = times
         self._state = STATE_PENDING
         self._last_action: Optional[_LastAction] = None
-        self._unsubs: list[Callable[[], None]] = []
+        self._snooze_unsub: Optional[Callable[[], None]] = None
         self._snooze_minutes = snooze_minutes
         self._notify_services = notify_services
         self._nag_interval = max(0, int(nag_interval))
@@ -196,14 +331,19 @@ class MedicationSensor(SensorEntity):
         self._nag_unsub: Optional[Callable[[], None]] = None
         self._units_per_intake = max(1, int(units_per_intake))
         self._refill_threshold = max(0, int(refill_threshold))
+        self._refill_lead_days = max(0, int(refill_lead_days))
         self._init_refill_total = max(0, int(refill_total))
+        self._history_days = max(1, int(history_days))
+        self._history_max_events = max(1, int(history_max_events))
+        self._group_notifications = bool(group_notifications)
         self._entry_id = entry_id
+        track_medication(hass, self)
 
         slug = _slugify(name)
         self._attr_name = name
         self._attr_unique_id = f"med_{slug}"
         # Stable entity_id using HA helper; remains sensor.medication_<slug> when free
-        self.entity_id = async_generate_entity_id("sensor.{}", f"medication_{slug}", hass=hass)
+        self.entity_id = _entity_id(hass, self._attr_unique_id, f"medication_{slug}")
         self._attr_device_info = {
             "identifiers": {(DOMAIN, "medication_reminder")},
             "name": "Medication Reminder",
@@ -236,73 +376,81 @@ class MedicationSensor(SensorEntity):
             "notify_services": [f"notify.{s}" for s in self._notify_services],
             "nag_interval_minutes": self._nag_interval,
             "nag_max": self._nag_max,
+            "group_notifications": self._group_notifications,
             "refill_remaining": refill.get("remaining"),
             "refill_threshold": refill.get("threshold"),
+            "refill_lead_days": self._refill_lead_days,
             "units_per_intake": refill.get("units_per_intake", self._units_per_intake),
             "refill_needed": bool(refill.get("alerted", False)) if refill else False,
-            ATTR_LAST_ACTION: None
-            if not self._last_action
-            else {"status": self._last_action.status, "timestamp": self._last_action.timestamp},
+            ATTR_LAST_ACTION: self.last_action,
         }
 
     async def async_added_to_hass(self) -> None:
         # Register in shared mapping so services can find us by entity_id
         self.hass.data.setdefault(DOMAIN, {}).setdefault("entities", {})[self.entity_id] = self
-        self._schedule_all()
+        async_dispatcher_send(self.hass, SIGNAL_MEDICATIONS_UPDATED, self.entity_id)
+        scheduler: DoseScheduler = self.hass.data[DOMAIN]["scheduler"]
+        # Platform setup normally registers the whole batch before adding it
+        if not scheduler.is_registered(self.entity_id):
+            self._schedule_doses()
+        # Refill records come with the history load, which entity setup does not wait for
+        self.hass.async_create_task(self._async_init_refill())
+
+    async def _async_init_refill(self) -> None:
         # Initialize refill persistence (from options if present and nothing stored yet)
         history: HistoryManager = self.hass.data[DOMAIN]["history"]
-        info = history.get_refill(self.entity_id)
+        info = await history.async_get_refill(self.entity_id)
         if info is None and (self._init_refill_total > 0 or self._refill_threshold > 0):
-            await history.set_refill(self.entity_id, remaining=self._init_refill_total, threshold=self._refill_threshold, units_per_intake=self._units_per_intake)
+            await history.set_refill(
+                self.entity_id,
+                remaining=self._init_refill_total,
+                threshold=self._refill_threshold,
+                units_per_intake=self._units_per_intake,
+            )
+        self.async_write_ha_state()
 
     async def async_will_remove_from_hass(self) -> None:
-        for u in self._unsubs:
-            u()
-        self._unsubs.clear()
+        scheduler: DoseScheduler | None = self.hass.data.get(DOMAIN, {}).get("scheduler")
+        if scheduler is not None:
+            scheduler.async_unregister(self.entity_id)
+        coordinator: MedicationCoordinator | None = self.hass.data.get(DOMAIN, {}).get("coordinator")
+        if coordinator is not None:
+            coordinator.async_remove_medication(self.entity_id)
+        history: HistoryManager | None = self.hass.data.get(DOMAIN, {}).get("history")
+        if history is not None:
+            history.set_dose_times(self.entity_id, [])
+        self._cancel_snooze()
         if self._nag_unsub:
             self._nag_unsub()
             self._nag_unsub = None
         self.hass.data.get(DOMAIN, {}).get("entities", {}).pop(self.entity_id, None)
+        async_dispatcher_send(self.hass, SIGNAL_MEDICATIONS_UPDATED, self.entity_id)
 
-    def _schedule_all(self) -> None:
-        # Cancel any existing schedules
-        for u in self._unsubs:
-            u()
-        self._unsubs.clear()
-
-        now = dt_util.now()
-        for t in self._times:
-            hh, mm = (int(x) for x in t.split(":"))
-            target = now.replace(hour=hh, minute=mm, second=0, microsecond=0)
-            if target <= now:
-                target += timedelta(days=1)
-
-            def _cb(_, hhi=hh, mmi=mm):
-                self.hass.async_create_task(self._async_send_reminder())
-                # After firing, schedule next day's reminder for this time
-                self._reschedule_time(hhi, mmi)
-
-            unsub = async_track_point_in_time(self.hass, _cb, target)
-            self._unsubs.append(unsub)
+    @property
+    def pending_timers(self) -> Dict[str, bool]:
+        """Whether a snooze or nag timer is currently scheduled."""
+        return {"snooze_timer": self._snooze_unsub is not None, "nag_timer": self._nag_unsub is not None}
 
-    def _reschedule_time(self, hh: int, mm: int) -> None:
-        next_time = dt_util.now().replace(hour=hh, minute=mm, second=0, microsecond=0) + timedelta(days=1)
+    @property
+    def dose_registration(self) -> Tuple[str, List[str], Callable[[], Any], bool]:
+        """Arguments for registering this medication's dose times with the scheduler."""
+        return self.entity_id, self._times, self._async_send_reminder, self._group_notifications
 
-        def _cb(_, hhi=hh, mmi=mm):
-            self.hass.async_create_task(self._async_send_reminder())
-            self._reschedule_time(hhi, mmi)
+    def _schedule_doses(self) -> None:
+        # Dose times live in the shared scheduler; re-registering replaces old slots
+        scheduler: DoseScheduler = self.hass.data[DOMAIN]["scheduler"]
+        entity_id, times, action, group = self.dose_registration
+        scheduler.async_register(entity_id, times, action, group=group)
 
-        unsub = async_track_point_in_time(self.hass, _cb, next_time)
-        self._unsubs.append(unsub)
+    def _cancel_snooze(self) -> None:
+        if self._snooze_unsub:
+            self._snooze_unsub()
+            self._snooze_unsub = None
 
     async def _async_send_reminder(self) -> None:
-        message = f"Time to take {self._dose} ({self._name})"
-        await self.hass.services.async_call(
-            "persistent_notification",
-            "create",
-            {"title": f"Medication Reminder: {self._name}", "message": message},
-            blocking=False,
-        )
+        message = self.reminder_message
+        title = f"Medication Reminder: {self._name}"
+        calls = [("persistent_notification", "create", {"title": title, "message": message})]
         # Mobile actionable notification(s)
         if self._notify_services:
             actions = [
@@ -317,12 +465,21 @@ class MedicationSensor(SensorEntity):
                 "action_data": {"entity_id": self.entity_id, "minutes": self._snooze_minutes},
             }
             for service in self._notify_services:
-                await self.hass.services.async_call(
-                    "notify",
-                    service,
-                    {"title": f"Medication Reminder: {self._name}", "message": message, "data": data},
-                    blocking=False,
-                )
+                calls.append(("notify", service, {"title": title, "message": message, "data": data}))
+        await async_send_notifications(self.hass, calls)
+        self.reminder_sent()
+
+    @property
+    def reminder_message(self) -> str:
+        return f"Time to take {self._dose} ({self._name})"
+
+    @property
+    def notify_services(self) -> List[str]:
+        return list(self._notify_services)
+
+    @callback
+    def reminder_sent(self) -> None:
+        """Record that a reminder went out and start nagging."""
         # Do not change state automatically; keep Pending until user acts
         self._last_action = _LastAction(status="Reminder", timestamp=dt_util.now().isoformat())
         self.async_write_ha_state()
@@ -341,10 +498,12 @@ class MedicationSensor(SensorEntity):
         when = dt_util.now() + timedelta(minutes=minutes)
 
         def _cb(_):
+            self._snooze_unsub = None
             self.hass.async_create_task(self._async_send_reminder())
 
-        unsub = async_track_point_in_time(self.hass, _cb, when)
-        self._unsubs.append(unsub)
+        # A new snooze replaces any pending one
+        self._cancel_snooze()
+        self._snooze_unsub = async_track_point_in_time(self.hass, _cb, when)
         self._state = STATE_SNOOZED
         self._last_action = _LastAction(status=STATE_SNOOZED, timestamp=dt_util.now().isoformat())
         self.async_write_ha_state()
@@ -354,16 +513,61 @@ class MedicationSensor(SensorEntity):
     def snooze_minutes(self) -> int:
         return self._snooze_minutes
 
+    @property
+    def last_action(self) -> Optional[dict]:
+        if not self._last_action:
+            return None
+        return {"status": self._last_action.status, "timestamp": self._last_action.timestamp}
+
+    @property
+    def medication_name(self) -> str:
+        return self._name
+
+    @property
+    def dose(self) -> str:
+        return self._dose
+
+    @property
+    def times(self) -> list[str]:
+        return list(self._times)
+
     @callback
-    def update_config(self, *, dose: Optional[str] = None, times: Optional[list[str]] = None, snooze_minutes: Optional[int] = None, notify_services: Optional[List[str]] = None, nag_interval: Optional[int] = None, nag_max: Optional[int] = None, units_per_intake: Optional[int] = None, refill_total: Optional[int] = None, refill_threshold: Optional[int] = None) -> None:
+    def update_config(
+        self,
+        *,
+        dose: Optional[str] = None,
+        times: Optional[list[str]] = None,
+        snooze_minutes: Optional[int] = None,
+        notify_services: Optional[List[str]] = None,
+        nag_interval: Optional[int] = None,
+        nag_max: Optional[int] = None,
+        units_per_intake: Optional[int] = None,
+        refill_total: Optional[int] = None,
+        refill_threshold: Optional[int] = None,
+        history_days: Optional[int] = None,
+        history_max_events: Optional[int] = None,
+        group_notifications: Optional[bool] = None,
+        refill_lead_days: Optional[int] = None,
+    ) -> None:
+        hist: HistoryManager = self.hass.data[DOMAIN]["history"]
         changed = False
         if dose is not None and dose != self._dose:
             self._dose = dose
             changed = True
+        reschedule = False
         if times is not None and times != self._times:
             self._times = times
             changed = True
-            self._schedule_all()
+            reschedule = True
+            hist.set_schedule(self.entity_id, len(times))
+            hist.set_dose_times(self.entity_id, times)
+            self.hass.data[DOMAIN]["coordinator"].async_set_medication(self.entity_id, times)
+        if group_notifications is not None and bool(group_notifications) != self._group_notifications:
+            self._group_notifications = bool(group_notifications)
+            changed = True
+            reschedule = True
+        if reschedule:
+            self._schedule_doses()
         if snooze_minutes is not None and snooze_minutes != self._snooze_minutes:
             self._snooze_minutes = snooze_minutes
             changed = True
@@ -383,8 +587,16 @@ class MedicationSensor(SensorEntity):
         if refill_threshold is not None and refill_threshold != self._refill_threshold:
             self._refill_threshold = max(0, int(refill_threshold))
             changed = True
+        if refill_lead_days is not None and refill_lead_days != self._refill_lead_days:
+            self._refill_lead_days = max(0, int(refill_lead_days))
+            changed = True
+        if history_days is not None or history_max_events is not None:
+            if history_days is not None:
+                self._history_days = max(1, int(history_days))
+            if history_max_events is not None:
+                self._history_max_events = max(1, int(history_max_events))
+            hist.set_retention(self.entity_id, self._history_days, self._history_max_events)
         if refill_total is not None:
-            hist: HistoryManager = self.hass.data[DOMAIN]["history"]
             self.hass.async_create_task(hist.adjust_refill(self.entity_id, remaining=max(0, int(refill_total))))
             changed = True
         if changed:
@@ -421,174 +633,265 @@ class MedicationSensor(SensorEntity):
 
     async def _handle_refill_after_taken(self) -> None:
         hist: HistoryManager = self.hass.data[DOMAIN]["history"]
-        info = hist.get_refill(self.entity_id)
+        info = await hist.async_get_refill(self.entity_id)
         if not info:
             return
         updated = await hist.decrement_refill(self.entity_id, self._units_per_intake)
         if not updated:
             return
-        if int(updated.get("remaining", 0)) <= int(updated.get("threshold", 0)) and not bool(updated.get("alerted", False)):
-            await self.hass.services.async_call(
-                "persistent_notification",
-                "create",
-                {
-                    "title": f"Medication Refill: {self._name}",
-                    "message": f"{self._name}: Remaining {updated.get('remaining')} ≤ threshold {updated.get('threshold')}. Please refill.",
-                },
-                blocking=False,
-            )
-            await hist.adjust_refill(self.entity_id, alerted=True)
+        if bool(updated.get("alerted", False)):
+            return
+        remaining = int(updated.get("remaining", 0))
+        if remaining <= int(updated.get("threshold", 0)):
+            message = f"{self._name}: Remaining {remaining} ≤ threshold {updated.get('threshold')}. Please refill."
+        else:
+            # Lead-time alert: the projected run-out is closer than the pharmacy needs to refill
+            forecast = hist.refill_forecast(self.entity_id) if self._refill_lead_days > 0 else None
+            days = forecast["days_of_supply"] if forecast else None
+            if days is None or days > self._refill_lead_days:
+                return
+            run_out = dt_util.as_local(forecast["run_out"]).date().isoformat()
+            message = f"{self._name}: Remaining {remaining} lasts about {days:g} days (until {run_out}). Please refill."
+        await self.hass.services.async_call(
+            "persistent_notification",
+            "create",
+            {"title": f"Medication Refill: {self._name}", "message": message},
+            blocking=False,
+        )
+        await hist.adjust_refill(self.entity_id, alerted=True)
 
 
-class MedicationAdherenceSensor(SensorEntity):
-    """Adherence sensor showing 7-day adherence percent and recent events."""
+class _StatisticsSensor(CoordinatorEntity[MedicationCoordinator], SensorEntity):
+    """Base for sensors that show a medication's statistics from the coordinator.
 
-    _attr_icon = "mdi:chart-line"
-    _attr_native_unit_of_measurement = "%"
-    _attr_state_class = SensorStateClass.MEASUREMENT
+    State and attributes are built once per summary, keyed on the history
+    version, dose times and day it was computed for, so the repeated reads of
+    a state write, the recorder and templates are dictionary lookups.
+    """
 
-    def __init__(self, hass: HomeAssistant, name: str, times: list[str], history: HistoryManager, source_entity_id: Optional[str], slug: str):
+    def __init__(self, hass: HomeAssistant, coordinator: MedicationCoordinator, source_entity_id: str):
+        # Registered under the medication, so only refreshes that changed it call this entity
+        super().__init__(coordinator, source_entity_id)
         self.hass = hass
-        self._name = name
-        self._times = times
-        self._history = history
         self._source_entity_id = source_entity_id
-        self._slug = slug
-        self._state: Optional[float] = None
-        self._attr_name = f"{name} Adherence"
-        self._attr_unique_id = f"med_{slug}_adherence"
-        self.entity_id = async_generate_entity_id("sensor.{}", f"medication_{slug}_adherence", hass=hass)
-        self._unsub_dispatcher = None
+        self._metrics = get_metrics(hass)
+        self._memo_key: Any = None
+        self._memo: Tuple[Any, Dict[str, Any]] = (None, {})
         self._attr_device_info = {
             "identifiers": {(DOMAIN, "medication_reminder")},
             "name": "Medication Reminder",
         }
 
-    def set_source_entity_id(self, entity_id: str) -> None:
-        self._source_entity_id = entity_id
+    @property
+    def _summary(self) -> Dict[str, Any] | None:
+        return self.coordinator.data.get(self._source_entity_id)
+
+    def _build(self, summary: Dict[str, Any] | None) -> Tuple[Any, Dict[str, Any]]:
+        """Native value and attributes for a summary."""
+        raise NotImplementedError
+
+    def _memoized(self) -> Tuple[Any, Dict[str, Any]]:
+        summary = self._summary
+        key = None if summary is None else (summary["key"], summary["next_dose"])
+        if key is not None and key == self._memo_key:
+            self._metrics.increment("sensor_cache_hits")
+            return self._memo
+        self._metrics.increment("sensor_cache_misses")
+        self._memo = self._build(summary)
+        self._memo_key = key
+        return self._memo
 
     @property
     def native_value(self):
-        return self._state
+        return self._memoized()[0]
 
     @property
     def extra_state_attributes(self):
-        if not self._source_entity_id:
-            return {}
-        recent = self._history.recent(self._source_entity_id, 100)
-        counts, expected = self._compute_counts()
-        return {
+        return self._memoized()[1]
+
+
+class MedicationAdherenceSensor(_StatisticsSensor):
+    """Adherence sensor showing 7-day adherence percent and counts.
+
+    Once the dose ledger covers the whole window, the percent is of the doses
+    already due that were taken; before that it is taken events over the
+    scheduled doses of seven days.
+    """
+
+    _attr_icon = "mdi:chart-line"
+    _attr_native_unit_of_measurement = "%"
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+    def __init__(
+        self, hass: HomeAssistant, name: str, coordinator: MedicationCoordinator, source_entity_id: str, slug: str
+    ):
+        super().__init__(hass, coordinator, source_entity_id)
+        self._attr_name = f"{name} Adherence"
+        self._attr_unique_id = f"med_{slug}_adherence"
+        self.entity_id = _entity_id(hass, self._attr_unique_id, f"medication_{slug}_adherence")
+
+    def _build(self, summary: Dict[str, Any] | None) -> Tuple[Any, Dict[str, Any]]:
+        counts = summary["adherence"] if summary is not None else {}
+        expected = counts.get("expected", 0)
+        if "due" in counts:
+            due = counts["due"]
+            value = None if due == 0 else round((counts["on_time"] + counts["late"]) / due * 100)
+        else:
+            value = None if summary is None or expected == 0 else round((counts["taken"] / expected) * 100)
+        # Event lists are served by the websocket API and get_history, not the state
+        return value, {
+            "medication_entity_id": self._source_entity_id,
             "taken_7d": counts.get("taken", 0),
             "skipped_7d": counts.get("skipped", 0),
             "snoozed_7d": counts.get("snoozed", 0),
             "expected_7d": expected,
-            "recent_events": recent,
+            "on_time_7d": counts.get("on_time", 0),
+            "late_7d": counts.get("late", 0),
+            "missed_7d": counts.get("missed", 0),
         }
 
-    def _compute_counts(self):
-        if not self._source_entity_id:
-            return {"taken": 0, "skipped": 0, "snoozed": 0}, 0
-        days = 7
-        expected = days * len(self._times or [])
-        since = dt_util.now() - timedelta(days=days)
-        counts = self._history.counts_since(self._source_entity_id, since)
-        # adherence percent
-        self._state = None if expected == 0 else round((counts.get("taken", 0) / expected) * 100)
-        return counts, expected
 
-    async def async_added_to_hass(self) -> None:
-        @callback
-        def _updated(entity_id: str):
-            if self._source_entity_id and entity_id == self._source_entity_id:
-                self._compute_counts()
-                self.async_write_ha_state()
+class MedicationStatsSensor(_StatisticsSensor):
+    """Statistics sensor with daily/weekly/monthly/yearly taken/skipped/missed counts."""
 
-        self._unsub_dispatcher = async_dispatcher_connect(self.hass, SIGNAL_HISTORY_UPDATED, _updated)
-        # Initial compute
-        self._compute_counts()
+    _attr_icon = "mdi:table"
 
-    async def async_will_remove_from_hass(self) -> None:
-        if self._unsub_dispatcher:
-            self._unsub_dispatcher()
-            self._unsub_dispatcher = None
+    def __init__(
+        self, hass: HomeAssistant, name: str, coordinator: MedicationCoordinator, source_entity_id: str, slug: str
+    ):
+        super().__init__(hass, coordinator, source_entity_id)
+        self._attr_name = f"{name} Stats"
+        self._attr_unique_id = f"med_{slug}_stats"
+        self.entity_id = _entity_id(hass, self._attr_unique_id, f"medication_{slug}_stats")
+
+    def _build(self, summary: Dict[str, Any] | None) -> Tuple[Any, Dict[str, Any]]:
+        # Per-period breakdowns are served by the websocket API and get_history
+        attrs: dict = {"medication_entity_id": self._source_entity_id}
+        if summary is None:
+            return None, attrs
+        for key, data in summary["periods"].items():
+            exp = data["expected"]
+            attrs[f"{key}_percent"] = None if exp == 0 else round((data["taken"] / exp) * 100)
+        attrs["streak_days"] = summary["streak_days"]
+        attrs["next_dose"] = summary["next_dose"].isoformat() if summary["next_dose"] else None
+        # 30-day adherence percent
+        return attrs["monthly_percent"], attrs
 
-    @callback
-    def update_times(self, times: list[str]) -> None:
-        self._times = times
-        self._compute_counts()
-        self.async_write_ha_state()
 
+class MedicationSupplySensor(CoordinatorEntity[MedicationCoordinator], SensorEntity):
+    """Days of supply left for a medication with refill tracking, and its projected run-out date.
 
-class MedicationStatsSensor(SensorEntity):
-    """Statistics sensor with daily/weekly/monthly/yearly taken/skipped/missed counts."""
+    The forecast is recomputed when the refill record changes and with every
+    coordinator refresh of the medication, which covers new doses and the
+    midnight refresh that moves the run-out date along with the calendar.
+    """
 
-    _attr_icon = "mdi:table"
+    _attr_icon = "mdi:pill-multiple"
+    _attr_native_unit_of_measurement = UnitOfTime.DAYS
+    _attr_state_class = SensorStateClass.MEASUREMENT
 
-    def __init__(self, hass: HomeAssistant, name: str, times: list[str], history: HistoryManager, source_entity_id: Optional[str], slug: str):
+    def __init__(
+        self, hass: HomeAssistant, name: str, coordinator: MedicationCoordinator, source_entity_id: str, slug: str
+    ):
+        super().__init__(coordinator, source_entity_id)
         self.hass = hass
-        self._name = name
-        self._times = times
-        self._history = history
         self._source_entity_id = source_entity_id
-        self._slug = slug
-        self._state: Optional[int] = None  # percent last 30d
-        self._attr_name = f"{name} Stats"
-        self._attr_unique_id = f"med_{slug}_stats"
-        self.entity_id = async_generate_entity_id("sensor.{}", f"medication_{slug}_stats", hass=hass)
-        self._unsub_dispatcher = None
+        self._forecast: Dict[str, Any] | None = None
+        self._attr_name = f"{name} Supply"
+        self._attr_unique_id = f"med_{slug}_supply"
+        self.entity_id = _entity_id(hass, self._attr_unique_id, f"medication_{slug}_supply")
         self._attr_device_info = {
             "identifiers": {(DOMAIN, "medication_reminder")},
             "name": "Medication Reminder",
         }
 
-    def set_source_entity_id(self, entity_id: str) -> None:
-        self._source_entity_id = entity_id
-
-    def _period_counts(self, days: int):
-        if not self._source_entity_id:
-            return {"taken": 0, "skipped": 0, "missed": 0, "expected": 0}
-        now = dt_util.now()
-        start = now - timedelta(days=days)
-        counts = self._history.counts_between(self._source_entity_id, start, now)
-        expected = days * len(self._times or [])
-        missed = max(0, expected - counts.get("taken", 0) - counts.get("skipped", 0))
-        return {"taken": counts.get("taken", 0), "skipped": counts.get("skipped", 0), "missed": missed, "expected": expected}
-
     @property
     def native_value(self):
-        # 30-day adherence percent
-        data = self._period_counts(30)
-        exp = data.get("expected", 0)
-        self._state = None if exp == 0 else round((data.get("taken", 0) / exp) * 100)
-        return self._state
+        return self._forecast["days_of_supply"] if self._forecast else None
 
     @property
     def extra_state_attributes(self):
-        daily = self._period_counts(1)
-        weekly = self._period_counts(7)
-        monthly = self._period_counts(30)
-        yearly = self._period_counts(365)
+        forecast = self._forecast or {}
+        refill = self.hass.data[DOMAIN]["history"].get_refill(self._source_entity_id) or {}
+        run_out = forecast.get("run_out")
         return {
-            "daily": daily,
-            "weekly": weekly,
-            "monthly": monthly,
-            "yearly": yearly,
+            "medication_entity_id": self._source_entity_id,
+            "remaining": refill.get("remaining"),
+            "units_per_day": forecast.get("units_per_day"),
+            "run_out": dt_util.as_local(run_out).date().isoformat() if run_out else None,
+            "rate_source": forecast.get("rate_source"),
         }
 
     async def async_added_to_hass(self) -> None:
-        @callback
-        def _updated(entity_id: str):
-            if self._source_entity_id and entity_id == self._source_entity_id:
-                self.async_write_ha_state()
+        await super().async_added_to_hass()
+        self.async_on_remove(async_dispatcher_connect(self.hass, SIGNAL_REFILL_UPDATED, self._refill_updated))
+        # Refill records come with the history load, which entity setup does not wait for
+        self.hass.async_create_task(self._async_init())
 
-        self._unsub_dispatcher = async_dispatcher_connect(self.hass, SIGNAL_HISTORY_UPDATED, _updated)
-
-    async def async_will_remove_from_hass(self) -> None:
-        if self._unsub_dispatcher:
-            self._unsub_dispatcher()
-            self._unsub_dispatcher = None
+    async def _async_init(self) -> None:
+        await self.hass.data[DOMAIN]["history"].async_get_refill(self._source_entity_id)
+        self._refill_updated(self._source_entity_id)
 
     @callback
-    def update_times(self, times: list[str]) -> None:
-        self._times = times
+    def _refill_updated(self, entity_id: str) -> None:
+        if entity_id != self._source_entity_id:
+            return
+        self._forecast = self.hass.data[DOMAIN]["history"].refill_forecast(self._source_entity_id)
         self.async_write_ha_state()
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        self._refill_updated(self._source_entity_id)
+
+
+class MedicationDiagnosticsSensor(SensorEntity):
+    """Debug sensor with hot-path timings, timers and history sizes; disabled by default.
+
+    The state is the total time spent in the timed paths; the attributes hold
+    a summary of the report the diagnostics download contains in full.
+    """
+
+    _attr_icon = "mdi:speedometer"
+    _attr_name = "Medication Reminder Diagnostics"
+    _attr_unique_id = f"{DOMAIN}_diagnostics"
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+    _attr_native_unit_of_measurement = UnitOfTime.MILLISECONDS
+    _attr_state_class = SensorStateClass.TOTAL_INCREASING
+    _attr_should_poll = True
+
+    def __init__(self, hass: HomeAssistant):
+        self.hass = hass
+        self._report: Dict[str, Any] = {}
+        self._attr_device_info = {
+            "identifiers": {(DOMAIN, "medication_reminder")},
+            "name": "Medication Reminder",
+        }
+
+    @property
+    def native_value(self):
+        return self._report.get("metrics", {}).get("busy_ms")
+
+    @property
+    def extra_state_attributes(self):
+        if not self._report:
+            return {}
+        metrics = self._report["metrics"]
+        timers = self._report["timers"]
+        return {
+            "counters": metrics["counters"],
+            "cache_hit_rate": metrics["cache_hit_rate"],
+            "latency_p95_ms": {name: hist["p95_ms"] for name, hist in metrics["latency"].items()},
+            "latency_max_ms": {name: hist["max_ms"] for name, hist in metrics["latency"].items()},
+            "scheduler_slots": timers["scheduler_slots"],
+            "pending_timers": sum(
+                sum(1 for key in ("snooze_timer", "nag_timer") if med[key]) for med in timers["medications"].values()
+            ),
+            "leaked_timers": len(timers["leaked"]),
+            "orphan_slots": sum(timers["orphan_slots"].values()),
+            "history": self._report["history"],
+            "storage_bytes": self._report["storage_bytes"],
+        }
+
+    async def async_update(self) -> None:
+        self._report = await async_build_report(self.hass)
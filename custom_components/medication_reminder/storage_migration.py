@@ -1,3 +1,54 @@
-"""Storage migration helper for future versions."""
+"""Storage migrations for the medication history document."""
+from __future__ import annotations
 
-# Use this for migrating the structure of saved medication data between versions
+from typing import Any, Dict, List, Tuple
+
+from homeassistant.helpers.storage import Store
+
+from .const import HISTORY_STORE_VERSION
+
+
+def migrate_history_v1(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert v1 event dicts into the v2 per-entity columns.
+
+    v1 kept a ``{"status", "timestamp"}`` dict with an ISO string per event;
+    v2 keeps ``{"ts": [epoch seconds], "codes": "<one digit per event>"}``.
+    Events the v1 loader would have skipped are dropped. v1 had no rollups,
+    so they are seeded from the events.
+    """
+    from .history import _DayRollup, local_day, parse_epoch, status_code
+
+    events: Dict[str, Dict[str, Any]] = {}
+    rollups: Dict[str, Dict[str, List[int]]] = {}
+    for eid, lst in (data.get("events") or {}).items():
+        if not isinstance(lst, list):
+            continue
+        rows: List[Tuple[int, int]] = []
+        for e in lst:
+            if not isinstance(e, dict) or "status" not in e:
+                continue
+            ts = parse_epoch(e.get("timestamp"))
+            if ts is not None:
+                rows.append((int(ts), status_code(e["status"])))
+        rows.sort(key=lambda row: row[0])
+        events[eid] = {"ts": [ts for ts, _ in rows], "codes": "".join(str(code) for _, code in rows)}
+        rollup = _DayRollup()
+        for ts, code in rows:
+            rollup.count(local_day(ts), code)
+        rollups[eid] = rollup.as_dict()
+    return {**data, "events": events, "rollups": rollups}
+
+
+class HistoryStore(Store):
+    """Store for the history document; older layouts are migrated on load."""
+
+    async def _async_migrate_func(
+        self, old_major_version: int, old_minor_version: int, old_data: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        if old_major_version > HISTORY_STORE_VERSION:
+            # Written by a newer release; refuse rather than misread it
+            raise NotImplementedError
+        if old_major_version < 2:
+            # Parses every timestamp, so it runs in the executor like the file read
+            old_data = await self.hass.async_add_executor_job(migrate_history_v1, old_data)
+        return old_data
@@ -1,3 +1,61 @@
 """Utility functions for Medication Reminder."""
+from __future__ import annotations
 
-# Placeholder for helper functions like parsing times or formatting notifications
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Tuple
+
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN, NOTIFY_CONCURRENCY, NOTIFY_TIMEOUT
+from .metrics import get_metrics
+
+_LOGGER = logging.getLogger(__name__)
+
+NotifyCall = Tuple[str, str, Dict[str, Any]]
+
+
+def _notify_semaphore(hass: HomeAssistant) -> asyncio.Semaphore:
+    # Shared by every medication so a busy dose slot stays within the limit
+    store = hass.data.setdefault(DOMAIN, {})
+    sem = store.get("notify_semaphore")
+    if sem is None:
+        sem = store["notify_semaphore"] = asyncio.Semaphore(NOTIFY_CONCURRENCY)
+    return sem
+
+
+async def _async_call_one(
+    hass: HomeAssistant, sem: asyncio.Semaphore, domain: str, service: str, data: Dict[str, Any]
+) -> None:
+    name = f"{domain}.{service}"
+    stats = hass.data.setdefault(DOMAIN, {}).setdefault("notify_stats", {}).setdefault(
+        name, {"calls": 0, "failures": 0, "last_ms": None}
+    )
+    metrics = get_metrics(hass)
+    async with sem:
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(
+                hass.services.async_call(domain, service, data, blocking=True), NOTIFY_TIMEOUT
+            )
+        except Exception as err:  # one failing target must not affect the others
+            stats["failures"] += 1
+            metrics.increment("notify_failures")
+            _LOGGER.warning("Notification via %s failed: %s", name, err or type(err).__name__)
+        finally:
+            metrics.observe("notify_call", start)
+            elapsed = (time.perf_counter() - start) * 1000
+            stats["calls"] += 1
+            stats["last_ms"] = round(elapsed, 1)
+            _LOGGER.debug("Notification via %s took %.1f ms", name, elapsed)
+
+
+async def async_send_notifications(hass: HomeAssistant, calls: List[NotifyCall]) -> None:
+    """Run notify service calls concurrently, bounded by ``NOTIFY_CONCURRENCY``.
+
+    Each call is timed and recorded in ``hass.data[DOMAIN]["notify_stats"]``;
+    failures and timeouts are logged and never abort the remaining calls.
+    """
+    sem = _notify_semaphore(hass)
+    await asyncio.gather(*(_async_call_one(hass, sem, domain, service, data) for domain, service, data in calls))
@@ -0,0 +1,342 @@
+"""WebSocket commands serving history, statistics and schedules to the cards."""
+from __future__ import annotations
+
+import asyncio
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List
+
+import voluptuous as vol
+
+from homeassistant.components import websocket_api
+from homeassistant.core import CALLBACK_TYPE, Event, HomeAssistant, callback
+from homeassistant.helpers import config_validation as cv
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+from homeassistant.helpers.event import async_track_state_change_event
+from homeassistant.util import dt as dt_util
+
+from .const import (
+    DEFAULT_RECENT_EVENTS,
+    DOMAIN,
+    MAX_RECENT_EVENTS,
+    SIGNAL_HISTORY_EVENTS,
+    SIGNAL_MEDICATIONS_UPDATED,
+    SIGNAL_REFILL_UPDATED,
+    STATS_PERIODS,
+)
+from .history import HistoryManager
+from .scheduler import next_dose_time
+
+# Longest window the schedule command expands into individual dose slots
+MAX_SCHEDULE_DAYS = 31
+# Days of events included in a subscription snapshot (at least DEFAULT_RECENT_EVENTS are sent)
+SNAPSHOT_DAYS = 7
+
+
+@callback
+def async_setup(hass: HomeAssistant) -> None:
+    """Register the medication_reminder/* commands."""
+    websocket_api.async_register_command(hass, ws_history)
+    websocket_api.async_register_command(hass, ws_stats)
+    websocket_api.async_register_command(hass, ws_schedule)
+    websocket_api.async_register_command(hass, ws_subscribe)
+
+
+def _resolve(hass: HomeAssistant, connection, msg: Dict[str, Any]) -> List[str] | None:
+    """Requested medication entity ids (all when omitted); sends an error and returns None if any is unknown."""
+    registry = hass.data.get(DOMAIN, {}).get("entities", {})
+    if hass.data.get(DOMAIN, {}).get("history") is None:
+        connection.send_error(msg["id"], websocket_api.ERR_NOT_FOUND, "Medication Reminder is not loaded")
+        return None
+    entity_ids = msg.get("entity_ids")
+    if entity_ids is None:
+        return sorted(registry)
+    missing = [eid for eid in entity_ids if eid not in registry]
+    if missing:
+        connection.send_error(
+            msg["id"], websocket_api.ERR_NOT_FOUND, f"Medication entity not found: {', '.join(missing)}"
+        )
+        return None
+    return list(dict.fromkeys(entity_ids))
+
+
+def _parse_time(connection, msg: Dict[str, Any], key: str) -> datetime | None | bool:
+    """Parse an optional ISO datetime field; sends an error and returns False when invalid."""
+    raw = msg.get(key)
+    if raw is None:
+        return None
+    parsed = dt_util.parse_datetime(raw)
+    if parsed is None:
+        connection.send_error(msg["id"], websocket_api.ERR_INVALID_FORMAT, f"Invalid {key}")
+        return False
+    return dt_util.as_local(parsed)
+
+
+@websocket_api.websocket_command(
+    {
+        vol.Required("type"): f"{DOMAIN}/history",
+        vol.Optional("entity_ids"): [cv.entity_id],
+        vol.Optional("start_time"): str,
+        vol.Optional("end_time"): str,
+        vol.Optional("limit", default=DEFAULT_RECENT_EVENTS): vol.All(
+            vol.Coerce(int), vol.Range(min=1, max=MAX_RECENT_EVENTS)
+        ),
+        # Opaque per-entity cursors returned as next_cursor by a previous page
+        vol.Optional("cursors"): {cv.entity_id: vol.Any(str, None)},
+    }
+)
+@websocket_api.async_response
+async def ws_history(hass: HomeAssistant, connection: websocket_api.ActiveConnection, msg: Dict[str, Any]) -> None:
+    """Return events newest first, one page per medication."""
+    entity_ids = _resolve(hass, connection, msg)
+    if entity_ids is None:
+        return
+    start = _parse_time(connection, msg, "start_time")
+    end = _parse_time(connection, msg, "end_time")
+    if start is False or end is False:
+        return
+    cursors = msg.get("cursors") or {}
+    history: HistoryManager = hass.data[DOMAIN]["history"]
+    result: Dict[str, Any] = {}
+    for eid in entity_ids:
+        # A null cursor means that medication is exhausted
+        if eid in cursors and cursors[eid] is None:
+            continue
+        try:
+            events, next_cursor = await history.async_events_page(eid, start, end, msg["limit"], cursors.get(eid))
+        except ValueError:
+            connection.send_error(msg["id"], websocket_api.ERR_INVALID_FORMAT, f"Invalid cursor for {eid}")
+            return
+        result[eid] = {"events": events, "next_cursor": next_cursor}
+    connection.send_result(msg["id"], result)
+
+
+@websocket_api.websocket_command(
+    {
+        vol.Required("type"): f"{DOMAIN}/stats",
+        vol.Optional("entity_ids"): [cv.entity_id],
+        vol.Optional("periods"): [vol.In(STATS_PERIODS)],
+        vol.Optional("start_date"): cv.date,
+        vol.Optional("end_date"): cv.date,
+    }
+)
+@websocket_api.async_response
+async def ws_stats(hass: HomeAssistant, connection: websocket_api.ActiveConnection, msg: Dict[str, Any]) -> None:
+    """Return period summaries and, with start_date/end_date, a custom date range."""
+    entity_ids = _resolve(hass, connection, msg)
+    if entity_ids is None:
+        return
+    periods = msg.get("periods", list(STATS_PERIODS))
+    first: date | None = msg.get("start_date")
+    last: date | None = msg.get("end_date")
+    if last is not None and first is None:
+        connection.send_error(msg["id"], websocket_api.ERR_INVALID_FORMAT, "end_date requires start_date")
+        return
+    if first is not None:
+        last = last or dt_util.now().date()
+        if last < first:
+            connection.send_error(msg["id"], websocket_api.ERR_INVALID_FORMAT, "end_date is before start_date")
+            return
+    history: HistoryManager = hass.data[DOMAIN]["history"]
+    result: Dict[str, Any] = {}
+    for eid in entity_ids:
+        item: Dict[str, Any] = {
+            "periods": {key: await history.async_period_summary(eid, STATS_PERIODS[key]) for key in periods}
+        }
+        if first is not None:
+            item["range"] = await history.async_range_summary(eid, first, last)
+        result[eid] = item
+    connection.send_result(msg["id"], result)
+
+
+@websocket_api.websocket_command(
+    {
+        vol.Required("type"): f"{DOMAIN}/schedule",
+        vol.Optional("entity_ids"): [cv.entity_id],
+        vol.Optional("start_time"): str,
+        vol.Optional("end_time"): str,
+    }
+)
+@callback
+def ws_schedule(hass: HomeAssistant, connection: websocket_api.ActiveConnection, msg: Dict[str, Any]) -> None:
+    """Return each medication's dose times and the dose slots in a window (default: next 24h)."""
+    entity_ids = _resolve(hass, connection, msg)
+    if entity_ids is None:
+        return
+    start = _parse_time(connection, msg, "start_time")
+    end = _parse_time(connection, msg, "end_time")
+    if start is False or end is False:
+        return
+    now = dt_util.now()
+    start = start or now
+    end = end or start + timedelta(days=1)
+    if end < start or end - start > timedelta(days=MAX_SCHEDULE_DAYS):
+        connection.send_error(
+            msg["id"], websocket_api.ERR_INVALID_FORMAT, f"Window must be 0-{MAX_SCHEDULE_DAYS} days"
+        )
+        return
+    registry = hass.data[DOMAIN]["entities"]
+    result: Dict[str, Any] = {}
+    for eid in entity_ids:
+        med = registry[eid]
+        slots: List[str] = []
+        day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        while day <= end:
+            for t in med.times:
+                hh, mm = (int(x) for x in t.split(":"))
+                slot = day.replace(hour=hh, minute=mm)
+                if start <= slot <= end:
+                    slots.append(slot.isoformat())
+            day = dt_util.start_of_local_day(day.date() + timedelta(days=1))
+        slots.sort()
+        upcoming = [next_dose_time(t, now) for t in med.times]
+        result[eid] = {
+            "name": med.medication_name,
+            "dose": med.dose,
+            "times": med.times,
+            "state": med.native_value,
+            "next_dose": min(upcoming).isoformat() if upcoming else None,
+            "slots": slots,
+        }
+    connection.send_result(msg["id"], result)
+
+
+async def _async_periods(history: HistoryManager, entity_id: str) -> Dict[str, Any]:
+    return {key: await history.async_period_summary(entity_id, days) for key, days in STATS_PERIODS.items()}
+
+
+async def _async_snapshot(hass: HomeAssistant, entity_id: str) -> Dict[str, Any]:
+    med = hass.data[DOMAIN]["entities"][entity_id]
+    history: HistoryManager = hass.data[DOMAIN]["history"]
+    since = dt_util.start_of_local_day() - timedelta(days=SNAPSHOT_DAYS - 1)
+    events, _ = await history.async_events_page(entity_id, since, None, MAX_RECENT_EVENTS)
+    if len(events) < DEFAULT_RECENT_EVENTS:
+        events = await history.async_recent(entity_id, DEFAULT_RECENT_EVENTS)
+        events = events[::-1]
+    return {
+        "name": med.medication_name,
+        "dose": med.dose,
+        "times": med.times,
+        "state": med.native_value,
+        "last_action": med.last_action,
+        "refill": history.get_refill(entity_id),
+        "events": events,
+        "periods": await _async_periods(history, entity_id),
+    }
+
+
+@websocket_api.websocket_command(
+    {
+        vol.Required("type"): f"{DOMAIN}/subscribe",
+        vol.Optional("entity_ids"): [cv.entity_id],
+    }
+)
+@websocket_api.async_response
+async def ws_subscribe(hass: HomeAssistant, connection: websocket_api.ActiveConnection, msg: Dict[str, Any]) -> None:
+    """Push a snapshot, then only medication deltas: status, new events, stats and refill.
+
+    Messages carry a ``type`` of ``snapshot``, ``status``, ``events`` (newest
+    first), ``stats`` or ``refill``. Events recorded while the snapshot is being
+    built may arrive in both; clients merge them by timestamp and status.
+    Without ``entity_ids`` the subscription follows every medication: ones set
+    up or removed later are sent as ``added`` (with their snapshot) and
+    ``removed``, after the initial snapshot.
+    """
+    entity_ids = _resolve(hass, connection, msg)
+    if entity_ids is None:
+        return
+    wanted = set(entity_ids)
+    follow_all = "entity_ids" not in msg
+    snapshot_sent = asyncio.Event()
+    # Set on unsubscribe; tasks still awaiting must not send or track anything after it
+    closed = False
+    history: HistoryManager = hass.data[DOMAIN]["history"]
+    registry = hass.data[DOMAIN]["entities"]
+    msg_id = msg["id"]
+
+    @callback
+    def _send(payload: Dict[str, Any]) -> None:
+        connection.send_message(websocket_api.event_message(msg_id, payload))
+
+    @callback
+    def _state_changed(event: Event) -> None:
+        new_state = event.data.get("new_state")
+        med = registry.get(event.data["entity_id"])
+        if new_state is None or med is None:
+            return
+        _send({"type": "status", "entity_id": med.entity_id, "state": new_state.state, "last_action": med.last_action})
+
+    async def _async_send_stats(changed: List[str]) -> None:
+        for eid in changed:
+            periods = await _async_periods(history, eid)
+            if closed:
+                return
+            _send({"type": "stats", "entity_id": eid, "periods": periods})
+
+    @callback
+    def _events(records: List[Any]) -> None:
+        by_entity: Dict[str, List[Dict[str, Any]]] = {}
+        for eid, event in records:
+            if eid in wanted:
+                by_entity.setdefault(eid, []).append(event)
+        for eid, events in by_entity.items():
+            _send({"type": "events", "entity_id": eid, "events": events[::-1]})
+        if by_entity:
+            hass.async_create_task(_async_send_stats(list(by_entity)))
+
+    @callback
+    def _refill(entity_id: str) -> None:
+        if entity_id in wanted:
+            _send({"type": "refill", "entity_id": entity_id, "refill": history.get_refill(entity_id)})
+
+    # Replaced whenever the followed medications change
+    tracking: List[CALLBACK_TYPE] = [async_track_state_change_event(hass, entity_ids, _state_changed)]
+
+    async def _async_send_membership(entity_id: str) -> None:
+        # Deltas on top of a snapshot the client does not have yet would be lost
+        await snapshot_sent.wait()
+        if closed:
+            return
+        if entity_id in registry and entity_id not in wanted:
+            snapshot = await _async_snapshot(hass, entity_id)
+            if closed or entity_id not in registry or entity_id in wanted:
+                return
+            wanted.add(entity_id)
+            _send({"type": "added", "entity_id": entity_id, "medication": snapshot})
+        elif entity_id not in registry and entity_id in wanted:
+            wanted.discard(entity_id)
+            _send({"type": "removed", "entity_id": entity_id})
+        else:
+            return
+        tracking.pop()()
+        tracking.append(async_track_state_change_event(hass, sorted(wanted), _state_changed))
+
+    @callback
+    def _medications_updated(entity_id: str) -> None:
+        hass.async_create_task(_async_send_membership(entity_id))
+
+    unsubs = [
+        async_dispatcher_connect(hass, SIGNAL_HISTORY_EVENTS, _events),
+        async_dispatcher_connect(hass, SIGNAL_REFILL_UPDATED, _refill),
+    ]
+    if follow_all:
+        unsubs.append(async_dispatcher_connect(hass, SIGNAL_MEDICATIONS_UPDATED, _medications_updated))
+
+    @callback
+    def _unsubscribe() -> None:
+        nonlocal closed
+        closed = True
+        for unsub in [*unsubs, *tracking]:
+            unsub()
+        tracking.clear()
+        # Lets waiting membership tasks finish
+        snapshot_sent.set()
+
+    connection.subscriptions[msg_id] = _unsubscribe
+    connection.send_result(msg_id)
+    try:
+        medications = {eid: await _async_snapshot(hass, eid) for eid in entity_ids if eid in registry}
+        if not closed:
+            _send({"type": "snapshot", "medications": medications})
+    finally:
+        # Membership tasks wait for the snapshot, even one that failed
+        snapshot_sent.set()
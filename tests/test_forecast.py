@@ -0,0 +1,105 @@
+"""Intake rate estimation and run-out projection of the refill forecast."""
+from __future__ import annotations
+
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from homeassistant.core import HomeAssistant
+
+from custom_components.medication_reminder.const import CODE_SKIPPED, CODE_SNOOZED, CODE_TAKEN
+from custom_components.medication_reminder.forecast import MIN_HISTORY, RefillForecast, project
+
+from .test_journal import _run
+
+ENTITY = "sensor.medication_aspirin"
+DAY = 86400
+T0 = 1_700_000_000
+NOW = datetime(2024, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def _forecast(tmp_path, test) -> None:
+    async def _main(hass: HomeAssistant) -> None:
+        forecast = RefillForecast(hass)
+        await forecast.async_load()
+        test(forecast)
+
+    _run(tmp_path, _main)
+
+
+def test_no_rate_without_history(tmp_path):
+    def test(forecast: RefillForecast) -> None:
+        assert forecast.rate(ENTITY, T0) is None
+        forecast.observe([(ENTITY, T0, CODE_TAKEN), (ENTITY, T0 + 3600, CODE_TAKEN)])
+        # Too short a history to tell a rate from
+        assert forecast.rate(ENTITY, T0 + MIN_HISTORY - 1) is None
+        assert forecast.rate(ENTITY, T0 + MIN_HISTORY) is not None
+
+    _forecast(tmp_path, test)
+
+
+def test_daily_doses_give_about_one_per_day(tmp_path):
+    def test(forecast: RefillForecast) -> None:
+        forecast.observe([(ENTITY, T0 + day * DAY, CODE_TAKEN) for day in range(60)])
+        # Skipped and snoozed doses are not intake
+        other = [(ENTITY, T0 + day * DAY + 60, code) for day in range(60) for code in (CODE_SKIPPED, CODE_SNOOZED)]
+        forecast.observe(other)
+        assert forecast.rate(ENTITY, T0 + 59 * DAY) == pytest.approx(1, rel=0.05)
+        assert forecast.rate(ENTITY, T0 + 59 * DAY + DAY // 2) == pytest.approx(1, rel=0.05)
+        # Stopping shows as a decaying rate
+        assert forecast.rate(ENTITY, T0 + 89 * DAY) < 0.2
+
+    _forecast(tmp_path, test)
+
+
+def test_order_of_observation_does_not_matter(tmp_path):
+    doses = [(ENTITY, T0 + day * DAY + hour * 3600, CODE_TAKEN) for day in range(30) for hour in (8, 20)]
+    shuffled = doses[:]
+    random.Random(7).shuffle(shuffled)
+    rates = []
+
+    def test(forecast: RefillForecast) -> None:
+        forecast.observe(doses)
+        forecast.observe([("sensor.medication_other", ts, code) for _, ts, code in shuffled])
+        rates.append(forecast.rate(ENTITY, T0 + 31 * DAY))
+        rates.append(forecast.rate("sensor.medication_other", T0 + 31 * DAY))
+
+    _forecast(tmp_path, test)
+    assert rates[0] == pytest.approx(rates[1])
+    assert rates[0] == pytest.approx(2, rel=0.1)
+
+
+def test_a_single_dose_is_no_consumption(tmp_path):
+    def test(forecast: RefillForecast) -> None:
+        forecast.observe([(ENTITY, T0, CODE_TAKEN)])
+        rate = forecast.rate(ENTITY, T0 + 4 * DAY)
+        assert rate == 0
+        assert project(30, 1, rate, 2, NOW) == {
+            "units_per_day": 0,
+            "days_of_supply": None,
+            "run_out": None,
+            "rate_source": "history",
+        }
+
+    _forecast(tmp_path, test)
+
+
+def test_project_from_the_schedule_and_the_rate():
+    assert project(30, 2, None, 3, NOW) == {
+        "units_per_day": 6,
+        "days_of_supply": 5.0,
+        "run_out": NOW + timedelta(days=5),
+        "rate_source": "schedule",
+    }
+    forecast = project(30, 1, 1.5, 3, NOW)
+    assert forecast["days_of_supply"] == 20.0
+    assert forecast["rate_source"] == "history"
+    # Units per intake below one count as one
+    assert project(30, 0, None, 3, NOW)["units_per_day"] == 3
+    # No schedule and no history: no run-out
+    assert project(30, 1, None, 0, NOW)["run_out"] is None
+
+
+def test_project_without_supply_runs_out_now():
+    assert project(0, 1, None, 2, NOW)["run_out"] == NOW
+    assert project(-4, 1, None, 2, NOW)["days_of_supply"] == 0
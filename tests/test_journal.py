@@ -0,0 +1,132 @@
+"""Crash recovery of the history journal and its replay on top of the snapshot."""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import time
+from typing import Awaitable, Callable
+
+from homeassistant.core import HomeAssistant
+from homeassistant.util import dt as dt_util
+
+from custom_components.medication_reminder.history import MemoryHistoryBackend
+from custom_components.medication_reminder.journal import HistoryJournal, _read_lines, _rewrite_after
+
+ENTITY = "sensor.medication_aspirin"
+
+
+def _line(seq: int, ts: int = 1_700_000_000) -> bytes:
+    op = {"op": "event", "id": ENTITY, "t": ts + seq, "c": 1, "n": seq}
+    return json.dumps(op, separators=(",", ":")).encode() + b"\n"
+
+
+def _iso(ts: int) -> str:
+    return dt_util.utc_from_timestamp(ts).isoformat()
+
+
+def _run(config_dir, test: Callable[[HomeAssistant], Awaitable[None]]) -> None:
+    """Run ``test(hass)`` against a Home Assistant instance using ``config_dir``."""
+
+    async def _main() -> None:
+        hass = HomeAssistant(str(config_dir))
+        try:
+            await test(hass)
+        finally:
+            await hass.async_stop(force=True)
+
+    asyncio.run(_main())
+
+
+def test_torn_tail_is_dropped_and_repaired(tmp_path):
+    path = tmp_path / "journal"
+    path.write_bytes(_line(1) + _line(2) + _line(3)[:20])
+    ops, last_seq, damaged = _read_lines(str(path), 0)
+    assert [op["n"] for op in ops] == [1, 2]
+    assert last_seq == 2
+    assert damaged
+
+    assert _rewrite_after(str(path), 0) == 2
+    assert path.read_bytes() == _line(1) + _line(2)
+    assert _read_lines(str(path), 0)[2] is False
+
+
+def test_corrupt_line_is_dropped(tmp_path):
+    path = tmp_path / "journal"
+    path.write_bytes(_line(1) + b'{"op":"event","n":\n' + _line(3))
+    ops, last_seq, damaged = _read_lines(str(path), 0)
+    assert [op["n"] for op in ops] == [1, 3]
+    assert last_seq == 3
+    assert damaged
+
+
+def test_operations_up_to_the_snapshot_are_skipped(tmp_path):
+    path = tmp_path / "journal"
+    path.write_bytes(_line(1) + _line(2) + _line(3))
+    ops, last_seq, damaged = _read_lines(str(path), 2)
+    assert [op["n"] for op in ops] == [3]
+    assert last_seq == 3
+    assert not damaged
+
+    assert _rewrite_after(str(path), 3) == 0
+    assert not path.exists()
+
+
+def test_missing_journal_is_empty(tmp_path):
+    assert _read_lines(str(tmp_path / "journal"), 5) == ([], 5, False)
+
+
+def test_append_after_repair(tmp_path):
+    path = tmp_path / "journal"
+    path.write_bytes(_line(1) + _line(2) + b'{"op":"ev')
+
+    async def test(hass: HomeAssistant) -> None:
+        journal = HistoryJournal(hass, str(path))
+        ops = await journal.async_replay(0)
+        assert [op["n"] for op in ops] == [1, 2]
+        journal.append({"op": "event", "id": ENTITY, "t": 1_700_000_100, "c": 2})
+        await journal.async_flush()
+        assert journal.seq == 3
+        assert journal.lines == 3
+
+    _run(tmp_path, test)
+    ops, last_seq, damaged = _read_lines(str(path), 0)
+    assert [op["n"] for op in ops] == [1, 2, 3]
+    assert ops[-1]["c"] == 2
+    assert not damaged
+
+
+def test_snapshot_and_journal_replay(tmp_path):
+    now = int(time.time())
+    journal_path = os.path.join(tmp_path, ".storage", "medication_reminder_history.journal")
+
+    async def write(hass: HomeAssistant) -> None:
+        backend = MemoryHistoryBackend(hass, journal=True)
+        await backend.async_load()
+        await backend.async_record_many([(ENTITY, "Taken", _iso(now - 7200)), (ENTITY, "Skipped", _iso(now - 3600))])
+        # Compaction writes the snapshot at seq 2 and empties the journal
+        await backend.async_flush()
+        await backend.async_record_many([(ENTITY, "Taken", _iso(now))])
+        await backend._journal.async_flush()
+
+    _run(tmp_path, write)
+    with open(journal_path, "rb") as fh:
+        tail = fh.read()
+    assert [json.loads(line)["n"] for line in tail.splitlines()] == [3]
+    # A crash between the snapshot save and the journal truncation leaves lines the
+    # snapshot already contains; a crash mid-append leaves a torn last line
+    stale = b"".join(_line(seq, now - 7200) for seq in (1, 2))
+    with open(journal_path, "wb") as fh:
+        fh.write(stale + tail + b'{"op":"event","id"')
+
+    async def read(hass: HomeAssistant) -> None:
+        backend = MemoryHistoryBackend(hass, journal=True)
+        await backend.async_load()
+        ts, codes = await backend.async_event_chunk(ENTITY, None, None, 0, 100)
+        assert ts == [now - 7200, now - 3600, now]
+        assert codes == bytes([1, 2, 1])
+        assert backend._journal.seq == 3
+
+    _run(tmp_path, read)
+    with open(journal_path, "rb") as fh:
+        assert fh.read() == tail
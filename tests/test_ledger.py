@@ -0,0 +1,211 @@
+"""Dose-slot matching, closing and the ledger's journal across restarts."""
+from __future__ import annotations
+
+import json
+import os
+from datetime import date
+
+import pytest
+from homeassistant.core import HomeAssistant
+from homeassistant.util import dt as dt_util
+
+from custom_components.medication_reminder import ledger
+from custom_components.medication_reminder.const import (
+    CODE_SKIPPED,
+    CODE_SNOOZED,
+    CODE_TAKEN,
+    DOSE_LEDGER_STORE_KEY,
+    SLOT_LATE,
+    SLOT_MISSED,
+    SLOT_ON_TIME,
+    SLOT_PENDING,
+    SLOT_SKIPPED,
+)
+from custom_components.medication_reminder.ledger import ON_TIME, TOLERANCE, DoseLedger, DoseSlots, _instant
+
+from .test_journal import _run
+
+ENTITY = "sensor.medication_aspirin"
+DAY = date(2024, 3, 1).toordinal()
+TIMES = ["08:00", "20:00"]
+
+
+def _slots(days: int = 1) -> DoseSlots:
+    """Slots of ``TIMES`` for ``days`` days from local midnight of ``DAY``."""
+    start = _instant(DAY, "00:00")
+    slots = DoseSlots(since=start, until=start)
+    slots.extend(TIMES, _instant(DAY + days, "00:00"))
+    return slots
+
+
+def test_extend_generates_each_dose_once():
+    slots = _slots(2)
+    expected = [_instant(day, t) for day in (DAY, DAY + 1) for t in TIMES]
+    assert slots.ts.tolist() == expected
+    assert bytes(slots.status) == bytes([SLOT_PENDING] * 4)
+    # Extending to an earlier or the same instant adds nothing
+    slots.extend(TIMES, _instant(DAY + 1, "12:00"))
+    assert len(slots) == 4
+
+
+def test_match_within_tolerance_sets_on_time_late_and_skipped():
+    slots = _slots(2)
+    morning, evening = _instant(DAY, "08:00"), _instant(DAY, "20:00")
+    assert slots.match(morning + ON_TIME, CODE_TAKEN)
+    assert slots.match(evening + ON_TIME + 1, CODE_TAKEN)
+    assert slots.match(_instant(DAY + 1, "08:00") - TOLERANCE, CODE_SKIPPED)
+    assert list(slots.status) == [SLOT_ON_TIME, SLOT_LATE, SLOT_SKIPPED, SLOT_PENDING]
+    assert slots.delay.tolist() == [ON_TIME, ON_TIME + 1, 0, 0]
+
+
+def test_taking_early_is_on_time():
+    slots = _slots()
+    assert slots.match(_instant(DAY, "07:00"), CODE_TAKEN)
+    assert slots.status[0] == SLOT_ON_TIME
+    assert slots.delay[0] == -3600
+
+
+def test_event_outside_tolerance_only_counts_as_extra():
+    slots = _slots()
+    assert not slots.match(_instant(DAY, "08:00") + TOLERANCE + 1, CODE_TAKEN)
+    assert slots.extra == 1
+    # Events from before the ledger started are not extra
+    assert not slots.match(slots.since - 1, CODE_TAKEN)
+    assert slots.extra == 1
+    assert slots.counts(None, None)["pending"] == 2
+
+
+def test_match_fills_the_nearest_open_slot():
+    slots = DoseSlots(since=_instant(DAY, "00:00"), until=_instant(DAY, "00:00"))
+    slots.extend(["08:00", "09:00"], _instant(DAY + 1, "00:00"))
+    assert slots.match(_instant(DAY, "08:40"), CODE_TAKEN)
+    assert list(slots.status) == [SLOT_PENDING, SLOT_ON_TIME]
+    # A second tap falls back to the other slot still open within the tolerance
+    assert slots.match(_instant(DAY, "08:45"), CODE_TAKEN)
+    assert list(slots.status) == [SLOT_LATE, SLOT_ON_TIME]
+    assert not slots.match(_instant(DAY, "08:50"), CODE_TAKEN)
+    assert slots.extra == 1
+
+
+def test_close_marks_missed_once_the_window_has_passed():
+    slots = _slots()
+    morning = _instant(DAY, "08:00")
+    assert not slots.close(morning + TOLERANCE - 1)
+    assert slots.status[0] == SLOT_PENDING
+    assert slots.close(morning + TOLERANCE)
+    assert list(slots.status) == [SLOT_MISSED, SLOT_PENDING]
+    assert slots.next_close() == _instant(DAY, "20:00") + TOLERANCE
+    # A backdated event still fills the missed slot
+    assert slots.match(morning + 3600, CODE_TAKEN)
+    assert slots.status[0] == SLOT_LATE
+    assert not slots.close(morning + TOLERANCE + 60)
+
+
+def test_drop_future_keeps_matched_slots():
+    slots = _slots(2)
+    tomorrow = _instant(DAY + 1, "08:00")
+    slots.match(tomorrow - 1800, CODE_TAKEN)
+    slots.drop_future(_instant(DAY, "12:00"))
+    assert slots.ts.tolist() == [_instant(DAY, "08:00"), tomorrow]
+    assert slots.until == tomorrow + 1
+
+
+class _Clock:
+    """Stands in for the wall clock the ledger reads; its timer is never armed."""
+
+    def __init__(self, monkeypatch: pytest.MonkeyPatch, now: int) -> None:
+        self.now = now
+        monkeypatch.setattr(ledger.dt_util, "utcnow", lambda: dt_util.utc_from_timestamp(self.now))
+        monkeypatch.setattr(ledger, "async_track_point_in_utc_time", lambda *args: lambda: None)
+
+
+def _session(tmp_path, test) -> None:
+    async def _main(hass: HomeAssistant) -> None:
+        led = DoseLedger(hass, lambda changed: None)
+        await test(led)
+        await led.async_unload()
+
+    _run(tmp_path, _main)
+
+
+def test_doses_due_while_stopped_are_missed(tmp_path, monkeypatch):
+    clock = _Clock(monkeypatch, _instant(DAY, "07:00"))
+
+    async def first(led: DoseLedger) -> None:
+        led.set_times(ENTITY, TIMES)
+        await led.async_load()
+        led.match([(ENTITY, _instant(DAY, "08:10"), CODE_TAKEN), (ENTITY, _instant(DAY, "08:20"), CODE_SNOOZED)])
+
+    _session(tmp_path, first)
+    # Stopped from 07:00 until two days later at 12:00
+    clock.now = _instant(DAY + 2, "12:00")
+    counts = {}
+
+    async def second(led: DoseLedger) -> None:
+        await led.async_load()
+        # Set up after the load, with unchanged dose times
+        led.set_times(ENTITY, TIMES)
+        counts.update(led.get(ENTITY).counts(None, clock.now))
+
+    _session(tmp_path, second)
+    # 08:00 taken; 20:00, the next day's two and 08:00 today missed
+    assert counts == {"on_time": 1, "late": 0, "skipped": 0, "missed": 4, "pending": 0}
+
+
+def test_journal_replay_matches_the_live_ledger(tmp_path, monkeypatch):
+    clock = _Clock(monkeypatch, _instant(DAY, "07:00"))
+    live = {}
+
+    async def first(led: DoseLedger) -> None:
+        led.set_times(ENTITY, TIMES)
+        await led.async_load()
+        led.match([(ENTITY, _instant(DAY, "09:00"), CODE_TAKEN)])
+        clock.now = _instant(DAY, "12:00")
+        led.set_times(ENTITY, ["12:30"])
+        led.match([(ENTITY, _instant(DAY, "12:30"), CODE_SKIPPED)])
+        # Closing slots is derived from the clock and never written
+        lines = led.stats()["journal_lines"]
+        led._handle_timer(dt_util.utc_from_timestamp(clock.now + TOLERANCE))
+        assert led.stats()["journal_lines"] == lines == 4
+        slots = led.get(ENTITY)
+        live.update(ts=slots.ts.tolist(), status=list(slots.status), delay=slots.delay.tolist())
+
+    _session(tmp_path, first)
+    storage = os.path.join(tmp_path, ".storage")
+    assert os.listdir(storage) == [f"{DOSE_LEDGER_STORE_KEY}.journal"]
+
+    async def second(led: DoseLedger) -> None:
+        led.set_times(ENTITY, ["12:30"])
+        await led.async_load()
+        slots = led.get(ENTITY)
+        assert slots.ts.tolist() == live["ts"]
+        assert list(slots.status) == live["status"]
+        assert slots.delay.tolist() == live["delay"]
+
+    _session(tmp_path, second)
+
+
+def test_compaction_writes_a_snapshot_and_empties_the_journal(tmp_path, monkeypatch):
+    clock = _Clock(monkeypatch, _instant(DAY, "07:00"))
+    monkeypatch.setattr(ledger, "JOURNAL_COMPACT_LINES", 3)
+
+    async def first(led: DoseLedger) -> None:
+        led.set_times(ENTITY, TIMES)
+        await led.async_load()
+        led.match([(ENTITY, _instant(DAY, "08:00"), CODE_TAKEN), (ENTITY, _instant(DAY, "20:00"), CODE_TAKEN)])
+
+    _session(tmp_path, first)
+    storage = os.path.join(tmp_path, ".storage")
+    assert os.listdir(storage) == [DOSE_LEDGER_STORE_KEY]
+    with open(os.path.join(storage, DOSE_LEDGER_STORE_KEY), encoding="utf-8") as fh:
+        data = json.load(fh)["data"]
+    assert data["journal_seq"] == 3
+    assert data["times"] == {ENTITY: TIMES}
+
+    clock.now = _instant(DAY, "21:00")
+
+    async def second(led: DoseLedger) -> None:
+        await led.async_load()
+        assert led.get(ENTITY).counts(None, clock.now)["on_time"] == 2
+
+    _session(tmp_path, second)
@@ -0,0 +1,71 @@
+"""Migration of history files written by the v1 (event dict) format."""
+from __future__ import annotations
+
+import json
+import os
+from datetime import date
+
+from homeassistant.core import HomeAssistant
+
+from custom_components.medication_reminder.const import HISTORY_STORE_KEY, HISTORY_STORE_VERSION
+from custom_components.medication_reminder.history import MemoryHistoryBackend
+from custom_components.medication_reminder.storage_migration import migrate_history_v1
+
+from .test_journal import _run
+
+ENTITY = "sensor.medication_aspirin"
+DAY = date(2024, 3, 1).toordinal()
+
+# A history file as the v1 integration wrote it: one status/timestamp dict per event, no rollups
+V1_DATA = {
+    "events": {
+        ENTITY: [
+            {"status": "Taken", "timestamp": "2024-03-02T08:05:00+00:00"},
+            {"status": "Taken", "timestamp": "2024-03-01T08:00:00+00:00"},
+            {"status": "Skipped", "timestamp": "2024-03-01T20:00:00+00:00"},
+            {"status": "Snoozed", "timestamp": "2024-03-02T20:00:00+00:00"},
+            {"status": "Taken", "timestamp": "not a time"},
+            {"timestamp": "2024-03-02T21:00:00+00:00"},
+        ],
+        "sensor.medication_empty": [],
+    },
+    "refill": {ENTITY: {"remaining": 10, "threshold": 2, "units_per_intake": 1, "alerted": False}},
+}
+
+
+def test_migrate_history_v1_converts_events_and_seeds_rollups():
+    migrated = migrate_history_v1(V1_DATA)
+    events = migrated["events"][ENTITY]
+    assert events["ts"] == [1709280000, 1709323200, 1709366700, 1709409600]
+    assert events["codes"] == "1213"
+    assert migrated["events"]["sensor.medication_empty"] == {"ts": [], "codes": ""}
+    assert migrated["rollups"][ENTITY] == {
+        date.fromordinal(DAY).isoformat(): [1, 1, 0, -1],
+        date.fromordinal(DAY + 1).isoformat(): [1, 0, 1, -1],
+    }
+    assert migrated["refill"] == V1_DATA["refill"]
+
+
+def test_v1_history_file_loads_and_saves_as_v2(tmp_path):
+    path = os.path.join(tmp_path, ".storage", HISTORY_STORE_KEY)
+    os.makedirs(os.path.dirname(path))
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump({"version": 1, "minor_version": 1, "key": HISTORY_STORE_KEY, "data": V1_DATA}, fh)
+
+    async def load(hass: HomeAssistant) -> None:
+        backend = MemoryHistoryBackend(hass, save_delay=0)
+        await backend.async_load()
+        ts, codes = await backend.async_event_chunk(ENTITY, None, None, 0, 100)
+        assert ts == [1709280000, 1709323200, 1709366700, 1709409600]
+        assert codes == bytes([1, 2, 1, 3])
+        counts = await backend.async_period_counts(ENTITY, DAY, DAY + 1)
+        assert counts == {"taken": 2, "skipped": 1, "snoozed": 1, "expected": 0}
+        assert backend.refill[ENTITY]["remaining"] == 10
+        await backend.async_set_refill(ENTITY, {**backend.refill[ENTITY], "remaining": 9})
+
+    _run(tmp_path, load)
+    with open(path, encoding="utf-8") as fh:
+        stored = json.load(fh)
+    assert stored["version"] == HISTORY_STORE_VERSION
+    assert stored["data"]["events"][ENTITY]["codes"] == "1213"
+    assert stored["data"]["refill"][ENTITY]["remaining"] == 9
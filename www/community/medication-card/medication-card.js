@@ -1,19 +1,33 @@
+import { medicationStore, patchChildren } from '../medication-store/medication-store.js';
+
 class MedicationCard extends HTMLElement {
   setConfig(config) {
     if (!config || !Array.isArray(config.entities) || config.entities.length === 0) {
       throw new Error("entities is required and must be a non-empty array");
     }
     this.config = config;
+    this._list = null;
+    if (medicationStore.ready) this._render();
   }
 
   set hass(hass) {
     this._hass = hass;
-    this._render();
+    medicationStore.setHass(hass);
   }
 
-  _render() {
-    if (!this._hass || !this.config) return;
+  connectedCallback() {
+    this._unsub = medicationStore.subscribe((changed) => {
+      if (changed && !this.config?.entities.some(e => changed.has(e))) return;
+      this._render();
+    });
+  }
+
+  disconnectedCallback() {
+    if (this._unsub) this._unsub();
+    this._unsub = null;
+  }
 
+  _build() {
     const card = document.createElement('ha-card');
     card.header = this.config.title || 'Medications';
 
@@ -21,10 +35,21 @@ class MedicationCard extends HTMLElement {
     list.style.listStyle = 'none';
     list.style.padding = '0 16px 16px 16px';
 
-    for (const entity of this.config.entities) {
-      const stateObj = this._hass.states[entity];
-      if (!stateObj) continue;
+    this.innerHTML = '';
+    card.appendChild(list);
+    this.appendChild(card);
+    this._list = list;
+  }
+
+  _render() {
+    if (!this.config) return;
+    if (!this._list) this._build();
+
+    const rows = this.config.entities
+      .map(entity => ({ entity, med: medicationStore.get(entity) }))
+      .filter(row => row.med);
 
+    patchChildren(this._list, rows, row => row.entity, row => `${row.med.name}|${row.med.state}`, ({ entity, med }) => {
       const li = document.createElement('li');
       li.style.display = 'flex';
       li.style.alignItems = 'center';
@@ -32,7 +57,7 @@ class MedicationCard extends HTMLElement {
       li.style.margin = '6px 0';
 
       const left = document.createElement('div');
-      left.textContent = `${stateObj.attributes.friendly_name || entity} - ${stateObj.state}`;
+      left.textContent = `${med.name || entity} - ${med.state}`;
       li.appendChild(left);
 
       const right = document.createElement('div');
@@ -50,19 +75,12 @@ class MedicationCard extends HTMLElement {
       right.appendChild(mkBtn('Snooze', 'mark_snoozed'));
       right.appendChild(mkBtn('Dismiss', 'mark_skipped'));
       li.appendChild(right);
-
-      list.appendChild(li);
-    }
-
-    // Clear and append
-    this.innerHTML = '';
-    card.appendChild(list);
-    this.appendChild(card);
+      return li;
+    });
   }
 
   _action(entity, service) {
-    if (!this._hass) return;
-    this._hass.callService('medication_reminder', service, { entity_id: entity });
+    medicationStore.callService(service, entity);
   }
 
   getCardSize() {
@@ -1,60 +1,95 @@
+import { medicationStore, patchChildren } from '../medication-store/medication-store.js';
+
 class MedicationDailyCard extends HTMLElement {
   setConfig(config) {
     if (!config || !Array.isArray(config.entities) || config.entities.length === 0) {
       throw new Error('entities is required and must be a non-empty array');
     }
     this.config = config;
+    this._container = null;
+    if (medicationStore.ready) this._render();
   }
 
   set hass(hass) {
     this._hass = hass;
-    this._render();
+    medicationStore.setHass(hass);
   }
 
-  _render() {
-    if (!this._hass || !this.config) return;
+  connectedCallback() {
+    this._unsub = medicationStore.subscribe((changed) => {
+      if (changed && !this.config?.entities.some(e => changed.has(e))) return;
+      this._render();
+    });
+    // Slots move from upcoming to missed as time passes; unchanged sections are left alone
+    this._timer = setInterval(() => this._render(), 60000);
+  }
+
+  disconnectedCallback() {
+    if (this._unsub) this._unsub();
+    this._unsub = null;
+    clearInterval(this._timer);
+  }
+
+  _build() {
     const card = document.createElement('ha-card');
     card.header = this.config.title || 'Today\'s Medications';
     const container = document.createElement('div');
     container.style.padding = '0 16px 16px 16px';
 
+    this.innerHTML = '';
+    card.appendChild(container);
+    this.appendChild(card);
+    this._container = container;
+  }
+
+  _summarize(entity, med, now) {
+    const startOfDay = new Date(now);
+    startOfDay.setHours(0, 0, 0, 0);
+    const times = med.times || [];
+    const events = (med.events || []).filter(e => new Date(e.timestamp || 0) >= startOfDay);
+    const takenToday = events.filter(e => (e.status || '').toLowerCase().startsWith('take')).length;
+    const skippedToday = events.filter(e => (e.status || '').toLowerCase().startsWith('skip')).length;
+
+    // Build today time slots
+    const slots = times.map(t => {
+      const [hh, mm] = String(t).split(':').map(x => parseInt(x, 10));
+      const d = new Date(now);
+      d.setHours(hh, mm, 0, 0);
+      return { label: t, date: d };
+    }).sort((a, b) => a.date - b.date);
+
+    const pastSlots = slots.filter(s => s.date <= now);
+    const futureSlots = slots.filter(s => s.date > now);
+    const missedCount = Math.max(0, pastSlots.length - takenToday - skippedToday);
+    return {
+      entity,
+      name: med.name || entity,
+      summary: `Taken ${takenToday}/${slots.length}, Skipped ${skippedToday}, Missed ${missedCount}`,
+      upcoming: futureSlots.map(s => s.label),
+      missed: pastSlots.slice(-missedCount).map(s => s.label),
+    };
+  }
+
+  _render() {
+    if (!this.config) return;
+    if (!this._container) this._build();
+
     const now = new Date();
-    const todayStr = now.toISOString().slice(0, 10);
-
-    for (const entity of this.config.entities) {
-      const st = this._hass.states[entity];
-      if (!st) continue;
-      const name = st.attributes.friendly_name || entity;
-      const times = st.attributes.times || [];
-      const adherenceId = entity + '_adherence';
-      const adh = this._hass.states[adherenceId];
-      const events = (adh?.attributes?.recent_events || []).filter(e => (e.timestamp || '').startsWith(todayStr));
-      const takenToday = events.filter(e => (e.status || '').toLowerCase().startsWith('take')).length;
-      const skippedToday = events.filter(e => (e.status || '').toLowerCase().startsWith('skip')).length;
-
-      // Build today time slots
-      const slots = times.map(t => {
-        const [hh, mm] = String(t).split(':').map(x => parseInt(x, 10));
-        const d = new Date(now);
-        d.setHours(hh, mm, 0, 0);
-        return { label: t, date: d };
-      }).sort((a, b) => a.date - b.date);
-
-      const pastSlots = slots.filter(s => s.date <= now);
-      const futureSlots = slots.filter(s => s.date > now);
-      const missedCount = Math.max(0, pastSlots.length - takenToday - skippedToday);
-      const missedSlots = pastSlots.slice(-missedCount).map(s => s.label);
-      const upcoming = futureSlots.map(s => s.label);
+    const items = this.config.entities
+      .map(entity => [entity, medicationStore.get(entity)])
+      .filter(([, med]) => med)
+      .map(([entity, med]) => this._summarize(entity, med, now));
 
+    patchChildren(this._container, items, it => it.entity, it => JSON.stringify(it), it => {
       const section = document.createElement('div');
       section.style.margin = '12px 0';
       const title = document.createElement('div');
       title.style.fontWeight = '600';
-      title.textContent = name;
+      title.textContent = it.name;
       section.appendChild(title);
 
       const summary = document.createElement('div');
-      summary.textContent = `Taken ${takenToday}/${slots.length}, Skipped ${skippedToday}, Missed ${missedCount}`;
+      summary.textContent = it.summary;
       summary.style.margin = '4px 0 8px 0';
       section.appendChild(summary);
 
@@ -78,9 +113,9 @@ class MedicationDailyCard extends HTMLElement {
           li.textContent = 'None';
           ul.appendChild(li);
         } else {
-          for (const it of items) {
+          for (const item of items) {
             const li = document.createElement('li');
-            li.textContent = it;
+            li.textContent = item;
             ul.appendChild(li);
           }
         }
@@ -88,15 +123,11 @@ class MedicationDailyCard extends HTMLElement {
         return d;
       };
 
-      lists.appendChild(mkList('Upcoming', upcoming));
-      lists.appendChild(mkList('Missed', missedSlots));
+      lists.appendChild(mkList('Upcoming', it.upcoming));
+      lists.appendChild(mkList('Missed', it.missed));
       section.appendChild(lists);
-      container.appendChild(section);
-    }
-
-    this.innerHTML = '';
-    card.appendChild(container);
-    this.appendChild(card);
+      return section;
+    });
   }
 
   getCardSize() {
@@ -1,66 +1,110 @@
+import { medicationStore, patchChildren } from '../medication-store/medication-store.js';
+
 class MedicationHistoryCard extends HTMLElement {
   setConfig(config) {
     if (!config || !Array.isArray(config.entities) || config.entities.length === 0) {
       throw new Error("entities is required and must be a non-empty array");
     }
     this.config = config;
+    this._container = null;
+    if (medicationStore.ready) this._render(null);
   }
 
   set hass(hass) {
     this._hass = hass;
-    this._render();
+    medicationStore.setHass(hass);
+  }
+
+  connectedCallback() {
+    this._unsub = medicationStore.subscribe((changed) => this._render(changed));
+  }
+
+  disconnectedCallback() {
+    if (this._unsub) this._unsub();
+    this._unsub = null;
+  }
+
+  _medicationId(entity) {
+    const st = this._hass?.states[entity];
+    return st?.attributes?.medication_entity_id || entity.replace(/_adherence$/, '');
   }
 
-  _render() {
-    if (!this._hass || !this.config) return;
+  _build() {
     const card = document.createElement('ha-card');
     card.header = this.config.title || 'Medication History';
 
     const container = document.createElement('div');
     container.style.padding = '0 16px 16px 16px';
 
-    for (const entity of this.config.entities) {
-      const st = this._hass.states[entity];
-      if (!st) continue;
-      const name = st.attributes.friendly_name || entity;
-      const percent = st.state;
-      const recent = st.attributes.recent_events || [];
-
-      const section = document.createElement('div');
-      section.style.margin = '12px 0';
-
-      const title = document.createElement('div');
-      title.style.fontWeight = '600';
-      title.textContent = `${name} — ${percent}${st.attributes.unit_of_measurement || ''}`;
-      section.appendChild(title);
-
-      const stats = document.createElement('div');
-      const t = st.attributes.taken_7d || 0;
-      const s = st.attributes.skipped_7d || 0;
-      const z = st.attributes.snoozed_7d || 0;
-      const e = st.attributes.expected_7d || 0;
-      stats.textContent = `Last 7d: taken ${t}/${e}, skipped ${s}, snoozed ${z}`;
-      stats.style.margin = '4px 0 8px 0';
-      section.appendChild(stats);
-
-      const table = document.createElement('table');
-      table.style.width = '100%';
-      table.style.borderCollapse = 'collapse';
-      const thead = document.createElement('thead');
-      const trh = document.createElement('tr');
-      for (const h of ['When', 'Status']) {
-        const th = document.createElement('th');
-        th.textContent = h;
-        th.style.textAlign = 'left';
-        th.style.borderBottom = '1px solid var(--divider-color)';
-        th.style.padding = '4px 8px';
-        trh.appendChild(th);
-      }
-      thead.appendChild(trh);
-      table.appendChild(thead);
-      const tbody = document.createElement('tbody');
-      const rows = recent.slice().reverse().slice(0, this.config.max_events || 10);
-      for (const ev of rows) {
+    this.innerHTML = '';
+    card.appendChild(container);
+    this.appendChild(card);
+    this._container = container;
+  }
+
+  _buildSection() {
+    const section = document.createElement('div');
+    section.style.margin = '12px 0';
+
+    const title = document.createElement('div');
+    title.style.fontWeight = '600';
+    section.appendChild(title);
+
+    const stats = document.createElement('div');
+    stats.style.margin = '4px 0 8px 0';
+    section.appendChild(stats);
+
+    const table = document.createElement('table');
+    table.style.width = '100%';
+    table.style.borderCollapse = 'collapse';
+    const thead = document.createElement('thead');
+    const trh = document.createElement('tr');
+    for (const h of ['When', 'Status']) {
+      const th = document.createElement('th');
+      th.textContent = h;
+      th.style.textAlign = 'left';
+      th.style.borderBottom = '1px solid var(--divider-color)';
+      th.style.padding = '4px 8px';
+      trh.appendChild(th);
+    }
+    thead.appendChild(trh);
+    table.appendChild(thead);
+    const tbody = document.createElement('tbody');
+    table.appendChild(tbody);
+    section.appendChild(table);
+
+    section._title = title;
+    section._stats = stats;
+    section._tbody = tbody;
+    return section;
+  }
+
+  _render(changed) {
+    if (!this.config) return;
+    if (!this._container) {
+      this._build();
+      changed = null;
+    }
+    const rows = this.config.entities
+      .map(entity => ({ entity, id: this._medicationId(entity) }))
+      .map(row => ({ ...row, med: medicationStore.get(row.id) }))
+      .filter(row => row.med);
+
+    // Sections are keyed per medication and only their contents are patched
+    patchChildren(this._container, rows, row => row.entity, () => '', () => this._buildSection());
+
+    for (const [i, { id, med }] of rows.entries()) {
+      if (changed && !changed.has(id)) continue;
+      const section = this._container.children[i];
+      const w = med.periods?.weekly || {};
+      const t = w.taken || 0;
+      const e = w.expected || 0;
+      const percent = e ? Math.round(t / e * 100) : 0;
+      section._title.textContent = `${med.name || id} — ${percent}%`;
+      section._stats.textContent = `Last 7d: taken ${t}/${e}, skipped ${w.skipped || 0}, snoozed ${w.snoozed || 0}`;
+
+      const events = (med.events || []).slice(0, this.config.max_events || 10);
+      patchChildren(section._tbody, events, ev => `${ev.timestamp}|${ev.status}`, () => '', ev => {
         const tr = document.createElement('tr');
         const td1 = document.createElement('td');
         const td2 = document.createElement('td');
@@ -70,17 +114,9 @@ class MedicationHistoryCard extends HTMLElement {
         td2.textContent = ev.status || '';
         tr.appendChild(td1);
         tr.appendChild(td2);
-        tbody.appendChild(tr);
-      }
-      table.appendChild(tbody);
-
-      section.appendChild(table);
-      container.appendChild(section);
+        return tr;
+      });
     }
-
-    this.innerHTML = '';
-    card.appendChild(container);
-    this.appendChild(card);
   }
 
   getCardSize() {
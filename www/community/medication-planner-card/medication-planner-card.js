@@ -1,23 +1,72 @@
+import { medicationStore, patchChildren } from '../medication-store/medication-store.js';
+
 class MedicationPlannerCard extends HTMLElement {
   setConfig(config) {
     if (!config || !Array.isArray(config.entities) || config.entities.length === 0) {
       throw new Error('entities is required and must be a non-empty array');
     }
     this.config = config;
+    this._container = null;
+    if (medicationStore.ready) this._render();
   }
 
   set hass(hass) {
     this._hass = hass;
-    this._render();
+    medicationStore.setHass(hass);
   }
 
-  _render() {
-    if (!this._hass || !this.config) return;
+  connectedCallback() {
+    this._unsub = medicationStore.subscribe((changed) => {
+      if (changed && !this.config?.entities.some(e => changed.has(e))) return;
+      this._render();
+    });
+    // Picks up the day rollover; unchanged tables are left alone
+    this._timer = setInterval(() => this._render(), 60000);
+  }
+
+  disconnectedCallback() {
+    if (this._unsub) this._unsub();
+    this._unsub = null;
+    clearInterval(this._timer);
+  }
+
+  _build() {
     const card = document.createElement('ha-card');
     card.header = this.config.title || 'Medication Planner (7 days)';
     const container = document.createElement('div');
     container.style.padding = '0 16px 16px 16px';
 
+    this.innerHTML = '';
+    card.appendChild(container);
+    this.appendChild(card);
+    this._container = container;
+  }
+
+  _summarize(entity, med, days) {
+    const times = med.times || [];
+    const events = (med.events || []).map(ev => ({
+      ts: new Date(ev.timestamp || ev.time || 0),
+      status: (ev.status || '').toLowerCase()
+    }));
+    const cells = days.map(d => {
+      const start = new Date(d); start.setHours(0,0,0,0);
+      const end = new Date(d); end.setHours(23,59,59,999);
+      const dayEvents = events.filter(e => e.ts >= start && e.ts <= end);
+      const taken = dayEvents.filter(e => e.status.startsWith('take')).length;
+      const skipped = dayEvents.filter(e => e.status.startsWith('skip')).length;
+      const missed = Math.max(0, times.length - taken - skipped);
+      return {
+        label: d.toLocaleDateString(undefined, { weekday: 'short', month: 'numeric', day: 'numeric' }),
+        text: `${taken}/${times.length}${missed ? ` (missed ${missed})` : ''}`,
+      };
+    });
+    return { entity, name: med.name || entity, expected: times.length, cells };
+  }
+
+  _render() {
+    if (!this.config) return;
+    if (!this._container) this._build();
+
     const now = new Date();
     const days = [];
     for (let i = 6; i >= 0; i--) {
@@ -26,17 +75,12 @@ class MedicationPlannerCard extends HTMLElement {
       days.push(d);
     }
 
-    for (const entity of this.config.entities) {
-      const st = this._hass.states[entity];
-      if (!st) continue;
-      const name = st.attributes.friendly_name || entity;
-      const times = st.attributes.times || [];
-      const adh = this._hass.states[entity + '_adherence'];
-      const events = (adh?.attributes?.recent_events || []).map(ev => ({
-        ts: new Date(ev.timestamp || ev.time || 0),
-        status: (ev.status || '').toLowerCase()
-      }));
+    const items = this.config.entities
+      .map(entity => [entity, medicationStore.get(entity)])
+      .filter(([, med]) => med)
+      .map(([entity, med]) => this._summarize(entity, med, days));
 
+    patchChildren(this._container, items, it => it.entity, it => JSON.stringify(it), it => {
       const table = document.createElement('table');
       table.style.width = '100%';
       table.style.borderCollapse = 'collapse';
@@ -44,14 +88,14 @@ class MedicationPlannerCard extends HTMLElement {
       const thead = document.createElement('thead');
       const trh = document.createElement('tr');
       const thName = document.createElement('th');
-      thName.textContent = name;
+      thName.textContent = it.name;
       thName.style.textAlign = 'left';
       thName.style.padding = '4px 8px';
       thName.style.borderBottom = '1px solid var(--divider-color)';
       trh.appendChild(thName);
-      for (const d of days) {
+      for (const cell of it.cells) {
         const th = document.createElement('th');
-        th.textContent = d.toLocaleDateString(undefined, { weekday: 'short', month: 'numeric', day: 'numeric' });
+        th.textContent = cell.label;
         th.style.textAlign = 'center';
         th.style.padding = '4px 8px';
         th.style.borderBottom = '1px solid var(--divider-color)';
@@ -63,32 +107,21 @@ class MedicationPlannerCard extends HTMLElement {
       const tbody = document.createElement('tbody');
       const tr = document.createElement('tr');
       const tdLabel = document.createElement('td');
-      tdLabel.textContent = `Expected per day: ${times.length}`;
+      tdLabel.textContent = `Expected per day: ${it.expected}`;
       tdLabel.style.padding = '4px 8px';
       tr.appendChild(tdLabel);
 
-      for (const d of days) {
-        const start = new Date(d); start.setHours(0,0,0,0);
-        const end = new Date(d); end.setHours(23,59,59,999);
-        const dayEvents = events.filter(e => e.ts >= start && e.ts <= end);
-        const taken = dayEvents.filter(e => e.status.startsWith('take')).length;
-        const skipped = dayEvents.filter(e => e.status.startsWith('skip')).length;
-        const missed = Math.max(0, times.length - taken - skipped);
+      for (const cell of it.cells) {
         const td = document.createElement('td');
         td.style.textAlign = 'center';
         td.style.padding = '4px 8px';
-        td.textContent = `${taken}/${times.length}${missed ? ` (missed ${missed})` : ''}`;
+        td.textContent = cell.text;
         tr.appendChild(td);
       }
       tbody.appendChild(tr);
       table.appendChild(tbody);
-
-      container.appendChild(table);
-    }
-
-    this.innerHTML = '';
-    card.appendChild(container);
-    this.appendChild(card);
+      return table;
+    });
   }
 
   getCardSize() {
@@ -0,0 +1,141 @@
+// Shared client-side store for the Medication Reminder cards.
+//
+// One websocket subscription (medication_reminder/subscribe) is shared by
+// every card on the page. The backend sends a snapshot followed by deltas
+// only, and listeners are told which medications changed so that cards can
+// patch just those rows instead of rebuilding on every Home Assistant update.
+
+const EVENT_LIMIT = 1000;
+
+const eventKey = (ev) => `${ev.timestamp}|${ev.status}`;
+
+class MedicationStore {
+  constructor() {
+    this.medications = {};
+    this.ready = false;
+    this._hass = null;
+    this._connection = null;
+    this._unsub = null;
+    this._listeners = new Set();
+  }
+
+  // Called from every card's `set hass`; only (re)subscribes when the connection changes.
+  setHass(hass) {
+    this._hass = hass;
+    if (hass.connection !== this._connection) {
+      this._connection = hass.connection;
+      this._resubscribe();
+    }
+  }
+
+  get hass() {
+    return this._hass;
+  }
+
+  get(entityId) {
+    return this.medications[entityId];
+  }
+
+  // listener(changedEntityIds: Set<string> | null); null means "everything" (snapshot).
+  subscribe(listener) {
+    this._listeners.add(listener);
+    if (this._listeners.size === 1) this._resubscribe();
+    else if (this.ready) listener(null);
+    return () => {
+      this._listeners.delete(listener);
+      if (this._listeners.size === 0) this._close();
+    };
+  }
+
+  callService(service, entityId) {
+    return this._hass?.callService('medication_reminder', service, { entity_id: entityId });
+  }
+
+  _close() {
+    const unsub = this._unsub;
+    this._unsub = null;
+    this.ready = false;
+    if (unsub) unsub.then((fn) => fn()).catch(() => {});
+  }
+
+  _resubscribe() {
+    this._close();
+    if (!this._connection || this._listeners.size === 0) return;
+    this._unsub = this._connection.subscribeMessage(
+      (msg) => this._handle(msg),
+      { type: 'medication_reminder/subscribe' },
+    );
+    this._unsub.catch(() => {
+      this._unsub = null;
+    });
+  }
+
+  _handle(msg) {
+    if (msg.type === 'snapshot') {
+      this.medications = msg.medications || {};
+      this.ready = true;
+      this._emit(null);
+      return;
+    }
+    // Medications set up or removed after the snapshot
+    if (msg.type === 'added') {
+      this.medications[msg.entity_id] = msg.medication;
+      this._emit(null);
+      return;
+    }
+    if (msg.type === 'removed') {
+      delete this.medications[msg.entity_id];
+      this._emit(null);
+      return;
+    }
+    const med = this.medications[msg.entity_id];
+    if (!med) return;
+    if (msg.type === 'status') {
+      med.state = msg.state;
+      med.last_action = msg.last_action;
+    } else if (msg.type === 'events') {
+      // Events recorded during the snapshot can arrive twice; merge by key
+      const seen = new Set(med.events.map(eventKey));
+      const fresh = msg.events.filter((ev) => !seen.has(eventKey(ev)));
+      if (fresh.length === 0) return;
+      med.events = fresh.concat(med.events).slice(0, EVENT_LIMIT);
+    } else if (msg.type === 'stats') {
+      med.periods = msg.periods;
+    } else if (msg.type === 'refill') {
+      med.refill = msg.refill;
+    } else {
+      return;
+    }
+    this._emit(new Set([msg.entity_id]));
+  }
+
+  _emit(changed) {
+    for (const listener of this._listeners) listener(changed);
+  }
+}
+
+// One store per page, shared by all cards regardless of which file loaded first
+export const medicationStore = window.__medicationReminderStore || (window.__medicationReminderStore = new MedicationStore());
+
+// Keyed DOM diff: keeps one child per item, rebuilding a child only when its
+// signature changed and moving children only when the order changed.
+//   build(item) -> Element, sig(item) -> string
+export function patchChildren(parent, items, keyOf, sig, build) {
+  const existing = new Map();
+  for (const el of Array.from(parent.children)) existing.set(el.dataset.key, el);
+  items.forEach((item, i) => {
+    const key = String(keyOf(item));
+    const signature = sig(item);
+    let el = existing.get(key);
+    existing.delete(key);
+    if (!el || el.dataset.sig !== signature) {
+      const fresh = build(item);
+      fresh.dataset.key = key;
+      fresh.dataset.sig = signature;
+      if (el) el.replaceWith(fresh);
+      el = fresh;
+    }
+    if (parent.children[i] !== el) parent.insertBefore(el, parent.children[i] || null);
+  });
+  for (const el of existing.values()) el.remove();
+}
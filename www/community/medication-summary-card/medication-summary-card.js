@@ -1,24 +1,83 @@
+import { medicationStore, patchChildren } from '../medication-store/medication-store.js';
+
+const PERIODS = [['daily', 'Daily'], ['weekly', 'Weekly'], ['monthly', 'Monthly'], ['yearly', 'Yearly']];
+
 class MedicationSummaryCard extends HTMLElement {
   setConfig(config) {
     if (!config || !Array.isArray(config.entities) || config.entities.length === 0) {
       throw new Error('entities is required and must be a non-empty array');
     }
     this.config = config;
+    this._container = null;
+    if (medicationStore.ready) this._render(null);
   }
 
   set hass(hass) {
     this._hass = hass;
-    this._render();
+    medicationStore.setHass(hass);
+  }
+
+  connectedCallback() {
+    this._unsub = medicationStore.subscribe((changed) => this._render(changed));
+  }
+
+  disconnectedCallback() {
+    if (this._unsub) this._unsub();
+    this._unsub = null;
   }
 
-  _render() {
-    if (!this._hass || !this.config) return;
+  _build() {
     const card = document.createElement('ha-card');
     card.header = this.config.title || 'Medication Summary';
     const container = document.createElement('div');
     container.style.padding = '0 16px 16px 16px';
 
-    const mkRow = (title, d) => {
+    this.innerHTML = '';
+    card.appendChild(container);
+    this.appendChild(card);
+    this._container = container;
+  }
+
+  _buildSection() {
+    const section = document.createElement('div');
+    section.style.margin = '12px 0';
+    const title = document.createElement('div');
+    title.style.fontWeight = '600';
+    section.appendChild(title);
+
+    const table = document.createElement('table');
+    table.style.width = '100%';
+    table.style.borderCollapse = 'collapse';
+    const thead = document.createElement('thead');
+    const trh = document.createElement('tr');
+    for (const h of ['Period', 'Taken/Expected', 'Skipped', 'Missed', 'Adherence']) {
+      const th = document.createElement('th');
+      th.textContent = h;
+      th.style.textAlign = 'left';
+      th.style.borderBottom = '1px solid var(--divider-color)';
+      th.style.padding = '4px 8px';
+      trh.appendChild(th);
+    }
+    thead.appendChild(trh);
+    table.appendChild(thead);
+
+    const tbody = document.createElement('tbody');
+    table.appendChild(tbody);
+    section.appendChild(table);
+
+    section._title = title;
+    section._tbody = tbody;
+    return section;
+  }
+
+  _render(changed) {
+    if (!this.config) return;
+    if (!this._container) {
+      this._build();
+      changed = null;
+    }
+
+    const mkRow = ([, title, d]) => {
       const tr = document.createElement('tr');
       const td0 = document.createElement('td'); td0.textContent = title; tr.appendChild(td0);
       const td1 = document.createElement('td'); td1.textContent = `${d.taken || 0}/${d.expected || 0}`; tr.appendChild(td1);
@@ -29,54 +88,19 @@ class MedicationSummaryCard extends HTMLElement {
       return tr;
     };
 
-    for (const entity of this.config.entities) {
-      const st = this._hass.states[entity];
-      if (!st) continue;
-      const name = st.attributes.friendly_name || entity;
-      const statsId = entity + '_stats';
-      const s = this._hass.states[statsId];
-      const daily = s?.attributes?.daily || {};
-      const weekly = s?.attributes?.weekly || {};
-      const monthly = s?.attributes?.monthly || {};
-      const yearly = s?.attributes?.yearly || {};
-
-      const section = document.createElement('div');
-      section.style.margin = '12px 0';
-      const title = document.createElement('div');
-      title.style.fontWeight = '600';
-      title.textContent = name;
-      section.appendChild(title);
-
-      const table = document.createElement('table');
-      table.style.width = '100%';
-      table.style.borderCollapse = 'collapse';
-      const thead = document.createElement('thead');
-      const trh = document.createElement('tr');
-      for (const h of ['Period', 'Taken/Expected', 'Skipped', 'Missed', 'Adherence']) {
-        const th = document.createElement('th');
-        th.textContent = h;
-        th.style.textAlign = 'left';
-        th.style.borderBottom = '1px solid var(--divider-color)';
-        th.style.padding = '4px 8px';
-        trh.appendChild(th);
-      }
-      thead.appendChild(trh);
-      table.appendChild(thead);
-
-      const tbody = document.createElement('tbody');
-      tbody.appendChild(mkRow('Daily', daily));
-      tbody.appendChild(mkRow('Weekly', weekly));
-      tbody.appendChild(mkRow('Monthly', monthly));
-      tbody.appendChild(mkRow('Yearly', yearly));
-      table.appendChild(tbody);
-      section.appendChild(table);
-
-      container.appendChild(section);
-    }
+    const rows = this.config.entities
+      .map(entity => ({ entity, med: medicationStore.get(entity) }))
+      .filter(row => row.med);
+    patchChildren(this._container, rows, row => row.entity, () => '', () => this._buildSection());
 
-    this.innerHTML = '';
-    card.appendChild(container);
-    this.appendChild(card);
+    for (const [i, { entity, med }] of rows.entries()) {
+      if (changed && !changed.has(entity)) continue;
+      const section = this._container.children[i];
+      section._title.textContent = med.name || entity;
+      const periods = PERIODS.map(([key, title]) => [key, title, med.periods?.[key] || {}]);
+      // Only the period rows whose numbers changed are rebuilt
+      patchChildren(section._tbody, periods, ([key]) => key, ([, , d]) => JSON.stringify(d), mkRow);
+    }
   }
 
   getCardSize() {